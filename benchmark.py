@@ -0,0 +1,350 @@
+#!/usr/bin/python3
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import melee
+
+# Simple throughput benchmarks for libmelee's hot paths
+#   Run from the repository root so the test artifacts can be found
+
+
+def bench_replay(args):
+    """Frames per second through Console.step() on an SLP file"""
+    for path, allow_old_version in [
+        ("test_artifacts/test_game_1.slp", False),
+        ("test_artifacts/test_game_2.slp", True),
+    ]:
+        best = None
+        for _ in range(args.repeat):
+            console = melee.Console(
+                system="file", allow_old_version=allow_old_version, path=path
+            )
+            start = time.perf_counter()
+            console.connect()
+            frames = 0
+            while console.step() is not None:
+                frames += 1
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(
+            "%-32s %6d frames  %8.1f ms  %9.0f frames/sec"
+            % (path, frames, best * 1000, frames / best)
+        )
+
+
+def bench_columns(args):
+    """Frames per second through replay.read_columns() on an SLP file"""
+    for path, allow_old_version in [
+        ("test_artifacts/test_game_1.slp", False),
+        ("test_artifacts/test_game_2.slp", True),
+    ]:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            columns = melee.replay.read_columns(
+                path, allow_old_version=allow_old_version
+            )
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        frames = len(columns.frames)
+        print(
+            "%-32s %6d frames  %8.1f ms  %9.0f frames/sec"
+            % (path, frames, best * 1000, frames / best)
+        )
+
+
+class _FrameMessages:
+    """Stands in for a Slippstream connection, sending one message per frame
+
+    This is how Dolphin and Nintendont deliver events: every event of a frame, back to
+    back in one buffer"""
+
+    playedOn, timestamp, consoleNick, players = "", "", "", {}
+
+    def __init__(self, path):
+        streamer = melee.slpfilestreamer.SLPFileStreamer(path)
+        streamer.connect()
+        raw = bytes(streamer.raw)
+        self.messages = []
+        start = 0
+        for command, offset, size in streamer.events():
+            if command == melee.slpfilestreamer.EventType.FRAME_BOOKEND.value:
+                self.messages.append(raw[start : offset + size])
+                start = offset + size
+        self.messages.reverse()
+
+    def dispatch(self, polling_mode):
+        if not self.messages:
+            return None
+        return {"type": "game_event", "payload": self.messages.pop()}
+
+
+def bench_allocations(args):
+    """Memory allocated while decoding each frame, through both the file and network paths
+
+    Reports the mean (over frames) of the peak traced memory allocated while stepping
+    one frame, which is where copies of the event buffer and new GameStates show up"""
+    path = "test_artifacts/test_game_1.slp"
+    for source in ["file", "file+pool", "messages"]:
+        if source == "file":
+            console = melee.Console(system="file", path=path)
+            console.connect()
+        elif source == "file+pool":
+            console = melee.Console(system="file", path=path, gamestate_pool_size=4)
+            console.connect()
+        else:
+            console = melee.Console(system="gamecube")
+            console._slippstream = _FrameMessages(path)
+        frames, peaks = 0, 0
+        tracemalloc.start()
+        while True:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            if console.step() is None:
+                break
+            peaks += tracemalloc.get_traced_memory()[1] - before
+            frames += 1
+        tracemalloc.stop()
+        print(
+            "%-10s %-32s %6d frames  %8.0f bytes/frame peak allocation"
+            % (source, path, frames, peaks / frames)
+        )
+
+
+class _PipeConsole:
+    """Just enough of a Console to plug a Controller into a named pipe of our own"""
+
+    system = "dolphin"
+    logger = None
+
+    def __init__(self, pipe_path):
+        self.pipe_path = pipe_path
+        self.controllers = []
+
+    def get_dolphin_pipes_path(self, port):
+        return self.pipe_path
+
+    def setup_dolphin_controller(self, port, controllertype):
+        pass
+
+
+def bench_controller(args):
+    """Per-frame input latency through a named pipe, read by a stand-in for Dolphin
+
+    Each frame presses 8 inputs and flushes. Latency is from the first input of the frame
+    until the reader has seen that frame's FLUSH"""
+    frames = 2000
+    directory = tempfile.mkdtemp()
+    pipe_path = os.path.join(directory, "slippibot1")
+    os.mkfifo(pipe_path)
+    flushed = threading.Semaphore(0)
+    received = []
+
+    def reader():
+        with open(pipe_path, "r") as pipe:
+            for line in pipe:
+                if line == "FLUSH\n":
+                    received.append(time.perf_counter())
+                    flushed.release()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    controller = melee.Controller(_PipeConsole(pipe_path), 1)
+    controller.connect()
+    latencies = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        tilt = (frame % 10) / 10
+        controller.tilt_analog(melee.Button.BUTTON_MAIN, tilt, 0.5)
+        controller.tilt_analog(melee.Button.BUTTON_C, 0.5, tilt)
+        controller.press_shoulder(melee.Button.BUTTON_L, tilt)
+        controller.press_shoulder(melee.Button.BUTTON_R, 0)
+        controller.press_button(melee.Button.BUTTON_A)
+        controller.release_button(melee.Button.BUTTON_B)
+        controller.press_button(melee.Button.BUTTON_Y)
+        controller.release_button(melee.Button.BUTTON_Z)
+        controller.flush()
+        flushed.acquire()
+        latencies.append(received[-1] - start)
+    controller.disconnect()
+    thread.join()
+    os.remove(pipe_path)
+    os.rmdir(directory)
+    latencies.sort()
+    print(
+        "%-32s %6d frames  %8.1f us median  %8.1f us p99"
+        % (
+            "named pipe",
+            frames,
+            statistics.median(latencies) * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6,
+        )
+    )
+
+
+def bench_homes(args):
+    """Time to make the temporary home directories of Dolphin instances
+
+    Uses a stand-in User directory with 64 MB of caches and 32 MB of texture packs. Compares
+    copying the whole thing for every instance, against making each one from a
+    launcher.HomeTemplate"""
+    instances = 8
+    source = tempfile.mkdtemp()
+    home = os.path.join(source, "User")
+    for directory, files, size in [
+        ("Cache/Shaders", 128, 512 * 1024),
+        ("Load/Textures/GALE01", 64, 512 * 1024),
+        ("Wii/shared2", 32, 4 * 1024),
+        ("Config", 3, 2 * 1024),
+        ("GameSettings", 1, 16 * 1024),
+    ]:
+        os.makedirs(os.path.join(home, directory))
+        for index in range(files):
+            with open(
+                os.path.join(home, directory, "%d.bin" % index), "wb"
+            ) as datafile:
+                datafile.write(os.urandom(size))
+
+    for mode in ["copy", "template"]:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            template = None
+            if mode == "template":
+                template = melee.launcher.HomeTemplate(home)
+            consoles = [
+                melee.Console(dolphin_home_path=home, home_template=template)
+                for _ in range(instances)
+            ]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            for console in consoles:
+                console.stop()
+            if template is not None:
+                template.cleanup()
+        print(
+            "%-10s %3d instances  %8.1f ms  %8.1f ms/instance"
+            % (mode, instances, best * 1000, best * 1000 / instances)
+        )
+    shutil.rmtree(source)
+
+
+def bench_framedata(args):
+    """Time per call of each FrameData query, for both players of every frame of an SLP file
+
+    Needs the frame data (melee/framedata.csv) that comes with libmelee"""
+    start = time.perf_counter()
+    framedata = melee.FrameData()
+    print("%-24s %10.1f ms" % ("FrameData()", (time.perf_counter() - start) * 1000))
+
+    console = melee.Console(system="file", path="test_artifacts/test_game_1.slp")
+    console.connect()
+    frames = []
+    while True:
+        gamestate = console.step()
+        if gamestate is None:
+            break
+        players = list(gamestate.players.values())
+        for player, opponent in zip(players, players[::-1]):
+            frames.append((gamestate, player, opponent))
+
+    def action(query):
+        return lambda _, player, __: query(player.character, player.action)
+
+    def action_frame(query):
+        return lambda _, player, __: query(
+            player.character, player.action, player.action_frame
+        )
+
+    queries = [
+        ("is_attack", action(framedata.is_attack)),
+        ("is_grab", action(framedata.is_grab)),
+        ("is_roll", action(framedata.is_roll)),
+        ("is_bmove", action(framedata.is_bmove)),
+        ("first_hitbox_frame", action(framedata.first_hitbox_frame)),
+        ("last_hitbox_frame", action(framedata.last_hitbox_frame)),
+        ("hitbox_count", action(framedata.hitbox_count)),
+        ("iasa", action(framedata.iasa)),
+        ("frame_count", action(framedata.frame_count)),
+        ("last_roll_frame", action(framedata.last_roll_frame)),
+        ("attack_state", action_frame(framedata.attack_state)),
+        ("range_forward", action_frame(framedata.range_forward)),
+        ("range_backward", action_frame(framedata.range_backward)),
+        (
+            "in_range",
+            lambda gamestate, player, opponent: framedata.in_range(
+                player, opponent, gamestate.stage
+            ),
+        ),
+        (
+            "in_range_batch",
+            lambda gamestate, player, opponent: framedata.in_range_batch(
+                player, opponent, gamestate.stage
+            ),
+        ),
+        (
+            "roll_end_position",
+            lambda gamestate, player, _: framedata.roll_end_position(player, gamestate),
+        ),
+        (
+            "slide_distance",
+            lambda _, player, __: framedata.slide_distance(
+                player, player.speed_ground_x_self, 20
+            ),
+        ),
+        (
+            "project_hit_location",
+            lambda gamestate, player, _: framedata.project_hit_location(
+                player, gamestate
+            ),
+        ),
+        ("dj_height", lambda _, player, __: framedata.dj_height(player)),
+        (
+            "frames_until_dj_apex",
+            lambda _, player, __: framedata.frames_until_dj_apex(player),
+        ),
+    ]
+    for name, query in queries:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for gamestate, player, opponent in frames:
+                query(gamestate, player, opponent)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print("%-24s %10.2f us/call" % (name, best * 1e6 / len(frames)))
+
+
+BENCHMARKS = {
+    "allocations": bench_allocations,
+    "controller": bench_controller,
+    "framedata": bench_framedata,
+    "homes": bench_homes,
+    "replay": bench_replay,
+    "columns": bench_columns,
+}
+
+parser = argparse.ArgumentParser(description="libmelee performance benchmarks")
+parser.add_argument(
+    "benchmarks",
+    nargs="*",
+    help="Which benchmarks to run (%s). Runs all of them by default"
+    % ", ".join(sorted(BENCHMARKS)),
+)
+parser.add_argument(
+    "--repeat", "-r", type=int, default=3, help="Runs per benchmark (best is kept)"
+)
+args = parser.parse_args()
+for name in args.benchmarks:
+    if name not in BENCHMARKS:
+        parser.error("unknown benchmark: " + name)
+
+for name in args.benchmarks or sorted(BENCHMARKS):
+    print("== " + name)
+    BENCHMARKS[name](args)
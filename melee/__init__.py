@@ -11,4 +11,5 @@ from melee.framedata import *
 from melee.menuhelper import *
 from melee.stages import *
 from melee.version import *
-from melee import menuhelper, techskill, framedata, stages
+from melee import menuhelper, techskill, framedata, framedecoder, stages, replay
+from melee import corpus, indexcache, encoding, history, consolepool, launcher
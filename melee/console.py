@@ -17,14 +17,16 @@ import subprocess
 import platform
 import math
 import base64
+from struct import unpack_from
 import numpy as np
 from pathlib import Path
 import shutil
 import tempfile
 
-from melee import enums
+from melee import enums, framedecoder
 from melee.enums import Action
-from melee.gamestate import GameState, Projectile, PlayerState
+from melee.gamestate import GameState
+from melee.history import FrameHistory
 from melee.slippstream import SlippstreamClient, EventType
 from melee.slpfilestreamer import SLPFileStreamer
 from melee import stages
@@ -73,6 +75,10 @@ def _default_home_path(path: str) -> str:
     raise FileNotFoundError("Could not find dolphin home directory.")
 
 
+# Invulnerability lasts at most 120 frames. Looking back one more is enough to see it start
+SEEK_LOOKBACK = 121
+
+
 # pylint: disable=too-many-instance-attributes
 class Console:
     """The console object that represents your Dolphin / GameCube / SLP file"""
@@ -97,6 +103,12 @@ class Console:
         disable_audio=False,
         overclock: Optional[float] = None,
         save_replays=True,
+        follow_file=False,
+        index_cache=None,
+        gamestate_pool_size=0,
+        history_size=0,
+        shared_frame=None,
+        home_template=None,
     ):
         """Create a Console object
 
@@ -128,6 +140,27 @@ class Console:
             disable_audio (bool): Turn off sound.
             overclock (bool): Overclock the dolphin CPU.
             save_replays (bool): Save slippi replays.
+            follow_file (bool): For the "file" system, keep reading an SLP file that Dolphin
+                is still writing, as it's written. step() blocks until the next frame is
+                written (or returns None right away in polling_mode), and the last frame
+                is the end of the game.
+            index_cache (indexcache.FrameIndexCache): For the "file" system, a cache to
+                keep the file's frame index (used by seek()) in, so it's only built once.
+            gamestate_pool_size (int): Recycle a ring of this many GameState objects (along
+                with their PlayerStates and Projectiles) rather than making new ones every
+                frame. 0 (the default) to always make new ones. Must otherwise be at least 2.
+                WARNING: A GameState returned by step() is then only valid until
+                gamestate_pool_size - 1 more calls to step(). After that it gets reused and
+                overwritten. Copy out anything you need to keep for longer.
+            history_size (int): Remember this many of the most recent frames in
+                `history`, as NumPy arrays. 0 (the default) to not keep a history.
+            shared_frame (sharedframe.SharedFrame): Write every frame returned by step() into
+                this shared memory record, for other processes to read.
+            home_template (launcher.HomeTemplate): With tmp_home_directory and
+                copy_home_directory, make the temporary home directory from this template
+                (hard linking its read-only files) rather than copying the whole home
+                directory.
+                Much faster when starting many instances.
         """
         self.logger = logger
         self.system = system
@@ -137,7 +170,9 @@ class Console:
         if tmp_home_directory and self.system == "dolphin":
             self.temp_dir = tempfile.mkdtemp(prefix="libmelee_")
             home_dir = self.temp_dir + "/User/"
-            if copy_home_directory:
+            if copy_home_directory and home_template is not None:
+                home_template.make_home(home_dir)
+            elif copy_home_directory:
                 _copytree_safe(self._get_dolphin_home_path(), home_dir)
             self.dolphin_home_path = home_dir
 
@@ -181,7 +216,20 @@ class Console:
         self._prev_gamestate = GameState()
         # Half-completed gamestate not yet ready to add to the list
         self._temp_gamestate = None
+        if gamestate_pool_size == 1 or gamestate_pool_size < 0:
+            raise ValueError("gamestate_pool_size must be 0, or at least 2")
+        # Ring of GameStates to recycle. The previous frame's must stay intact while
+        #   building the next one, hence needing at least two
+        self._gamestate_pool = [GameState() for _ in range(gamestate_pool_size)]
+        self._gamestate_pool_index = 0
+        self.history = FrameHistory(history_size) if history_size > 0 else None
+        """(history.FrameHistory): The most recent frames returned by step(). None unless
+        history_size was set"""
+        self.shared_frame = shared_frame
+        """(sharedframe.SharedFrame): Where each new frame is written for other processes.
+        None unless given"""
         self._process = None
+        self._run_kwargs = None
         assert self.system in ["dolphin", "gamecube", "file"]
         if self.system == "dolphin":
             self._slippstream = SlippstreamClient(
@@ -194,7 +242,9 @@ class Console:
                 self.slippi_address, self.slippi_port, False
             )
         else:
-            self._slippstream = SLPFileStreamer(self.path)
+            self._slippstream = SLPFileStreamer(
+                self.path, follow=follow_file, index_cache=index_cache
+            )
 
         # Prepare some structures for fixing melee data
         path = os.path.dirname(os.path.realpath(__file__))
@@ -268,6 +318,13 @@ class Console:
             exe_name (str, optional): Name of the dolphin executable.
         """
         assert self.system == "dolphin" and self.path
+        # Remembered for restart()
+        self._run_kwargs = dict(
+            iso_path=iso_path,
+            dolphin_user_path=dolphin_user_path,
+            environment_vars=environment_vars,
+            exe_name=exe_name,
+        )
 
         dolphin_user_path = dolphin_user_path or self._get_dolphin_home_path()
 
@@ -298,6 +355,56 @@ class Console:
             env.update(environment_vars)
         self._process = subprocess.Popen(command, env=env)
 
+    def is_running(self):
+        """Is the Dolphin process that run() started still running?
+
+        Returns:
+            False if it exited (or crashed), or if run() hasn't been called
+        """
+        return self._process is not None and self._process.poll() is None
+
+    def restart(self):
+        """Kill Dolphin and start it again, the same way run() first started it
+
+        The home directory is kept. Once Dolphin is back up, reconnects to it, and sets up
+        and reconnects all the controllers too.
+
+        Returns:
+            True if it reconnected successfully, False otherwise
+        """
+        assert self._run_kwargs is not None, "Can only restart after run()"
+        self.connected = False
+        self._slippstream.shutdown()
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+        for controller in self.controllers:
+            controller.disconnect()
+            self.setup_dolphin_controller(controller.port, controller._type)
+
+        # Start decoding over, as from a new connection
+        self._slippstream = SlippstreamClient(
+            self.slippi_address, self.slippi_port, True
+        )
+        self.eventsize = [0] * 0x100
+        self._frame = 0
+        self._temp_gamestate = None
+        self._prev_gamestate = GameState()
+        if self.history is not None:
+            self.history.clear()
+
+        self.run(**self._run_kwargs)
+        if not self.connect():
+            return False
+        for controller in self.controllers:
+            controller.connect()
+        return True
+
     def stop(self):
         """Stop the console.
 
@@ -444,6 +551,18 @@ class Console:
 
         Returns:
             GameState object that represents new current state of the game"""
+        self._begin_step()
+        frame_ended = False
+        while not frame_ended:
+            message = self._slippstream.dispatch(self._polling_mode)
+            if message:
+                frame_ended = self._handle_message(message)
+            else:
+                return None
+        return self._end_step()
+
+    def _begin_step(self):
+        """Flush the controllers and get a GameState ready for step() to fill in"""
         self.processingtime = time.time() - self._frametimestamp
 
         # Flush the controllers
@@ -451,52 +570,56 @@ class Console:
             controller.flush()
 
         if self._temp_gamestate is None:
-            self._temp_gamestate = GameState()
+            self._temp_gamestate = self.__next_gamestate()
+
+    def _handle_message(self, message):
+        """Apply one message from the slippstream to the GameState being built
 
+        Returns:
+            True if the message ended the frame
+        """
         frame_ended = False
-        while not frame_ended:
-            message = self._slippstream.dispatch(self._polling_mode)
-            if message:
-                if message["type"] == "connect_reply":
-                    self.connected = True
-                    self.nick = message["nick"]
-                    self.version = message["version"]
-                    self.cursor = message["cursor"]
-
-                elif message["type"] == "game_event":
-                    if len(message["payload"]) > 0:
-                        if self.system == "dolphin":
-                            frame_ended = self.__handle_slippstream_events(
-                                base64.b64decode(message["payload"]),
-                                self._temp_gamestate,
-                            )
-                        else:
-                            frame_ended = self.__handle_slippstream_events(
-                                message["payload"], self._temp_gamestate
-                            )
-
-                elif message["type"] == "menu_event":
-                    if len(message["payload"]) > 0:
-                        if self.system == "dolphin":
-                            self.__handle_slippstream_menu_event(
-                                base64.b64decode(message["payload"]),
-                                self._temp_gamestate,
-                            )
-                        else:
-                            self.__handle_slippstream_menu_event(
-                                message["payload"], self._temp_gamestate
-                            )
-                        frame_ended = True
-
-                elif (
-                    self._use_manual_bookends
-                    and message["type"] == "frame_end"
-                    and self._frame != -10000
-                ):
-                    frame_ended = True
-            else:
-                return None
+        if message["type"] == "connect_reply":
+            self.connected = True
+            self.nick = message["nick"]
+            self.version = message["version"]
+            self.cursor = message["cursor"]
+
+        elif message["type"] == "game_event":
+            if len(message["payload"]) > 0:
+                if self.system == "dolphin":
+                    frame_ended = self.__handle_slippstream_events(
+                        base64.b64decode(message["payload"]),
+                        self._temp_gamestate,
+                    )
+                else:
+                    frame_ended = self.__handle_slippstream_events(
+                        message["payload"], self._temp_gamestate
+                    )
+
+        elif message["type"] == "menu_event":
+            if len(message["payload"]) > 0:
+                if self.system == "dolphin":
+                    self.__handle_slippstream_menu_event(
+                        base64.b64decode(message["payload"]),
+                        self._temp_gamestate,
+                    )
+                else:
+                    self.__handle_slippstream_menu_event(
+                        message["payload"], self._temp_gamestate
+                    )
+                frame_ended = True
+
+        elif (
+            self._use_manual_bookends
+            and message["type"] == "frame_end"
+            and self._frame != -10000
+        ):
+            frame_ended = True
+        return frame_ended
 
+    def _end_step(self):
+        """Finish off the GameState that step() has built, and return it"""
         gamestate = self._temp_gamestate
         self._temp_gamestate = None
         self.__fixframeindexing(gamestate)
@@ -515,305 +638,322 @@ class Console:
             except KeyError:
                 pass
 
+        if self.history is not None:
+            self.history.append(gamestate)
+        if self.shared_frame is not None:
+            self.shared_frame.write(gamestate)
+
         # Start the processing timer now that we're done reading messages
         self._frametimestamp = time.time()
         return gamestate
 
+    def __next_gamestate(self):
+        """A blank GameState to build the next frame in. From the pool, if there is one"""
+        if not self._gamestate_pool:
+            return GameState()
+        gamestate = self._gamestate_pool[self._gamestate_pool_index]
+        self._gamestate_pool_index = (self._gamestate_pool_index + 1) % len(
+            self._gamestate_pool
+        )
+        gamestate.reset()
+        return gamestate
+
+    def seek(self, frame, lookback=SEEK_LOOKBACK):
+        """Jump to a frame of an SLP file, so that the next step() returns it
+
+        Rather than decoding the whole file up to that point, this only decodes the
+        `lookback` frames just before it. That's enough to rebuild state that's carried
+        over between frames, such as invulnerability_left and moonwalkwarning.
+
+        Only works for the "file" system, once connected. The first call indexes the
+        whole file, in one quick pass.
+
+        Args:
+            frame (int): The frame number to go to
+            lookback (int): How many frames before it to decode
+
+        Raises:
+            ValueError: If the frame isn't in the file (or the file can't be indexed)
+        """
+        index = None
+        if self.system == "file":
+            index = self._slippstream.frame_index(self._allow_old_version)
+        if index is None or index.game_start_offset is None:
+            raise ValueError("Can only seek within a connected SLP file")
+        if frame not in index.positions:
+            raise ValueError("Frame " + str(frame) + " is not in the SLP file")
+        position = index.positions[frame]
+        start = max(0, position - lookback)
+
+        # Start over, as of the beginning of the game
+        if self.history is not None:
+            self.history.clear()
+        raw = self._slippstream.raw
+        self.__handle_slippstream_events(raw[: index.game_start_end], GameState())
+        self._prev_gamestate = GameState()
+        for port in self._invuln_start:
+            self._invuln_start[port] = (index.frames[start], 0)
+        if start > 0:
+            self._frame = index.frames[start - 1]
+        self._temp_gamestate = None
+        self._slippstream.seek(index.offsets[start])
+
+        for _ in range(position - start):
+            Console.step(self)
+
+    def state_at(self, frame, lookback=SEEK_LOOKBACK):
+        """Returns the GameState of a given frame of an SLP file
+
+        Same as seek() followed by step(). Afterwards, step() carries on from the frame after.
+
+        Args:
+            frame (int): The frame number to get
+            lookback (int): How many frames before it to decode
+
+        Raises:
+            ValueError: If the frame isn't in the file (or the file can't be indexed)
+        """
+        self.seek(frame, lookback)
+        return Console.step(self)
+
     def __handle_slippstream_events(self, event_bytes, gamestate):
-        """Handle a series of events, provided sequentially in a byte array"""
+        """Handle a series of events, provided sequentially in a byte array
+
+        Events are decoded in place, by offset. The buffer is never sliced up, so no
+        event bytes get copied no matter how many events are in it."""
         gamestate.menu_state = enums.Menu.IN_GAME
-        while len(event_bytes) > 0:
+        index = 0
+        length = len(event_bytes)
+        while index < length:
+            command = event_bytes[index]
             # A null message type means that the rest of the data is padding
-            if event_bytes[0] == 0x00:
+            if command == 0x00:
                 return True
-            event_size = self.eventsize[event_bytes[0]]
-            if len(event_bytes) < event_size:
+            event_size = self.eventsize[command]
+            if length - index < event_size:
                 print(
                     "WARNING: Something went wrong unpacking events. Data is probably missing"
                 )
                 print("\tDidn't have enough data for event")
                 return False
-            if EventType(event_bytes[0]) == EventType.PAYLOADS:
-                cursor = 0x2
-                payload_size = event_bytes[1]
+            if command == EventType.PAYLOADS.value:
+                cursor = index + 0x2
+                payload_size = event_bytes[index + 1]
                 num_commands = (payload_size - 1) // 3
                 for i in range(0, num_commands):
-                    command = np.ndarray((1,), ">B", event_bytes, cursor)[0]
-                    command_len = np.ndarray((1,), ">H", event_bytes, cursor + 0x1)[0]
-                    self.eventsize[command] = command_len + 1
+                    self.eventsize[event_bytes[cursor]] = (
+                        unpack_from(">H", event_bytes, cursor + 0x1)[0] + 1
+                    )
                     cursor += 3
-                event_bytes = event_bytes[payload_size + 1 :]
+                index += payload_size + 1
 
-            elif EventType(event_bytes[0]) == EventType.FRAME_START:
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.FRAME_START.value:
+                index += event_size
 
-            elif EventType(event_bytes[0]) == EventType.GAME_START:
-                self.__game_start(gamestate, event_bytes)
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.GAME_START.value:
+                self.__game_start(gamestate, event_bytes, index, event_size)
+                index += event_size
                 # The game needs to know what to press on the first frame of the game
                 #   Just give it empty input. Characters are not actionable anyway.
                 for controller in self.controllers:
                     controller.release_all()
                     controller.flush()
 
-            elif EventType(event_bytes[0]) == EventType.GAME_END:
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.GAME_END.value:
+                index += event_size
                 return self._use_manual_bookends
 
-            elif EventType(event_bytes[0]) == EventType.PRE_FRAME:
-                self.__pre_frame(gamestate, event_bytes)
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.PRE_FRAME.value:
+                self.__pre_frame(gamestate, event_bytes, index, event_size)
+                index += event_size
 
-            elif EventType(event_bytes[0]) == EventType.POST_FRAME:
-                self.__post_frame(gamestate, event_bytes)
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.POST_FRAME.value:
+                self.__post_frame(gamestate, event_bytes, index, event_size)
+                index += event_size
 
-            elif EventType(event_bytes[0]) == EventType.GECKO_CODES:
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.GECKO_CODES.value:
+                index += event_size
 
-            elif EventType(event_bytes[0]) == EventType.FRAME_BOOKEND:
+            elif command == EventType.FRAME_BOOKEND.value:
                 self.__frame_bookend(gamestate, event_bytes)
-                event_bytes = event_bytes[event_size:]
+                index += event_size
                 # If this is an old frame, then don't return it.
                 if gamestate.frame <= self._frame:
                     return False
                 self._frame = gamestate.frame
                 return True
 
-            elif EventType(event_bytes[0]) == EventType.ITEM_UPDATE:
-                self.__item_update(gamestate, event_bytes)
-                event_bytes = event_bytes[event_size:]
+            elif command == EventType.ITEM_UPDATE.value:
+                self.__item_update(gamestate, event_bytes, index, event_size)
+                index += event_size
 
             else:
                 print(
                     "WARNING: Something went wrong unpacking events. "
                     + "Data is probably missing"
                 )
-                print("\tGot invalid event type: ", event_bytes[0])
+                print("\tGot invalid event type: ", command)
                 return False
         return False
 
-    def __game_start(self, gamestate, event_bytes):
+    def __game_start(self, gamestate, event_bytes, offset, event_size):
         self._frame = -10000
-        major = np.ndarray((1,), ">B", event_bytes, 0x1)[0]
-        minor = np.ndarray((1,), ">B", event_bytes, 0x2)[0]
-        version_num = np.ndarray((1,), ">B", event_bytes, 0x3)[0]
-        self.slp_version = str(major) + "." + str(minor) + "." + str(version_num)
+        start = dict(
+            zip(
+                framedecoder.GAME_START.names,
+                framedecoder.GAME_START.unpack_from(event_bytes, offset, event_size),
+            )
+        )
+        major = start["major"]
+        self.slp_version = (
+            str(major) + "." + str(start["minor"]) + "." + str(start["build"])
+        )
         self._use_manual_bookends = self._allow_old_version and (
             version.parse(self.slp_version) < version.parse("3.0.0")
         )
         if major < 3 and not self._allow_old_version:
             raise SlippiVersionTooLow(self.slp_version)
         try:
-            self._current_stage = enums.to_internal_stage(
-                np.ndarray((1,), ">H", event_bytes, 0x13)[0]
-            )
+            self._current_stage = enums.to_internal_stage(start["stage"])
         except ValueError:
             self._current_stage = enums.Stage.NO_STAGE
 
-        self._is_teams = not (np.ndarray((1,), ">H", event_bytes, 0xD)[0] == 0)
-
-        for i in range(4):
-            self._costumes[i] = np.ndarray((1,), ">B", event_bytes, 0x68 + (0x24 * i))[
-                0
-            ]
-
-        for i in range(4):
-            self._cpu_level[i] = np.ndarray((1,), ">B", event_bytes, 0x74 + (0x24 * i))[
-                0
-            ]
+        self._is_teams = not (start["is_teams"] == 0)
 
         for i in range(4):
-            self._team_id[i] = np.ndarray((1,), ">B", event_bytes, 0x6E + (0x24 * i))[0]
-
-        for i in range(4):
-            if np.ndarray((1,), ">B", event_bytes, 0x66 + (0x24 * i))[0] != 1:
+            self._costumes[i] = start["costume_" + str(i)]
+            self._cpu_level[i] = start["cpu_level_" + str(i)]
+            self._team_id[i] = start["team_id_" + str(i)]
+            if start["player_type_" + str(i)] != 1:
                 self._cpu_level[i] = 0
 
-    def __pre_frame(self, gamestate, event_bytes):
+    def __pre_frame(self, gamestate, event_bytes, offset, event_size):
+        (
+            _,
+            port,
+            is_follower,
+            main_x,
+            main_y,
+            c_x,
+            c_y,
+            trigger,
+            buttonbits,
+            raw_main_x,
+            raw_main_y,
+        ) = framedecoder.PRE_FRAME.unpack_from(event_bytes, offset, event_size)
+
         # Grab the physical controller state and put that into the controller state
-        controller_port = np.ndarray((1,), ">B", event_bytes, 0x5)[0] + 1
+        controller_port = port + 1
 
         if controller_port not in gamestate.players:
-            gamestate.players[controller_port] = PlayerState()
+            gamestate.players[controller_port] = gamestate._take_player()
         playerstate = gamestate.players[controller_port]
 
         # Is this Nana?
-        if np.ndarray((1,), ">B", event_bytes, 0x6)[0] == 1:
-            playerstate.nana = PlayerState()
+        if is_follower == 1:
+            playerstate.nana = gamestate._take_player()
             playerstate = playerstate.nana
 
         playerstate.costume = self._costumes[controller_port - 1]
         playerstate.cpu_level = self._cpu_level[controller_port - 1]
         playerstate.team_id = self._team_id[controller_port - 1]
 
-        main_x = (np.ndarray((1,), ">f", event_bytes, 0x19)[0] / 2) + 0.5
-        main_y = (np.ndarray((1,), ">f", event_bytes, 0x1D)[0] / 2) + 0.5
-        playerstate.controller_state.main_stick = (main_x, main_y)
-
-        c_x = (np.ndarray((1,), ">f", event_bytes, 0x21)[0] / 2) + 0.5
-        c_y = (np.ndarray((1,), ">f", event_bytes, 0x25)[0] / 2) + 0.5
-        playerstate.controller_state.c_stick = (c_x, c_y)
-
-        raw_main_x = 0
-        raw_main_y = 0
-        try:
-            raw_main_x = int(np.ndarray((1,), ">b", event_bytes, 0x3B)[0])
-        except TypeError:
-            pass
-        try:
-            raw_main_y = int(np.ndarray((1,), ">b", event_bytes, 0x40)[0])
-        except TypeError:
-            pass
-        playerstate.controller_state.raw_main_stick = (raw_main_x, raw_main_y)
+        controller_state = playerstate.controller_state
+        controller_state.main_stick = ((main_x / 2) + 0.5, (main_y / 2) + 0.5)
+        controller_state.c_stick = ((c_x / 2) + 0.5, (c_y / 2) + 0.5)
+        controller_state.raw_main_stick = (raw_main_x, raw_main_y)
 
         # The game interprets both shoulders together, so the processed value will always be the same
-        trigger = np.ndarray((1,), ">f", event_bytes, 0x29)[0]
-        playerstate.controller_state.l_shoulder = trigger
-        playerstate.controller_state.r_shoulder = trigger
+        controller_state.l_shoulder = trigger
+        controller_state.r_shoulder = trigger
+        controller_state.buttons = buttonbits & framedecoder.ALL_BUTTONS
 
-        buttonbits = np.ndarray((1,), ">H", event_bytes, 0x31)[0]
-        playerstate.controller_state.button[enums.Button.BUTTON_A] = bool(
-            int(buttonbits) & 0x0100
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_B] = bool(
-            int(buttonbits) & 0x0200
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_X] = bool(
-            int(buttonbits) & 0x0400
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_Y] = bool(
-            int(buttonbits) & 0x0800
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_START] = bool(
-            int(buttonbits) & 0x1000
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_Z] = bool(
-            int(buttonbits) & 0x0010
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_R] = bool(
-            int(buttonbits) & 0x0020
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_L] = bool(
-            int(buttonbits) & 0x0040
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_D_LEFT] = bool(
-            int(buttonbits) & 0x0001
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_D_RIGHT] = bool(
-            int(buttonbits) & 0x0002
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_D_DOWN] = bool(
-            int(buttonbits) & 0x0004
-        )
-        playerstate.controller_state.button[enums.Button.BUTTON_D_UP] = bool(
-            int(buttonbits) & 0x0008
-        )
         if self._use_manual_bookends:
             self._frame = gamestate.frame
 
-    def __post_frame(self, gamestate, event_bytes):
+    def __post_frame(self, gamestate, event_bytes, offset, event_size):
+        (
+            frame,
+            port,
+            is_follower,
+            character,
+            action,
+            position_x,
+            position_y,
+            facing,
+            percent,
+            shield_strength,
+            stock,
+            action_frame,
+            state_flags_4,
+            hitstun,
+            airborne,
+            jumps_left,
+            invulnerable,
+            speed_air_x_self,
+            speed_y_self,
+            speed_x_attack,
+            speed_y_attack,
+            speed_ground_x_self,
+            hitlag_left,
+            ecb_top_x,
+            ecb_top_y,
+            ecb_bottom_x,
+            ecb_bottom_y,
+            ecb_left_x,
+            ecb_left_y,
+            ecb_right_x,
+            ecb_right_y,
+            fod_platform_left,
+            fod_platform_right,
+        ) = framedecoder.POST_FRAME.unpack_from(event_bytes, offset, event_size)
+
         gamestate.stage = self._current_stage
         gamestate.is_teams = self._is_teams
-        gamestate.frame = np.ndarray((1,), ">i", event_bytes, 0x1)[0]
-        controller_port = np.ndarray((1,), ">B", event_bytes, 0x5)[0] + 1
+        gamestate.frame = frame
+        controller_port = port + 1
 
         if controller_port not in gamestate.players:
-            gamestate.players[controller_port] = PlayerState()
+            gamestate.players[controller_port] = gamestate._take_player()
         playerstate = gamestate.players[controller_port]
 
         # Is this Nana?
-        if np.ndarray((1,), ">B", event_bytes, 0x6)[0] == 1:
-            playerstate.nana = PlayerState()
+        if is_follower == 1:
+            playerstate.nana = gamestate._take_player()
             playerstate = playerstate.nana
 
-        playerstate.position.x = np.ndarray((1,), ">f", event_bytes, 0xA)[0]
-        playerstate.position.y = np.ndarray((1,), ">f", event_bytes, 0xE)[0]
+        playerstate.position.x = position_x
+        playerstate.position.y = position_y
 
-        playerstate.x = playerstate.position.x
-        playerstate.y = playerstate.position.y
+        playerstate.x = position_x
+        playerstate.y = position_y
 
-        playerstate.character = enums.Character(
-            np.ndarray((1,), ">B", event_bytes, 0x7)[0]
-        )
-        try:
-            playerstate.action = enums.Action(
-                np.ndarray((1,), ">H", event_bytes, 0x8)[0]
-            )
-        except ValueError:
-            playerstate.action = enums.Action.UNKNOWN_ANIMATION
+        playerstate.character = framedecoder.to_character(character)
+        playerstate.action = framedecoder.to_action(action)
 
         # Melee stores this in a float for no good reason. So we have to convert
-        playerstate.facing = np.ndarray((1,), ">f", event_bytes, 0x12)[0] > 0
+        playerstate.facing = facing > 0
 
-        playerstate.percent = int(np.ndarray((1,), ">f", event_bytes, 0x16)[0])
-        playerstate.shield_strength = np.ndarray((1,), ">f", event_bytes, 0x1A)[0]
-        playerstate.stock = np.ndarray((1,), ">B", event_bytes, 0x21)[0]
-        playerstate.action_frame = int(np.ndarray((1,), ">f", event_bytes, 0x22)[0])
+        playerstate.percent = int(percent)
+        playerstate.shield_strength = shield_strength
+        playerstate.stock = stock
+        playerstate.action_frame = int(action_frame)
+        playerstate.is_powershield = (state_flags_4 & 0x20) == 0x20
 
         try:
-            sb4 = int(np.ndarray((1,), ">B", event_bytes, 0x29)[0])
-            playerstate.is_powershield = (sb4 & 0x20) == 0x20
-        except TypeError:
-            playerstate.is_powershield = False
-
-        try:
-            playerstate.hitstun_frames_left = int(
-                np.ndarray((1,), ">f", event_bytes, 0x2B)[0]
-            )
-        except TypeError:
+            playerstate.hitstun_frames_left = int(hitstun)
+        except (ValueError, OverflowError):
             playerstate.hitstun_frames_left = 0
-        except ValueError:
-            playerstate.hitstun_frames_left = 0
-        try:
-            playerstate.on_ground = not bool(
-                np.ndarray((1,), ">B", event_bytes, 0x2F)[0]
-            )
-        except TypeError:
-            playerstate.on_ground = True
-        try:
-            playerstate.jumps_left = np.ndarray((1,), ">B", event_bytes, 0x32)[0]
-        except TypeError:
-            playerstate.jumps_left = 1
+        playerstate.on_ground = not bool(airborne)
+        playerstate.jumps_left = jumps_left
+        playerstate.invulnerable = invulnerable != 0
 
-        try:
-            playerstate.invulnerable = (
-                int(np.ndarray((1,), ">B", event_bytes, 0x34)[0]) != 0
-            )
-        except TypeError:
-            playerstate.invulnerable = False
-
-        try:
-            playerstate.speed_air_x_self = np.ndarray((1,), ">f", event_bytes, 0x35)[0]
-        except TypeError:
-            playerstate.speed_air_x_self = 0
-
-        try:
-            playerstate.speed_y_self = np.ndarray((1,), ">f", event_bytes, 0x39)[0]
-        except TypeError:
-            playerstate.speed_y_self = 0
-
-        try:
-            playerstate.speed_x_attack = np.ndarray((1,), ">f", event_bytes, 0x3D)[0]
-        except TypeError:
-            playerstate.speed_x_attack = 0
-
-        try:
-            playerstate.speed_y_attack = np.ndarray((1,), ">f", event_bytes, 0x41)[0]
-        except TypeError:
-            playerstate.speed_y_attack = 0
-
-        try:
-            playerstate.speed_ground_x_self = np.ndarray((1,), ">f", event_bytes, 0x45)[
-                0
-            ]
-        except TypeError:
-            playerstate.speed_ground_x_self = 0
-
-        try:
-            playerstate.hitlag_left = int(np.ndarray((1,), ">f", event_bytes, 0x49)[0])
-        except TypeError:
-            playerstate.hitlag_left = 0
+        playerstate.speed_air_x_self = speed_air_x_self
+        playerstate.speed_y_self = speed_y_self
+        playerstate.speed_x_attack = speed_x_attack
+        playerstate.speed_y_attack = speed_y_attack
+        playerstate.speed_ground_x_self = speed_ground_x_self
+        playerstate.hitlag_left = int(hitlag_left)
 
         # Keep track of a player's invulnerability due to respawn or ledge grab
         if controller_port in self._prev_gamestate.players:
@@ -864,66 +1004,15 @@ class Console:
         except KeyError:
             playerstate.off_stage = False
 
-        # ECB top edge, x
-        ecb_top_x = 0
-        ecb_top_y = 0
-        try:
-            ecb_top_x = np.ndarray((1,), ">f", event_bytes, 0x51)[0]
-        except TypeError:
-            ecb_top_x = 0
-        # ECB Top edge, y
-        try:
-            ecb_top_y = np.ndarray((1,), ">f", event_bytes, 0x55)[0]
-        except TypeError:
-            ecb_top_y = 0
         playerstate.ecb.top.x = ecb_top_x
         playerstate.ecb.top.y = ecb_top_y
         playerstate.ecb_top = (ecb_top_x, ecb_top_y)
-
-        # ECB bottom edge, x coord
-        ecb_bot_x = 0
-        ecb_bot_y = 0
-        try:
-            ecb_bot_x = np.ndarray((1,), ">f", event_bytes, 0x59)[0]
-        except TypeError:
-            ecb_bot_x = 0
-        # ECB Bottom edge, y coord
-        try:
-            ecb_bot_y = np.ndarray((1,), ">f", event_bytes, 0x5D)[0]
-        except TypeError:
-            ecb_bot_y = 0
-        playerstate.ecb.bottom.x = ecb_bot_x
-        playerstate.ecb.bottom.y = ecb_bot_y
-        playerstate.ecb_bottom = (ecb_bot_x, ecb_bot_y)
-
-        # ECB left edge, x coord
-        ecb_left_x = 0
-        ecb_left_y = 0
-        try:
-            ecb_left_x = np.ndarray((1,), ">f", event_bytes, 0x61)[0]
-        except TypeError:
-            ecb_left_x = 0
-        # ECB left edge, y coord
-        try:
-            ecb_left_y = np.ndarray((1,), ">f", event_bytes, 0x65)[0]
-        except TypeError:
-            ecb_left_y = 0
+        playerstate.ecb.bottom.x = ecb_bottom_x
+        playerstate.ecb.bottom.y = ecb_bottom_y
+        playerstate.ecb_bottom = (ecb_bottom_x, ecb_bottom_y)
         playerstate.ecb.left.x = ecb_left_x
         playerstate.ecb.left.y = ecb_left_y
         playerstate.ecb_left = (ecb_left_x, ecb_left_y)
-
-        # ECB right edge, x coord
-        ecb_right_x = 0
-        ecb_right_y = 0
-        try:
-            ecb_right_x = np.ndarray((1,), ">f", event_bytes, 0x69)[0]
-        except TypeError:
-            ecb_right_x = 0
-        # ECB right edge, y coord
-        try:
-            ecb_right_y = np.ndarray((1,), ">f", event_bytes, 0x6D)[0]
-        except TypeError:
-            ecb_right_y = 0
         playerstate.ecb.right.x = ecb_right_x
         playerstate.ecb.right.y = ecb_right_y
         playerstate.ecb_right = (ecb_right_x, ecb_right_y)
@@ -931,14 +1020,8 @@ class Console:
             self._frame = gamestate.frame
 
         # FoD platform heights
-        try:
-            gamestate._fod_platform_left = np.ndarray((1,), ">f", event_bytes, 0x71)[0]
-        except TypeError:
-            gamestate._fod_platform_left = 0
-        try:
-            gamestate._fod_platform_right = np.ndarray((1,), ">f", event_bytes, 0x75)[0]
-        except TypeError:
-            gamestate._fod_platform_right = 0
+        gamestate._fod_platform_left = fod_platform_left
+        gamestate._fod_platform_right = fod_platform_right
 
     def __frame_bookend(self, gamestate, event_bytes):
         self._prev_gamestate = gamestate
@@ -962,53 +1045,59 @@ class Console:
         ydist = player_one_y - player_two_y
         gamestate.distance = math.sqrt((xdist**2) + (ydist**2))
 
-    def __item_update(self, gamestate, event_bytes):
-        projectile = Projectile()
-        projectile.position.x = np.ndarray((1,), ">f", event_bytes, 0x14)[0]
-        projectile.position.y = np.ndarray((1,), ">f", event_bytes, 0x18)[0]
-        projectile.x = projectile.position.x
-        projectile.y = projectile.position.y
-        projectile.speed.x = np.ndarray((1,), ">f", event_bytes, 0xC)[0]
-        projectile.speed.y = np.ndarray((1,), ">f", event_bytes, 0x10)[0]
-        projectile.x_speed = projectile.speed.x
-        projectile.y_speed = projectile.speed.y
-        try:
-            projectile.owner = np.ndarray((1,), ">B", event_bytes, 0x2A)[0] + 1
-            if projectile.owner > 4:
-                projectile.owner = -1
-        except TypeError:
+    def __item_update(self, gamestate, event_bytes, offset, event_size):
+        (
+            projectile_type,
+            subtype,
+            speed_x,
+            speed_y,
+            position_x,
+            position_y,
+            frame,
+            owner,
+        ) = framedecoder.ITEM_UPDATE.unpack_from(event_bytes, offset, event_size)
+
+        projectile = gamestate._take_projectile()
+        projectile.position.x = position_x
+        projectile.position.y = position_y
+        projectile.x = position_x
+        projectile.y = position_y
+        projectile.speed.x = speed_x
+        projectile.speed.y = speed_y
+        projectile.x_speed = speed_x
+        projectile.y_speed = speed_y
+        projectile.owner = owner + 1
+        if projectile.owner > 4:
             projectile.owner = -1
-        try:
-            projectile.type = enums.ProjectileType(
-                np.ndarray((1,), ">H", event_bytes, 0x5)[0]
-            )
-        except ValueError:
-            projectile.type = enums.ProjectileType.UNKNOWN_PROJECTILE
+        projectile.type = framedecoder.to_projectile(projectile_type)
 
         try:
-            projectile.frame = int(np.ndarray((1,), ">f", event_bytes, 0x1E)[0])
-        except ValueError:
+            projectile.frame = int(frame)
+        except (ValueError, OverflowError):
             projectile.frame = -1
 
-        projectile.subtype = np.ndarray((1,), ">B", event_bytes, 0x7)[0]
+        projectile.subtype = subtype
 
         # Ignore exploded Samus bombs. They are subtype 3
         if (
             projectile.type == enums.ProjectileType.SAMUS_BOMB
             and projectile.subtype == 3
         ):
+            gamestate._return_projectile(projectile)
             return
         # Ignore exploded Samus missles
         if (
             projectile.type == enums.ProjectileType.SAMUS_MISSLE
             and projectile.subtype in [2, 3]
         ):
+            gamestate._return_projectile(projectile)
             return
         # Ignore Samus charge beam while charging (not firing)
         if (
             projectile.type == enums.ProjectileType.SAMUS_CHARGE_BEAM
             and projectile.subtype == 0
         ):
+            gamestate._return_projectile(projectile)
             return
 
         # Add the projectile to the gamestate list
@@ -1023,26 +1112,26 @@ class Console:
         if scene == 0x02:
             gamestate.menu_state = enums.Menu.CHARACTER_SELECT
             # All the controller ports are active on this screen
-            gamestate.players[1] = PlayerState()
-            gamestate.players[2] = PlayerState()
-            gamestate.players[3] = PlayerState()
-            gamestate.players[4] = PlayerState()
+            gamestate.players[1] = gamestate._take_player()
+            gamestate.players[2] = gamestate._take_player()
+            gamestate.players[3] = gamestate._take_player()
+            gamestate.players[4] = gamestate._take_player()
         elif scene in [0x0102, 0x0108]:
             gamestate.menu_state = enums.Menu.STAGE_SELECT
-            gamestate.players[1] = PlayerState()
-            gamestate.players[2] = PlayerState()
-            gamestate.players[3] = PlayerState()
-            gamestate.players[4] = PlayerState()
+            gamestate.players[1] = gamestate._take_player()
+            gamestate.players[2] = gamestate._take_player()
+            gamestate.players[3] = gamestate._take_player()
+            gamestate.players[4] = gamestate._take_player()
         elif scene == 0x0202:
             gamestate.menu_state = enums.Menu.IN_GAME
         elif scene == 0x0001:
             gamestate.menu_state = enums.Menu.MAIN_MENU
         elif scene == 0x0008:
             gamestate.menu_state = enums.Menu.SLIPPI_ONLINE_CSS
-            gamestate.players[1] = PlayerState()
-            gamestate.players[2] = PlayerState()
-            gamestate.players[3] = PlayerState()
-            gamestate.players[4] = PlayerState()
+            gamestate.players[1] = gamestate._take_player()
+            gamestate.players[2] = gamestate._take_player()
+            gamestate.players[3] = gamestate._take_player()
+            gamestate.players[4] = gamestate._take_player()
         elif scene == 0x0000:
             gamestate.menu_state = enums.Menu.PRESS_START
         elif scene == 0x0402:
@@ -1255,3 +1344,50 @@ class Console:
                 or player.action.value > Action.DAIR.value
             ):
                 player.iasa = False
+
+
+class AsyncConsole(Console):
+    """A Console for use with asyncio
+
+    Exactly the same as Console, except that connect() and step() are coroutines. While
+    waiting on Dolphin or a GameCube, they yield to the event loop rather than blocking,
+    so a single thread can run many consoles at once::
+
+        async def spectate(console):
+            await console.connect()
+            while (gamestate := await console.step()) is not None:
+                ...
+
+        await asyncio.gather(*(spectate(console) for console in consoles))
+
+    SLP files are read the same as with Console, since they never wait on anything
+    (unless following a file that's still being written).
+    """
+
+    async def connect(self):
+        """Connects to the Slippi server (dolphin or gamecube).
+
+        Returns:
+            True is successful, False otherwise
+        """
+        if self.system == "file":
+            return self._slippstream.connect()
+        return await self._slippstream.connect_async()
+
+    async def step(self):
+        """'step' to the next state of the game and flushes all controllers
+
+        Returns:
+            GameState object that represents new current state of the game"""
+        self._begin_step()
+        frame_ended = False
+        while not frame_ended:
+            if self.system == "file":
+                message = self._slippstream.dispatch(self._polling_mode)
+            else:
+                message = await self._slippstream.dispatch_async(self._polling_mode)
+            if message:
+                frame_ended = self._handle_message(message)
+            else:
+                return None
+        return self._end_step()
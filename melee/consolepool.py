@@ -0,0 +1,130 @@
+"""Step many Consoles side by side, for running lots of games at once
+
+Self-play and RL training run many Dolphin instances at the same time, usually with
+blocking_input so each game waits on its bot. A ConsolePool steps all of them together and
+hands back every game's frame at once, either as GameStates or as one batched NumPy array of
+encoding.PLAYER_DTYPE rows. That way a policy can run a single batched inference for every
+game, rather than one call per game.
+
+Each Console is stepped on its own thread. Most of a step is spent waiting on Dolphin, which
+doesn't hold the GIL, so the waits overlap rather than adding up.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from melee.encoding import PLAYER_DTYPE, player_record
+
+
+class ConsolePool:
+    """A group of Consoles (and their Controllers) that are stepped together"""
+
+    def __init__(self, consoles, controllers=None):
+        """Create a pool
+
+        Args:
+            consoles (list of console.Console): The consoles to step. They can be set up and
+                run() as usual, before or after making the pool
+            controllers (list): The controller (or list of controllers) that goes with each
+                console, in the same order. Just kept for convenience; each Console still
+                flushes its own controllers when stepped
+        """
+        self.consoles = list(consoles)
+        """(list of console.Console): The consoles in the pool"""
+        self.controllers = list(controllers) if controllers else [None] * len(consoles)
+        """(list): The controller(s) that goes with each console"""
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.consoles)))
+        self._pending = {}
+
+    def __len__(self):
+        return len(self.consoles)
+
+    def connect(self):
+        """Connect every console, in parallel
+
+        Returns:
+            list of bool: Whether each console connected
+        """
+        return list(
+            self._executor.map(lambda console: console.connect(), self.consoles)
+        )
+
+    def step(self):
+        """Step every console to its next frame (lock-step)
+
+        Waits for all of them. Consoles already stepped by step_ready(), whose frames haven't
+        been handed out yet, aren't stepped again.
+
+        Returns:
+            list of gamestate.GameState: The new frame of each console, in order. An entry is
+                None wherever that console's step() returned None
+        """
+        for index in range(len(self.consoles)):
+            self._start(index)
+        # Each step is done with once it's collected, even if it raised. Otherwise it
+        #   would be handed out (and raise) again on every later call
+        return [
+            self._pending.pop(index).result() for index in range(len(self.consoles))
+        ]
+
+    def step_ready(self, timeout=None):
+        """Step the consoles, returning the frames of whichever ones are ready first
+
+        Any console that isn't already being stepped is started. Then waits until at least
+        one has a new frame and returns every frame that's ready. The rest keep stepping in the
+        background, and come back from a later call. Use this when the games don't need to
+        stay in sync, so a slow one doesn't hold up the others.
+
+        Args:
+            timeout (float): Longest to wait, in seconds. None to wait as long as it takes
+
+        Returns:
+            dict of int to gamestate.GameState: The new frames, keyed by index of the console.
+                Empty if none were ready within the timeout
+        """
+        for index in range(len(self.consoles)):
+            self._start(index)
+        done, _ = wait(self._pending.values(), timeout, return_when=FIRST_COMPLETED)
+        ready = {}
+        for index, future in list(self._pending.items()):
+            if future in done:
+                del self._pending[index]
+                ready[index] = future.result()
+        return ready
+
+    @staticmethod
+    def observe(gamestates, ports=4):
+        """Encode a batch of frames into a single array
+
+        Args:
+            gamestates (list of gamestate.GameState): The frames to encode, such as from step()
+            ports (int): Number of controller ports to make room for
+
+        Returns:
+            np.ndarray: Array of encoding.PLAYER_DTYPE, shaped (len(gamestates), ports).
+                Row [i, port - 1] is the player on that port of game i. Any player that isn't
+                there (or game that is None) has a frame of -10000
+        """
+        observations = np.zeros((len(gamestates), ports), dtype=PLAYER_DTYPE)
+        observations["frame"] = -10000
+        for row, gamestate in enumerate(gamestates):
+            if gamestate is None:
+                continue
+            for port, player in gamestate.players.items():
+                if 1 <= port <= ports:
+                    observations[row, port - 1] = player_record(player, gamestate.frame)
+        return observations
+
+    def stop(self):
+        """Stop every console, and the pool's threads"""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+        for console in self.consoles:
+            console.stop()
+
+    def _start(self, index):
+        if index not in self._pending:
+            self._pending[index] = self._executor.submit(self.consoles[index].step)
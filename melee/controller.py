@@ -4,9 +4,11 @@ from cmath import e
 import platform
 import sys
 import copy
+from collections.abc import MutableMapping
 import time
 import serial
-from struct import pack
+import threading
+from struct import Struct
 
 try:
     import win32file
@@ -14,29 +16,82 @@ try:
 except ImportError:
     pass
 
-from melee import enums
+from melee import enums, framedecoder
+
+_GAMECUBE_STATE = Struct(">HBBBBBB")
+# The TAStm32 command for "send single controller poll" is 'A', followed by the state
+_TASTM32_POLL = Struct(">cHBBBBBB")
+
+_DIGITAL_BUTTONS = (
+    enums.Button.BUTTON_A,
+    enums.Button.BUTTON_B,
+    enums.Button.BUTTON_X,
+    enums.Button.BUTTON_Y,
+    enums.Button.BUTTON_Z,
+    enums.Button.BUTTON_L,
+    enums.Button.BUTTON_R,
+    enums.Button.BUTTON_START,
+    enums.Button.BUTTON_D_UP,
+    enums.Button.BUTTON_D_DOWN,
+    enums.Button.BUTTON_D_LEFT,
+    enums.Button.BUTTON_D_RIGHT,
+)
+
+
+_BUTTON_MASK = dict(framedecoder.BUTTON_MASKS)
+# The Gamecube poll uses the same bits, but has no d-pad
+_GAMECUBE_BUTTONS = framedecoder.ALL_BUTTONS & ~0x000F
+
+
+class ButtonView(MutableMapping):
+    """The buttons of a ControllerState, looked at as a dict of enums.Button to bool
+
+    Reads and writes go straight through to the state's `buttons` bitmask"""
+
+    __slots__ = ("_state",)
+
+    def __init__(self, state):
+        self._state = state
+
+    def __getitem__(self, button):
+        return bool(self._state.buttons & _BUTTON_MASK[button])
+
+    def __setitem__(self, button, pressed):
+        mask = _BUTTON_MASK[button]
+        if pressed:
+            self._state.buttons |= mask
+        else:
+            self._state.buttons &= ~mask
+
+    def __delitem__(self, button):
+        raise TypeError("Buttons can't be removed from a controller")
+
+    def __iter__(self):
+        return iter(_DIGITAL_BUTTONS)
+
+    def __len__(self):
+        return len(_DIGITAL_BUTTONS)
+
+    def __repr__(self):
+        return repr(dict(self))
 
 
 class ControllerState:
     """A snapshot of the state of a virtual controller"""
 
+    __slots__ = (
+        "buttons",
+        "main_stick",
+        "c_stick",
+        "raw_main_stick",
+        "l_shoulder",
+        "r_shoulder",
+        "_button_view",
+    )
+
     def __init__(self):
-        __slots__ = ("button", "main_stick", "c_stick", "l_shoulder", "r_shoulder")
-        self.button = dict()
-        """(dict of enums.Button to bool): For the each Button as key, tells you if the button is pressed."""
-        # Boolean buttons
-        self.button[enums.Button.BUTTON_A] = False
-        self.button[enums.Button.BUTTON_B] = False
-        self.button[enums.Button.BUTTON_X] = False
-        self.button[enums.Button.BUTTON_Y] = False
-        self.button[enums.Button.BUTTON_Z] = False
-        self.button[enums.Button.BUTTON_L] = False
-        self.button[enums.Button.BUTTON_R] = False
-        self.button[enums.Button.BUTTON_START] = False
-        self.button[enums.Button.BUTTON_D_UP] = False
-        self.button[enums.Button.BUTTON_D_DOWN] = False
-        self.button[enums.Button.BUTTON_D_LEFT] = False
-        self.button[enums.Button.BUTTON_D_RIGHT] = False
+        self.buttons = 0
+        """(int): Bitmask of the pressed buttons, laid out like framedecoder.BUTTON_MASKS"""
         # Analog sticks
         self.main_stick = (0.5, 0.5)
         """(pair of floats): The main stick's x,y position. Ranges from 0->1, 0.5 is neutral"""
@@ -49,46 +104,51 @@ class ControllerState:
         """(float): L shoulder analog press. Ranges from 0 (not pressed) to 1 (fully pressed)"""
         self.r_shoulder = 0
         """(float): R shoulder analog press. Ranges from 0 (not pressed) to 1 (fully pressed)"""
+        self._button_view = ButtonView(self)
+
+    @property
+    def button(self):
+        """(ButtonView): For the each Button as key, tells you if the button is pressed. Can be written to"""
+        return self._button_view
+
+    def __copy__(self):
+        # The default copy would share the button view, and so the original's buttons
+        state = ControllerState()
+        state.buttons = self.buttons
+        state.main_stick = self.main_stick
+        state.c_stick = self.c_stick
+        state.raw_main_stick = self.raw_main_stick
+        state.l_shoulder = self.l_shoulder
+        state.r_shoulder = self.r_shoulder
+        return state
+
+    def reset(self):
+        """Release all the buttons and center the sticks, in place"""
+        self.buttons = 0
+        self.main_stick = (0.5, 0.5)
+        self.c_stick = (0.5, 0.5)
+        self.raw_main_stick = (0, 0)
+        self.l_shoulder = 0
+        self.r_shoulder = 0
+
+    def _gamecube_values(self):
+        """The controller state as the fields of a Gamecube controller poll"""
+        return (
+            0x0080 | (self.buttons & _GAMECUBE_BUTTONS),
+            # Convert from a float 0-1 to int 1-255
+            int(max(min(self.main_stick[0], 1), 0) * 254) + 1,
+            int(max(min(self.main_stick[1], 1), 0) * 254) + 1,
+            int(max(min(self.c_stick[0], 1), 0) * 254) + 1,
+            int(max(min(self.c_stick[1], 1), 0) * 254) + 1,
+            # Convert from a float 0-1 to int 0-255
+            #   The max/min thing just ensures the value is between 0 and 1
+            int(max(min(self.l_shoulder, 1), 0) * 255),
+            int(max(min(self.r_shoulder, 1), 0) * 255),
+        )
 
     def toBytes(self):
         """Serialize the controller state into an 8 byte sequence that the Gamecube uses"""
-        buttons_total = 0x0080
-        if self.button[enums.Button.BUTTON_A]:
-            buttons_total += 0x0100
-        if self.button[enums.Button.BUTTON_B]:
-            buttons_total += 0x0200
-        if self.button[enums.Button.BUTTON_X]:
-            buttons_total += 0x0400
-        if self.button[enums.Button.BUTTON_Y]:
-            buttons_total += 0x0800
-        if self.button[enums.Button.BUTTON_Z]:
-            buttons_total += 0x0010
-        if self.button[enums.Button.BUTTON_L]:
-            buttons_total += 0x0040
-        if self.button[enums.Button.BUTTON_R]:
-            buttons_total += 0x0020
-        if self.button[enums.Button.BUTTON_START]:
-            buttons_total += 0x1000
-
-        buffer = pack(">H", buttons_total)
-
-        # Convert from a float 0-1 to int 1-255
-        val = pack(">B", (int((max(min(self.main_stick[0], 1), 0) * 254)) + 1))
-        buffer += val
-        val = pack(">B", (int((max(min(self.main_stick[1], 1), 0) * 254)) + 1))
-        buffer += val
-        val = pack(">B", (int((max(min(self.c_stick[0], 1), 0) * 254)) + 1))
-        buffer += val
-        val = pack(">B", (int((max(min(self.c_stick[1], 1), 0) * 254)) + 1))
-        buffer += val
-
-        # Convert from a float 0-1 to int 0-255
-        #   The max/min thing just ensures the value is between 0 and 1
-        val = pack(">B", int(max(min(self.l_shoulder, 1), 0) * 255))
-        buffer += val
-        val = pack(">B", int(max(min(self.r_shoulder, 1), 0) * 255))
-        buffer += val
-        return buffer
+        return _GAMECUBE_STATE.pack(*self._gamecube_values())
 
     def __str__(self):
         string = ""
@@ -102,6 +162,92 @@ class ControllerState:
         return string
 
 
+class SerialPoller:
+    """Sends controller polls to a TAStm32 from a background thread
+
+    Waiting on the TAStm32 to acknowledge each poll takes a round trip over USB. Doing that
+    here, rather than in Controller.flush(), keeps it out of the bot's frame loop. If a new
+    poll is sent before the last one was written out, the older one is dropped (and counted)
+    so that the TAStm32 always gets the most recent state.
+    """
+
+    def __init__(self, tastm32):
+        """Start sending polls
+
+        Args:
+            tastm32 (serial.Serial): An already-connected TAStm32, in controller mode
+        """
+        self.polls = 0
+        """(int): Number of polls written to the TAStm32"""
+        self.missed_polls = 0
+        """(int): Number of polls dropped because a newer one came along before they were written"""
+        self.bad_acks = 0
+        """(int): Number of polls the TAStm32 didn't acknowledge properly"""
+        self.last_ack_latency = 0.0
+        """(float): Seconds between writing the most recent poll and its acknowledgement"""
+        self.max_ack_latency = 0.0
+        """(float): Longest time, in seconds, any poll took to be acknowledged"""
+        self._total_ack_latency = 0.0
+        self._tastm32 = tastm32
+        self._buffer = bytearray(_TASTM32_POLL.size)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def mean_ack_latency(self):
+        """(float): Average seconds taken for a poll to be acknowledged"""
+        if self.polls == 0:
+            return 0.0
+        return self._total_ack_latency / self.polls
+
+    def send(self, state):
+        """Queue up a poll of the given controller state. Doesn't block
+
+        Args:
+            state (ControllerState): The state to send
+        """
+        with self._lock:
+            _TASTM32_POLL.pack_into(self._buffer, 0, b"A", *state._gamecube_values())
+            if self._ready.is_set():
+                self.missed_polls += 1
+            self._ready.set()
+
+    def stop(self):
+        """Stop the background thread. Any poll not yet written is dropped"""
+        self._running = False
+        self._ready.set()
+        try:
+            self._tastm32.cancel_read()
+        except (AttributeError, NotImplementedError):
+            pass
+        self._thread.join(timeout=1)
+
+    def _run(self):
+        poll = bytearray(_TASTM32_POLL.size)
+        while True:
+            self._ready.wait()
+            if not self._running:
+                return
+            with self._lock:
+                poll[:] = self._buffer
+                self._ready.clear()
+            start = time.perf_counter()
+            self._tastm32.write(poll)
+            cmd = self._tastm32.read(1)
+            latency = time.perf_counter() - start
+            if not self._running:
+                return
+            self.polls += 1
+            self.last_ack_latency = latency
+            self.max_ack_latency = max(self.max_ack_latency, latency)
+            self._total_ack_latency += latency
+            if cmd != b"A":
+                self.bad_acks += 1
+
+
 class Controller:
     """Manages virtual controller state and button presses
 
@@ -115,6 +261,8 @@ class Controller:
         port,
         type=enums.ControllerType.STANDARD,
         serial_device="/dev/ttyACM0",
+        resync_interval=0,
+        serial_thread=True,
     ):
         """Create a new virtual controller
 
@@ -122,6 +270,11 @@ class Controller:
             console (console.Console): A console object to attach the controller to
             port (int): Which controller port to plug into. Must be 1-4.
             type (enums.ControllerType): The type of controller this is
+            resync_interval (int): Only inputs that have changed since they were last sent
+                are written to Dolphin. Every this many flushes, send the whole controller
+                state anyway, in case the two ever get out of sync. 0 means never
+            serial_thread (bool): For a TAStm32, send polls from a background thread rather
+                than waiting on each one to be acknowledged in flush(). See SerialPoller
         """
         self._is_dolphin = console.system == "dolphin"
         if self._is_dolphin:
@@ -140,6 +293,14 @@ class Controller:
                 sys.exit(-1)
 
         self.port = port
+        self.resync_interval = resync_interval
+        """(int): Send the whole controller state every this many flushes. 0 means never"""
+        self._pending = {}
+        self._sent = {}
+        self._flushes = 0
+        self._serial_thread = serial_thread
+        self.serial_poller = None
+        """(SerialPoller): Sends polls to the TAStm32, once connected. Has stats on its acks"""
         self.prev = ControllerState()
         self.current = ControllerState()
         self.logger = console.logger
@@ -162,7 +323,8 @@ class Controller:
         """
         if self._type == enums.ControllerType.STANDARD:
             # Add ourselves to the console's controller list
-            self._console.controllers.append(self)
+            if self not in self._console.controllers:
+                self._console.controllers.append(self)
 
             if self._is_dolphin:
                 if platform.system() == "Windows":
@@ -214,16 +376,23 @@ class Controller:
                         "ERROR: TAStm32 did not set to GCN mode. Try power cycling it."
                     )
                     return False
+                if self._serial_thread:
+                    self.serial_poller = SerialPoller(self.tastm32)
                 return True
         else:
             return True
 
     def disconnect(self):
         """Disconnects the controller from the console"""
+        if getattr(self, "serial_poller", None):
+            self.serial_poller.stop()
+            self.serial_poller = None
         if self._is_dolphin:
             if self.pipe:
                 self.pipe.close()
                 self.pipe = None
+                self._pending.clear()
+                self._sent.clear()
 
     def simple_press(self, x, y, button):
         """Here is a simpler representation of a button press, in case
@@ -274,7 +443,7 @@ class Controller:
         if self._is_dolphin:
             if not self.pipe:
                 return
-            self._write(command)
+            self._pending[button] = command
 
     def release_button(self, button):
         """Release a single button
@@ -291,7 +460,7 @@ class Controller:
         if self._is_dolphin:
             if not self.pipe:
                 return
-            self._write(command)
+            self._pending[button] = command
 
     def press_shoulder(self, button, amount):
         """Press the analog shoulder buttons to a given amount
@@ -315,7 +484,7 @@ class Controller:
         if self._is_dolphin:
             if not self.pipe:
                 return
-            self._write(command)
+            self._pending[("SET", button)] = command
 
     def tilt_analog(self, button, x, y):
         """Tilt one of the analog sticks to a given (x,y) value
@@ -335,7 +504,7 @@ class Controller:
         if self._is_dolphin:
             if not self.pipe:
                 return
-            self._write(command)
+            self._pending[("SET", button)] = command
 
     def tilt_analog_unit(self, button, x, y):
         """Tilt one of the analog sticks to a given (x,y) value, normalized to a unit vector
@@ -366,7 +535,7 @@ class Controller:
         if self._is_dolphin:
             if not self.pipe:
                 return
-            self._write(command)
+            self._pending[("SET", button)] = command
 
     # Left around for compat reasons. Might disappear at any time
     #   left undocumented. Just use release_all()
@@ -398,24 +567,14 @@ class Controller:
         if self._is_dolphin:
             if not self.pipe:
                 return
-            command = "RELEASE A" + "\n"
-            command += "RELEASE B" + "\n"
-            command += "RELEASE X" + "\n"
-            command += "RELEASE Y" + "\n"
-            command += "RELEASE Z" + "\n"
-            command += "RELEASE L" + "\n"
-            command += "RELEASE R" + "\n"
-            command += "RELEASE START" + "\n"
-            command += "RELEASE D_UP" + "\n"
-            command += "RELEASE D_DOWN" + "\n"
-            command += "RELEASE D_LEFT" + "\n"
-            command += "RELEASE D_RIGHT" + "\n"
-            command += "SET MAIN .5 .5" + "\n"
-            command += "SET C .5 .5" + "\n"
-            command += "SET L 0" + "\n"
-            command += "SET R 0" + "\n"
-            # Send the presses to dolphin
-            self._write(command)
+            # Queue the presses up for dolphin. Written the same way the other functions
+            #   would, so that they're recognized as unchanged if they already were
+            for button in _DIGITAL_BUTTONS:
+                self._pending[button] = "RELEASE " + button.value + "\n"
+            for button in (enums.Button.BUTTON_MAIN, enums.Button.BUTTON_C):
+                self._pending[("SET", button)] = "SET " + button.value + " 0.5 0.5\n"
+            for button in (enums.Button.BUTTON_L, enums.Button.BUTTON_R):
+                self._pending[("SET", button)] = "SET " + button.value + " 0\n"
         if self.logger:
             self.logger.log("Buttons Pressed", "Empty Input", concat=True)
 
@@ -432,18 +591,34 @@ class Controller:
     def flush(self):
         """Actually send the button presses to the console
 
-        Up until this point, any buttons you 'press' are just queued in a pipe.
-        It doesn't get sent to the console until you flush
+        Up until this point, any buttons you 'press' are just queued up in memory.
+        They're sent to the console all together, in a single write, when you flush.
+        Only the inputs that differ from what was last sent are actually written
         """
         # Move the current controller state into the previous one
         self.prev = copy.copy(self.current)
 
         if self._is_dolphin:
-            self._write("FLUSH\n")
+            if not self.pipe:
+                self._pending.clear()
+                return
+            if self.resync_interval and self._flushes % self.resync_interval == 0:
+                self._sent.update(self._pending)
+                commands = list(self._sent.values())
+            else:
+                commands = []
+                for key, command in self._pending.items():
+                    if self._sent.get(key) != command:
+                        commands.append(command)
+                        self._sent[key] = command
+            self._pending.clear()
+            self._flushes += 1
+            commands.append("FLUSH\n")
+            self._write("".join(commands))
             if platform.system() != "Windows":
-                if not self.pipe:
-                    return
                 self.pipe.flush()
+        elif self.serial_poller:
+            self.serial_poller.send(self.current)
         else:
             # Command for "send single controller poll" is 'A'
             # Serialize controller state into bytes and send
@@ -0,0 +1,261 @@
+"""Turn a whole directory of SLP replays into fixed-size training shards
+
+Replays are read in parallel over a pool of worker processes. Each player-frame becomes one
+row of SHARD_DTYPE, and rows are written out in shards of a fixed number of rows, as plain
+.npy files so they can be opened with `np.load(path, mmap_mode="r")`. A manifest.json next
+to the shards records which game each row came from, and why any files failed.
+
+Can be run from the command line:
+
+    python -m melee.corpus REPLAY_DIRECTORY OUTPUT_DIRECTORY --workers 16
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from melee import replay
+
+SHARD_DTYPE = np.dtype(
+    [("game", np.int32), ("port", np.uint8), ("nana", np.bool_)]
+    + replay.PLAYER_DTYPE.descr
+)
+"""(np.dtype): A single row of a shard. One player on one frame of one game
+
+`game` indexes into the manifest's list of games. The rest of the fields are the same as
+replay.PLAYER_DTYPE"""
+
+
+def find_replays(directory):
+    """Recursively find all the SLP files in a directory, in a stable order"""
+    paths = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.lower().endswith(".slp"):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def _read_replay(job):
+    """Worker process entry point. Reads one replay into shard rows
+
+    Never raises. Corrupt files come back with a failure reason instead, so one bad file
+    can't take down the worker (or the rest of the run)
+    """
+    path, allow_old_version = job
+    start = time.perf_counter()
+    try:
+        columns = replay.read_columns(path, allow_old_version=allow_old_version)
+        tables = []
+        for nana, players in ((False, columns.players), (True, columns.nana)):
+            for port, table in players.items():
+                rows = np.zeros(len(table), dtype=SHARD_DTYPE)
+                rows["port"] = port
+                rows["nana"] = nana
+                for name in table.dtype.names:
+                    rows[name] = table[name]
+                tables.append(rows)
+        rows = np.concatenate(tables) if tables else np.zeros(0, dtype=SHARD_DTYPE)
+        info = {
+            "path": path,
+            "slp_version": columns.slp_version,
+            "stage": columns.stage.name,
+            "frames": len(columns.frames),
+            "characters": {
+                str(port): int(table["character"][0])
+                for port, table in columns.players.items()
+                if len(table)
+            },
+            "startAt": columns.startAt,
+        }
+    # Corrupt files fail in all sorts of ways. Report them rather than crash
+    except Exception as error:  # pylint: disable=broad-except
+        reason = type(error).__name__ + ": " + str(error)
+        return path, None, None, time.perf_counter() - start, reason
+    return path, info, rows, time.perf_counter() - start, None
+
+
+class ShardWriter:
+    """Buffers rows and writes them out as shards of exactly `shard_size` rows
+
+    The final shard holds whatever is left over, so may be smaller.
+    """
+
+    def __init__(self, directory, shard_size):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.shards = []
+        """(list of dict): The shards written so far. Each has a file name and row count"""
+        self.rows_written = 0
+        self._pending = []
+        self._pending_rows = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, rows):
+        """Queue up rows to be written, writing out any shards that are now full"""
+        self._pending.append(rows)
+        self._pending_rows += len(rows)
+        while self._pending_rows >= self.shard_size:
+            self._write(self.shard_size)
+
+    def close(self):
+        """Write out any remaining rows as a final (partial) shard"""
+        if self._pending_rows > 0:
+            self._write(self._pending_rows)
+
+    def _write(self, count):
+        buffered = np.concatenate(self._pending)
+        shard, rest = buffered[:count], buffered[count:]
+        self._pending = [rest] if len(rest) else []
+        self._pending_rows = len(rest)
+
+        name = "shard-%05d.npy" % len(self.shards)
+        path = os.path.join(self.directory, name)
+        # Write to a temp file first, so a half-written shard is never mistaken for a real one
+        with open(path + ".tmp", "wb") as shardfile:
+            np.save(shardfile, shard)
+        os.replace(path + ".tmp", path)
+        self.shards.append({"file": name, "rows": len(shard)})
+        self.rows_written += len(shard)
+
+
+def ingest(
+    paths,
+    output_directory,
+    workers=None,
+    shard_size=1_000_000,
+    allow_old_version=False,
+    verbose=True,
+):
+    """Read the given replays in parallel and write them out as shards plus a manifest
+
+    Args:
+        paths (list of str): SLP files to read
+        output_directory (str): Where to write the shards and manifest.json
+        workers (int): Number of worker processes. Defaults to one per CPU
+        shard_size (int): Number of rows (player-frames) per shard
+        allow_old_version (bool): Accept SLP files older than 3.0.0
+        verbose (bool): Print a line of progress for every file
+
+    Returns:
+        dict: The manifest that was written to manifest.json
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = ShardWriter(output_directory, shard_size)
+    games, failures = [], []
+    start = time.perf_counter()
+
+    jobs = [(path, allow_old_version) for path in paths]
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.imap_unordered(_read_replay, jobs, chunksize=4)
+        for done, (path, info, rows, seconds, reason) in enumerate(results, 1):
+            if reason is None:
+                info["game"] = len(games)
+                info["first_row"] = writer.rows_written + writer._pending_rows
+                info["rows"] = len(rows)
+                info["seconds"] = round(seconds, 6)
+                rows["game"] = info["game"]
+                writer.add(rows)
+                games.append(info)
+                status = "OK"
+            else:
+                failures.append(
+                    {"path": path, "reason": reason, "seconds": round(seconds, 6)}
+                )
+                status = "FAILED (" + reason + ")"
+            if verbose:
+                print(
+                    "[%d/%d] %s %.1f ms %s"
+                    % (done, len(jobs), path, seconds * 1000, status)
+                )
+    writer.close()
+
+    elapsed = time.perf_counter() - start
+    manifest = {
+        "dtype": SHARD_DTYPE.descr,
+        "shard_size": shard_size,
+        "shards": writer.shards,
+        "games": games,
+        "failures": failures,
+        "rows": writer.rows_written,
+        "seconds": round(elapsed, 3),
+        "workers": workers,
+    }
+    with open(os.path.join(output_directory, "manifest.json"), "w") as manifestfile:
+        json.dump(manifest, manifestfile, indent=1)
+
+    if verbose:
+        print(
+            "Read %d files (%d failed) into %d rows across %d shards in %.1f s (%.0f files/sec)"
+            % (
+                len(jobs),
+                len(failures),
+                writer.rows_written,
+                len(writer.shards),
+                elapsed,
+                len(jobs) / elapsed if elapsed > 0 else 0,
+            )
+        )
+    return manifest
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Convert a directory of SLP replays into training shards"
+    )
+    parser.add_argument(
+        "replays", help="Directory to (recursively) read SLP files from"
+    )
+    parser.add_argument("output", help="Directory to write shards and manifest.json to")
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="Number of worker processes. Defaults to one per CPU",
+    )
+    parser.add_argument(
+        "--shard-size",
+        "-s",
+        type=int,
+        default=1_000_000,
+        help="Rows (player-frames) per shard",
+    )
+    parser.add_argument(
+        "--allow-old-version",
+        action="store_true",
+        help="Also read SLP files older than 3.0.0",
+    )
+    parser.add_argument(
+        "--quiet", "-q", action="store_true", help="Don't print per-file progress"
+    )
+    args = parser.parse_args(argv)
+
+    paths = find_replays(args.replays)
+    if not paths:
+        print("No SLP files found in " + args.replays)
+        return 1
+    manifest = ingest(
+        paths,
+        args.output,
+        workers=args.workers,
+        shard_size=args.shard_size,
+        allow_old_version=args.allow_old_version,
+        verbose=not args.quiet,
+    )
+    if args.quiet:
+        print(
+            "%d games, %d failures, %d rows"
+            % (len(manifest["games"]), len(manifest["failures"]), manifest["rows"])
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
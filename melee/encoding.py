@@ -0,0 +1,131 @@
+"""A fixed, numeric encoding of the per-player state of a frame
+
+PlayerState is made of Python objects, which is convenient for bots but slow to store or
+move around in bulk. PLAYER_DTYPE packs the numeric parts of a PlayerState into a single
+NumPy structured row. The columnar replay reader, Console's frame history, and anything
+else that needs to store or ship player state as arrays all share this layout.
+"""
+
+import numpy as np
+
+PLAYER_DTYPE = np.dtype(
+    [
+        ("frame", np.int32),
+        ("character", np.uint8),
+        ("action", np.uint16),
+        ("action_frame", np.int32),
+        ("x", np.float32),
+        ("y", np.float32),
+        ("facing", np.bool_),
+        ("percent", np.int32),
+        ("shield_strength", np.float32),
+        ("stock", np.uint8),
+        ("is_powershield", np.bool_),
+        ("hitstun_frames_left", np.int32),
+        ("hitlag_left", np.int32),
+        ("on_ground", np.bool_),
+        ("jumps_left", np.uint8),
+        ("invulnerable", np.bool_),
+        ("invulnerability_left", np.int32),
+        ("off_stage", np.bool_),
+        ("moonwalkwarning", np.bool_),
+        ("iasa", np.bool_),
+        ("speed_air_x_self", np.float32),
+        ("speed_y_self", np.float32),
+        ("speed_x_attack", np.float32),
+        ("speed_y_attack", np.float32),
+        ("speed_ground_x_self", np.float32),
+        ("ecb_top_x", np.float32),
+        ("ecb_top_y", np.float32),
+        ("ecb_bottom_x", np.float32),
+        ("ecb_bottom_y", np.float32),
+        ("ecb_left_x", np.float32),
+        ("ecb_left_y", np.float32),
+        ("ecb_right_x", np.float32),
+        ("ecb_right_y", np.float32),
+        ("main_stick_x", np.float32),
+        ("main_stick_y", np.float32),
+        ("c_stick_x", np.float32),
+        ("c_stick_y", np.float32),
+        ("raw_main_stick_x", np.int8),
+        ("raw_main_stick_y", np.int8),
+        ("shoulder", np.float32),
+        ("buttons", np.uint16),
+    ]
+)
+"""(np.dtype): One row per frame of a single player. Mirrors the fields of PlayerState
+
+Controller inputs are flattened: `main_stick_x` is `controller_state.main_stick[0]` and so on.
+`shoulder` is the processed analog shoulder value (both l_shoulder and r_shoulder in Console),
+and `buttons` is the processed button bitmask, see framedecoder.BUTTON_MASKS.
+
+Enums are stored by value: `character` is `enums.Character.value` and `action` is
+`enums.Action.value`."""
+
+ABSENT = np.zeros(1, dtype=PLAYER_DTYPE)[0]
+ABSENT["frame"] = -10000
+"""(np.void): Stands in for a player that wasn't there on a frame. All zeros, except for a
+frame of -10000"""
+
+
+def player_record(player, frame):
+    """Encode a PlayerState as a tuple, in PLAYER_DTYPE field order
+
+    Assigning the tuple to an element of a PLAYER_DTYPE array stores the whole row at once.
+    Only the buttons in framedecoder.BUTTON_MASKS are encoded into `buttons`.
+
+    Args:
+        player (gamestate.PlayerState): The player to encode
+        frame (int): The frame number the player state is from
+
+    Returns:
+        tuple: The encoded row
+    """
+    controller_state = player.controller_state
+    main_stick = controller_state.main_stick
+    c_stick = controller_state.c_stick
+    raw_main_stick = controller_state.raw_main_stick
+    ecb = player.ecb
+    return (
+        frame,
+        player.character.value,
+        player.action.value,
+        player.action_frame,
+        player.position.x,
+        player.position.y,
+        player.facing,
+        player.percent,
+        player.shield_strength,
+        player.stock,
+        player.is_powershield,
+        player.hitstun_frames_left,
+        player.hitlag_left,
+        player.on_ground,
+        player.jumps_left,
+        player.invulnerable,
+        player.invulnerability_left,
+        player.off_stage,
+        player.moonwalkwarning,
+        player.iasa,
+        player.speed_air_x_self,
+        player.speed_y_self,
+        player.speed_x_attack,
+        player.speed_y_attack,
+        player.speed_ground_x_self,
+        ecb.top.x,
+        ecb.top.y,
+        ecb.bottom.x,
+        ecb.bottom.y,
+        ecb.left.x,
+        ecb.left.y,
+        ecb.right.x,
+        ecb.right.y,
+        main_stick[0],
+        main_stick[1],
+        c_stick[0],
+        c_stick[1],
+        raw_main_stick[0],
+        raw_main_stick[1],
+        controller_state.l_shoulder,
+        controller_state.buttons,
+    )
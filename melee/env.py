@@ -0,0 +1,406 @@
+"""Gym-style environments for training bots
+
+MeleeEnv wraps a Console and its Controllers as a reinforcement learning environment, with
+the familiar reset() / step(action) interface. It gets through the menus on its own, so every
+episode is one game, from the first frame until a player runs out of stocks or the game ends.
+
+VecMeleeEnv runs many MeleeEnvs at once, each (and its Dolphin) in its own subprocess.
+Observations, actions, rewards and done flags are all passed through one block of shared
+memory, so a step of every environment only sends a few bytes down each worker's pipe.
+
+Observations are NumPy arrays of encoding.PLAYER_DTYPE, one row per controller port (see
+consolepool.ConsolePool.observe()). Actions are ACTION_DTYPE records.
+
+Needs Python 3.8 or newer, for shared memory. So it isn't imported along with the rest of
+libmelee: use `import melee.env`.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from melee import enums, framedecoder
+from melee.console import Console
+from melee.consolepool import ConsolePool
+from melee.controller import Controller
+from melee.encoding import PLAYER_DTYPE
+from melee.menuhelper import MenuHelper
+
+ACTION_DTYPE = np.dtype(
+    [
+        ("main_stick_x", np.float32),
+        ("main_stick_y", np.float32),
+        ("c_stick_x", np.float32),
+        ("c_stick_y", np.float32),
+        ("shoulder", np.float32),
+        ("buttons", np.uint16),
+    ]
+)
+"""(np.dtype): A single action: the whole state of a controller for one frame
+
+Same fields (and meanings) as the controller fields of encoding.PLAYER_DTYPE. Sticks range
+from 0 to 1, with 0.5 as neutral. `shoulder` is the analog press of L, and `buttons` is a
+bitmask of framedecoder.BUTTON_MASKS"""
+
+PORTS = 4
+"""(int): Number of rows (controller ports) in an observation"""
+
+
+def neutral_action():
+    """An action with nothing pressed and the sticks centered"""
+    action = np.zeros((), dtype=ACTION_DTYPE)
+    for field in ("main_stick_x", "main_stick_y", "c_stick_x", "c_stick_y"):
+        action[field] = 0.5
+    return action
+
+
+def default_reward(previous, current, port):
+    """Reward damage dealt and stocks taken, and penalize the same happening to us
+
+    Args:
+        previous (np.ndarray): The observation before the step
+        current (np.ndarray): The observation after the step
+        port (int): The bot's controller port
+
+    Returns:
+        float: Percent dealt minus percent taken (in units of 100%), plus stocks taken
+            minus stocks lost
+    """
+    reward = 0.0
+    for row in range(PORTS):
+        if current[row]["frame"] == -10000 or previous[row]["frame"] == -10000:
+            continue
+        # Percent goes back to 0 on losing a stock. That's not healing
+        damage = max(0.0, float(current[row]["percent"] - previous[row]["percent"]))
+        stocks = int(previous[row]["stock"]) - int(current[row]["stock"])
+        sign = -1 if row == port - 1 else 1
+        reward += sign * (damage / 100 + stocks)
+    return reward
+
+
+def apply_action(controller, action):
+    """Set a controller to the state given by an action
+
+    Args:
+        controller (controller.Controller): The controller to press buttons on
+        action (np.ndarray): An ACTION_DTYPE record
+    """
+    controller.tilt_analog(
+        enums.Button.BUTTON_MAIN,
+        float(action["main_stick_x"]),
+        float(action["main_stick_y"]),
+    )
+    controller.tilt_analog(
+        enums.Button.BUTTON_C, float(action["c_stick_x"]), float(action["c_stick_y"])
+    )
+    controller.press_shoulder(enums.Button.BUTTON_L, float(action["shoulder"]))
+    buttons = int(action["buttons"])
+    for button, mask in framedecoder.BUTTON_MASKS:
+        if buttons & mask:
+            controller.press_button(button)
+        else:
+            controller.release_button(button)
+
+
+class MeleeEnv:
+    """A single game of Melee as an environment: a bot against a CPU"""
+
+    def __init__(
+        self,
+        console_kwargs,
+        run_kwargs=None,
+        port=1,
+        opponent_port=2,
+        character=enums.Character.FOX,
+        opponent_character=enums.Character.FOX,
+        stage=enums.Stage.FINAL_DESTINATION,
+        opponent_cpu_level=9,
+        reward=default_reward,
+    ):
+        """Create an environment. Dolphin isn't started until the first reset()
+
+        Args:
+            console_kwargs (dict): Arguments to make the console.Console with
+            run_kwargs (dict): Arguments to console.Console.run(), such as iso_path. None to
+                not run Dolphin, and instead connect to one that's already running
+            port (int): Controller port of the bot
+            opponent_port (int): Controller port of the CPU opponent
+            character (enums.Character): The bot's character
+            opponent_character (enums.Character): The CPU's character
+            stage (enums.Stage): The stage to play on
+            opponent_cpu_level (int): The CPU's level
+            reward (callable): Called as reward(previous, current, port) with the
+                observations before and after each step, to give its reward. Must be
+                picklable (a module level function) for use in a VecMeleeEnv
+
+        Note:
+            A "file" system console works too. Actions are ignored, and each episode is
+            the replay itself. Handy for trying out a training pipeline without Dolphin.
+        """
+        self.console_kwargs = console_kwargs
+        self.run_kwargs = run_kwargs
+        self.port = port
+        """(int): Controller port of the bot"""
+        self.opponent_port = opponent_port
+        self.character = character
+        self.opponent_character = opponent_character
+        self.stage = stage
+        self.opponent_cpu_level = opponent_cpu_level
+        self.reward = reward
+        self.console = None
+        """(console.Console): The console being played on. None before the first reset()"""
+        self.controller = None
+        """(controller.Controller): The bot's controller. None for SLP files"""
+        self.opponent = None
+        self._observation = None
+        self._game_over = False
+
+    def _start(self):
+        """Make the console and controllers, run Dolphin and connect to it"""
+        self.console = Console(**self.console_kwargs)
+        if self.console.system == "file":
+            if not self.console.connect():
+                raise RuntimeError("Could not read SLP file " + str(self.console.path))
+            return
+        self.controller = Controller(self.console, self.port)
+        self.opponent = Controller(self.console, self.opponent_port)
+        if self.run_kwargs is not None:
+            self.console.run(**self.run_kwargs)
+        if not self.console.connect():
+            raise RuntimeError("Could not connect to the console")
+        self.controller.connect()
+        self.opponent.connect()
+
+    def reset(self):
+        """Get to the start of a new game, going through the menus as needed
+
+        Returns:
+            np.ndarray: The first observation of the game
+        """
+        if self.console is None or (self._game_over and self.controller is None):
+            # An SLP file can't be played again. Just read it over from the start
+            if self.console is not None:
+                self.console.stop()
+            self._start()
+        while True:
+            gamestate = self.console.step()
+            if gamestate is None:
+                if self.controller is None:
+                    raise RuntimeError("SLP file has no frames in game")
+                continue
+            if gamestate.menu_state in (enums.Menu.IN_GAME, enums.Menu.SUDDEN_DEATH):
+                break
+            MenuHelper.menu_helper_simple(
+                gamestate,
+                self.controller,
+                self.character,
+                self.stage,
+                autostart=True,
+            )
+            MenuHelper.menu_helper_simple(
+                gamestate,
+                self.opponent,
+                self.opponent_character,
+                self.stage,
+                cpu_level=self.opponent_cpu_level,
+            )
+        self._game_over = False
+        self._observation = ConsolePool.observe([gamestate], PORTS)[0]
+        return self._observation
+
+    def step(self, action):
+        """Play a frame
+
+        Args:
+            action (np.ndarray): ACTION_DTYPE record for the bot's controller. None to leave
+                the controller as it is
+
+        Returns:
+            (np.ndarray, float, bool, dict): The observation, reward, whether the game is
+                over, and a dict of info (currently just the frame number)
+        """
+        if action is not None and self.controller is not None:
+            apply_action(self.controller, action)
+        previous = self._observation
+        while True:
+            gamestate = self.console.step()
+            if gamestate is not None or self.controller is None:
+                break
+        if gamestate is None:
+            # The end of the SLP file
+            self._game_over = True
+            return previous, 0.0, True, {"frame": int(previous[self.port - 1]["frame"])}
+
+        observation = ConsolePool.observe([gamestate], PORTS)[0]
+        present = observation["frame"] != -10000
+        self._game_over = gamestate.menu_state not in (
+            enums.Menu.IN_GAME,
+            enums.Menu.SUDDEN_DEATH,
+        ) or bool(np.any(present & (observation["stock"] == 0)))
+        reward = self.reward(previous, observation, self.port)
+        self._observation = observation
+        return observation, reward, self._game_over, {"frame": gamestate.frame}
+
+    def close(self):
+        """Stop the console (and Dolphin, if it was run)"""
+        if self.console is not None:
+            self.console.stop()
+            self.console = None
+
+
+# Everything the parent and a worker exchange about one environment, per step
+_SLOT_DTYPE = np.dtype(
+    [
+        ("observation", PLAYER_DTYPE, (PORTS,)),
+        ("action", ACTION_DTYPE),
+        ("reward", np.float32),
+        ("done", np.bool_),
+    ]
+)
+
+
+def _run_env(env, slot, command):
+    """Carry out a command on an environment, reading and writing its shared slot"""
+    if command == "reset":
+        slot["observation"] = env.reset()
+        slot["reward"] = 0
+        slot["done"] = False
+        return {}
+    observation, reward, done, info = env.step(slot["action"].copy())
+    if done:
+        # Start the next game right away, like gym's vector environments
+        info["final_observation"] = observation
+        observation = env.reset()
+    slot["observation"] = observation
+    slot["reward"] = reward
+    slot["done"] = done
+    return info
+
+
+def _worker(index, env_kwargs, memory, count, connection):
+    """Subprocess entry point. Runs one MeleeEnv, taking commands from the pipe"""
+    slots = np.ndarray(count, dtype=_SLOT_DTYPE, buffer=memory.buf)
+    env = MeleeEnv(**env_kwargs)
+    try:
+        while True:
+            command = connection.recv()
+            if command == "close":
+                break
+            try:
+                connection.send(_run_env(env, slots[index], command))
+            except Exception as error:  # pylint: disable=broad-except
+                connection.send(error)
+    finally:
+        env.close()
+        del slots
+        memory.close()
+        connection.close()
+
+
+class VecMeleeEnv:
+    """Many MeleeEnvs, stepped together, each in its own subprocess"""
+
+    def __init__(self, env_kwargs, processes=True):
+        """Start the environments
+
+        Args:
+            env_kwargs (list of dict): Arguments to make each MeleeEnv with
+            processes (bool): Run each environment in its own subprocess. Otherwise they're
+                all run in this process, one after another. Mostly useful for debugging
+        """
+        self.num_envs = len(env_kwargs)
+        """(int): Number of environments"""
+        self._memory = None
+        self._envs = []
+        self._connections = []
+        self._processes = []
+        if processes:
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=_SLOT_DTYPE.itemsize * max(1, self.num_envs)
+            )
+            self._slots = np.ndarray(
+                self.num_envs, dtype=_SLOT_DTYPE, buffer=self._memory.buf
+            )
+            for index, kwargs in enumerate(env_kwargs):
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=_worker,
+                    args=(index, kwargs, self._memory, self.num_envs, child),
+                    daemon=True,
+                )
+                process.start()
+                child.close()
+                self._connections.append(parent)
+                self._processes.append(process)
+        else:
+            self._slots = np.zeros(self.num_envs, dtype=_SLOT_DTYPE)
+            self._envs = [MeleeEnv(**kwargs) for kwargs in env_kwargs]
+
+    def _command(self, command):
+        """Have every environment carry out a command, and wait for them all"""
+        if not self._processes:
+            return [
+                _run_env(env, self._slots[index], command)
+                for index, env in enumerate(self._envs)
+            ]
+        for connection in self._connections:
+            connection.send(command)
+        infos = [connection.recv() for connection in self._connections]
+        for info in infos:
+            if isinstance(info, Exception):
+                raise info
+        return infos
+
+    def reset(self):
+        """Start a new game in every environment
+
+        Returns:
+            np.ndarray: Observations, shaped (num_envs, PORTS), of encoding.PLAYER_DTYPE
+        """
+        self._command("reset")
+        return self._slots["observation"].copy()
+
+    def step(self, actions):
+        """Play a frame in every environment
+
+        Environments whose game ended are reset straight away. Their returned observation is
+        then the first of the next game, and the last of the old one is in the info dict as
+        "final_observation".
+
+        Args:
+            actions (np.ndarray): ACTION_DTYPE array, one action per environment
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray, list of dict): Observations, shaped
+                (num_envs, PORTS); rewards and done flags, shaped (num_envs,); and the info
+                dict of each environment
+        """
+        self._slots["action"] = actions
+        infos = self._command("step")
+        return (
+            self._slots["observation"].copy(),
+            self._slots["reward"].copy(),
+            self._slots["done"].copy(),
+            infos,
+        )
+
+    def close(self):
+        """Stop every environment and its subprocess"""
+        for connection in self._connections:
+            try:
+                connection.send("close")
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for env in self._envs:
+            env.close()
+        self._connections, self._processes, self._envs = [], [], []
+        if self._memory is not None:
+            del self._slots
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
@@ -3,15 +3,360 @@
 None of the functions and structures here are strictly necessary for making a bot.
 But they contain a vast and detailed amount of Melee-specific physics calculations
 and state information that would be difficult to discover on your own.
+
+The frame data itself is a NumPy array of FRAMEDATA_DTYPE rows, sorted by character, action
+and frame. It's compiled once from framedata.csv into a .npy file in the user's cache
+directory, and then memory mapped. So making a FrameData doesn't parse anything after the
+first time, and every bot process on a machine shares the same pages of it.
 """
 
 import csv
+import hashlib
 import os
 import math
-from collections import defaultdict
+import tempfile
+from collections import defaultdict, namedtuple
+from pathlib import Path
+
+import numpy as np
+
 from melee.enums import Action, Character, AttackState
 from melee import stages
 
+_FLOAT_FIELDS = ["size", "x", "y"]
+
+FRAMEDATA_DTYPE = np.dtype(
+    [("character", np.uint8), ("action", np.uint16), ("frame", np.int32)]
+    + [
+        (
+            "hitbox_%d_%s" % (hitbox, field),
+            np.bool_ if field == "status" else np.float64,
+        )
+        for hitbox in range(1, 5)
+        for field in ["status"] + _FLOAT_FIELDS
+    ]
+    + [
+        ("locomotion_x", np.float64),
+        ("locomotion_y", np.float64),
+        ("iasa", np.bool_),
+        ("facing_changed", np.bool_),
+        ("projectile", np.bool_),
+    ]
+)
+"""(np.dtype): One frame of one action of one character. The fields are the same as the
+columns of framedata.csv"""
+
+_PACKAGE_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+
+def default_cache_directory():
+    """The default place to keep compiled frame data. Under the user's cache directory"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(str(Path.home()), ".cache")
+    return os.path.join(base, "libmelee", "framedata")
+
+
+def compile_framedata(csv_path, destination):
+    """Compile a framedata CSV into a .npy file of FRAMEDATA_DTYPE, for load_framedata()
+
+    Args:
+        csv_path (str): The framedata.csv to read
+        destination (str): The .npy file to write. Written atomically, so processes loading
+            it at the same time never see half of it
+    """
+    with open(csv_path) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    store = np.zeros(len(rows), dtype=FRAMEDATA_DTYPE)
+    for name in FRAMEDATA_DTYPE.names:
+        if FRAMEDATA_DTYPE[name] == np.bool_:
+            store[name] = [row[name] == "True" for row in rows]
+        elif FRAMEDATA_DTYPE[name] == np.float64:
+            store[name] = [float(row[name]) for row in rows]
+        else:
+            store[name] = [int(row[name]) for row in rows]
+    # Sort by character, action, then frame. Where a frame is listed twice, the last one wins
+    order = np.lexsort((store["frame"], store["action"], store["character"]))
+    store = store[order]
+    key = _keys(store)
+    last = np.ones(len(store), dtype=bool)
+    last[:-1] = (key[1:] != key[:-1]) | (store["frame"][1:] != store["frame"][:-1])
+    store = store[last]
+
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as npyfile:
+            np.save(npyfile, store)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_framedata(csv_path=None, cache_directory=None):
+    """Memory map the compiled frame data, compiling it first if need be
+
+    The compiled .npy is kept in the cache directory, keyed on the CSV's path, size and
+    modification time. So changing or reinstalling the CSV compiles it afresh.
+
+    Args:
+        csv_path (str): The framedata CSV. Defaults to the one in the package
+        cache_directory (str): Where to compile to. Defaults to default_cache_directory()
+
+    Returns:
+        np.ndarray: Read-only array of FRAMEDATA_DTYPE
+    """
+    csv_path = csv_path or os.path.join(_PACKAGE_DIRECTORY, "framedata.csv")
+    stat = os.stat(csv_path)
+    key = "%s\0%d\0%d" % (os.path.abspath(csv_path), stat.st_size, stat.st_mtime_ns)
+    digest = hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+    compiled = os.path.join(
+        cache_directory or default_cache_directory(), digest + ".npy"
+    )
+    if not os.path.exists(compiled):
+        compile_framedata(csv_path, compiled)
+    return np.load(compiled, mmap_mode="r")
+
+
+SUMMARY_DTYPE = np.dtype(
+    [
+        ("character", np.uint8),
+        ("action", np.uint16),
+        ("start", np.int64),
+        ("stop", np.int64),
+        ("is_attack", np.bool_),
+        ("first_hitbox_frame", np.int32),
+        ("last_hitbox_frame", np.int32),
+        ("hitbox_count", np.int32),
+        ("iasa", np.int32),
+        ("frame_count", np.int32),
+    ]
+)
+"""(np.dtype): Summary of one action of one character, as made by summarize_framedata()
+
+`start` and `stop` are where its frames are in the store. The rest are what the FrameData
+methods of the same names return (before any of their special cases)"""
+
+ActionSummary = namedtuple("ActionSummary", SUMMARY_DTYPE.names[2:])
+"""A row of SUMMARY_DTYPE (without the character and action), as a namedtuple"""
+
+_NO_SUMMARY = ActionSummary(0, 0, False, -1, -1, 0, -1, -1)
+
+# A character's attacks as dense (action, frame) arrays, for in_range_batch()
+_AttackTable = namedtuple(
+    "_AttackTable",
+    [
+        "actions",
+        "present",
+        "locomotion_x",
+        "locomotion_y",
+        "hashitbox",
+        "hitbox_x",
+        "hitbox_y",
+        "hitbox_size",
+        "last_hitbox_frame",
+    ],
+)
+
+
+def summarize_framedata(store):
+    """Summarize every action of every character in the frame data, all at once
+
+    Args:
+        store (np.ndarray): Frame data, as from load_framedata()
+
+    Returns:
+        np.ndarray: One SUMMARY_DTYPE row per (character, action) in the store, in the same
+            order as the store
+    """
+    if not len(store):
+        return np.zeros(0, dtype=SUMMARY_DTYPE)
+    _, starts = np.unique(_keys(store), return_index=True)
+    summary = np.zeros(len(starts), dtype=SUMMARY_DTYPE)
+    summary["start"] = starts
+    summary["stop"] = np.append(starts[1:], len(store))
+    summary["character"] = store["character"][starts]
+    summary["action"] = store["action"][starts]
+
+    frame = store["frame"]
+    hashitbox = (
+        store["hitbox_1_status"]
+        | store["hitbox_2_status"]
+        | store["hitbox_3_status"]
+        | store["hitbox_4_status"]
+        | store["projectile"]
+    )
+    summary["is_attack"] = np.logical_or.reduceat(hashitbox, starts)
+    summary["frame_count"] = frame[summary["stop"] - 1]
+    # Frames are sorted, so the first (last) hitbox frame is the smallest (largest)
+    nothing = np.iinfo(np.int32).max
+    first = np.minimum.reduceat(np.where(hashitbox, frame, nothing), starts)
+    summary["first_hitbox_frame"] = np.where(first == nothing, -1, first)
+    summary["last_hitbox_frame"] = np.maximum.reduceat(
+        np.where(hashitbox, frame, -1), starts
+    )
+
+    # A new hitbox starts on each hitbox frame that doesn't come right after another one
+    counted = hashitbox & (frame >= 1)
+    follows = np.zeros(len(store), dtype=bool)
+    follows[1:] = counted[:-1] & (frame[1:] == frame[:-1] + 1)
+    follows[starts] = False
+    summary["hitbox_count"] = np.add.reduceat(counted & ~follows, starts)
+
+    iasa = np.minimum.reduceat(np.where(store["iasa"], frame, nothing), starts)
+    iasa = np.where(iasa == nothing, summary["frame_count"], iasa)
+    summary["iasa"] = np.where(summary["is_attack"], iasa, -1)
+    return summary
+
+
+# Which actions are grabs, rolls, B-moves and shields. For the scalar is_grab() etc, and
+#   ACTION_TABLES for looking up whole arrays of actions at once
+_GRABS = frozenset([Action.GRAB, Action.GRAB_RUNNING])
+# Command grabs. Yea, I know. The sword dance isn't the right name
+_CHARACTER_GRABS = {
+    Character.CPTFALCON: frozenset(
+        [Action.SWORD_DANCE_3_MID, Action.SWORD_DANCE_3_LOW]
+    ),
+    Character.GANONDORF: frozenset(
+        [Action.SWORD_DANCE_3_MID, Action.SWORD_DANCE_3_LOW]
+    ),
+    Character.BOWSER: frozenset(
+        [Action.NEUTRAL_B_ATTACKING_AIR, Action.SWORD_DANCE_3_MID]
+    ),
+    Character.YOSHI: frozenset(
+        [Action.NEUTRAL_B_CHARGING_AIR, Action.SWORD_DANCE_2_MID]
+    ),
+    Character.MEWTWO: frozenset([Action.SWORD_DANCE_2_MID, Action.SWORD_DANCE_3_HIGH]),
+}
+# Turns out that the actions we'd call a "roll" are fairly few. Let's just
+# hardcode them since it's just more cumbersome to do otherwise
+_ROLLS = frozenset(
+    [
+        Action.SPOTDODGE,
+        Action.ROLL_FORWARD,
+        Action.ROLL_BACKWARD,
+        Action.NEUTRAL_TECH,
+        Action.FORWARD_TECH,
+        Action.BACKWARD_TECH,
+        Action.GROUND_GETUP,
+        Action.TECH_MISS_UP,
+        Action.TECH_MISS_DOWN,
+        Action.EDGE_GETUP_SLOW,
+        Action.EDGE_GETUP_QUICK,
+        Action.EDGE_ROLL_SLOW,
+        Action.EDGE_ROLL_QUICK,
+        Action.GROUND_ROLL_FORWARD_UP,
+        Action.GROUND_ROLL_BACKWARD_UP,
+        Action.GROUND_ROLL_FORWARD_DOWN,
+        Action.GROUND_ROLL_BACKWARD_DOWN,
+        Action.SHIELD_BREAK_FLY,
+        Action.SHIELD_BREAK_FALL,
+        Action.SHIELD_BREAK_DOWN_U,
+        Action.SHIELD_BREAK_DOWN_D,
+        Action.SHIELD_BREAK_STAND_U,
+        Action.SHIELD_BREAK_STAND_D,
+        Action.TAUNT_RIGHT,
+        Action.TAUNT_LEFT,
+        Action.SHIELD_BREAK_TEETER,
+    ]
+)
+# Marth counter
+_CHARACTER_ROLLS = {
+    Character.MARTH: frozenset([Action.MARTH_COUNTER, Action.MARTH_COUNTER_FALLING])
+}
+# Don't consider peach float to be a B move
+#   But the rest of her float aerials ARE. Peach smashes also shouldn't be B moves
+_PEACH_NOT_BMOVES = frozenset(
+    [
+        Action.LASER_GUN_PULL,
+        Action.NEUTRAL_B_CHARGING,
+        Action.NEUTRAL_B_ATTACKING,
+        Action.SWORD_DANCE_2_MID,
+        Action.SWORD_DANCE_1,
+        Action.SWORD_DANCE_2_HIGH,
+    ]
+)
+_SHIELDS = frozenset(
+    [
+        Action.SHIELD,
+        Action.SHIELD_START,
+        Action.SHIELD_REFLECT,
+        Action.SHIELD_STUN,
+        Action.SHIELD_RELEASE,
+    ]
+)
+
+
+def _action_tables():
+    """Build ACTION_TABLES"""
+    # Every action but UNKNOWN_ANIMATION, which is way off at the end
+    actions = max(
+        action.value for action in Action if action != Action.UNKNOWN_ANIMATION
+    )
+    shape = (max(character.value for character in Character) + 1, actions + 1)
+    tables = {
+        name: np.zeros(shape, dtype=bool)
+        for name in ["grab", "roll", "bmove", "shield"]
+    }
+
+    tables["grab"][:, [action.value for action in _GRABS]] = True
+    for character, grabs in _CHARACTER_GRABS.items():
+        tables["grab"][character.value, [action.value for action in grabs]] = True
+    tables["roll"][:, [action.value for action in _ROLLS]] = True
+    for character, rolls in _CHARACTER_ROLLS.items():
+        tables["roll"][character.value, [action.value for action in rolls]] = True
+    tables["bmove"][
+        :,
+        [
+            action.value
+            for action in Action
+            if Action.LASER_GUN_PULL.value <= action.value
+            and action != Action.UNKNOWN_ANIMATION
+        ],
+    ] = True
+    tables["bmove"][
+        Character.PEACH.value, [action.value for action in _PEACH_NOT_BMOVES]
+    ] = False
+    tables["shield"][:, [action.value for action in _SHIELDS]] = True
+    for table in tables.values():
+        table.setflags(write=False)
+    return tables
+
+
+ACTION_TABLES = _action_tables()
+"""(dict of str to np.ndarray): Boolean tables of which actions are grabs ("grab"), rolls
+("roll"), B-moves ("bmove") and shielding ("shield"), indexed by [character, action] values.
+See classify_actions(), and the FrameData methods of the same names"""
+
+
+def classify_actions(kind, characters, actions):
+    """Look up the classification of many actions at once
+
+    For example, which frames of a replay (see replay.read_columns()) a player is rolling on:
+    `classify_actions("roll", columns["character"], columns["action"])`
+
+    Args:
+        kind (str): "grab", "roll", "bmove" or "shield". See is_grab(), is_roll(),
+            is_bmove() and is_shield()
+        characters (np.ndarray): Character values (or a single one, for all the actions)
+        actions (np.ndarray): Action values
+
+    Returns:
+        np.ndarray: Boolean array, the shape of characters and actions broadcast together.
+            False for actions that aren't known (including UNKNOWN_ANIMATION)
+    """
+    table = ACTION_TABLES[kind]
+    characters = np.asarray(characters, dtype=np.intp)
+    actions = np.asarray(actions, dtype=np.intp)
+    known = (actions >= 0) & (actions < table.shape[1])
+    return table[characters, np.where(known, actions, 0)] & known
+
+
+def _keys(store):
+    """Key of each row's character and action, as one int"""
+    return (store["character"].astype(np.uint32) << 16) | store["action"]
+
 
 class FrameData:
     """Set of helper functions and data structures for knowing Melee frame data
@@ -21,7 +366,14 @@ class FrameData:
         not necessarily be binary-compatible with in-game structures or values.
     """
 
-    def __init__(self, write=False):
+    def __init__(self, write=False, store=None):
+        """Load the frame data
+
+        Args:
+            write (bool): DEV USE ONLY. Record new frame data to CSVs in the current directory
+            store (np.ndarray): Frame data to use, as from load_framedata(). Defaults to the
+                frame data that comes with libmelee
+        """
         if write:
             self.csvfile = open("framedata.csv", "a")
             fieldnames = [
@@ -63,41 +415,23 @@ class FrameData:
             self.prevfacing = {}
             self.prevprojectilecount = {}
 
-        # Read the existing framedata
-        path = os.path.dirname(os.path.realpath(__file__))
-        self.framedata = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
-        with open(path + "/framedata.csv") as csvfile:
-            # A list of dicts containing the frame data
-            csvreader = list(csv.DictReader(csvfile))
-            # Build a series of nested dicts for faster read access
-            for frame in csvreader:
-                # Pull out the character, action, and frame
-                character = Character(int(frame["character"]))
-                action = Action(int(frame["action"]))
-                action_frame = int(frame["frame"])
-                self.framedata[character][action][action_frame] = {
-                    "hitbox_1_status": frame["hitbox_1_status"] == "True",
-                    "hitbox_1_size": float(frame["hitbox_1_size"]),
-                    "hitbox_1_x": float(frame["hitbox_1_x"]),
-                    "hitbox_1_y": float(frame["hitbox_1_y"]),
-                    "hitbox_2_status": frame["hitbox_2_status"] == "True",
-                    "hitbox_2_size": float(frame["hitbox_2_size"]),
-                    "hitbox_2_x": float(frame["hitbox_2_x"]),
-                    "hitbox_2_y": float(frame["hitbox_2_y"]),
-                    "hitbox_3_status": frame["hitbox_3_status"] == "True",
-                    "hitbox_3_size": float(frame["hitbox_3_size"]),
-                    "hitbox_3_x": float(frame["hitbox_3_x"]),
-                    "hitbox_3_y": float(frame["hitbox_3_y"]),
-                    "hitbox_4_status": frame["hitbox_4_status"] == "True",
-                    "hitbox_4_size": float(frame["hitbox_4_size"]),
-                    "hitbox_4_x": float(frame["hitbox_4_x"]),
-                    "hitbox_4_y": float(frame["hitbox_4_y"]),
-                    "locomotion_x": float(frame["locomotion_x"]),
-                    "locomotion_y": float(frame["locomotion_y"]),
-                    "iasa": frame["iasa"] == "True",
-                    "facing_changed": frame["facing_changed"] == "True",
-                    "projectile": frame["projectile"] == "True",
-                }
+        self.store = store if store is not None else load_framedata()
+        """(np.ndarray): All the frame data, as FRAMEDATA_DTYPE rows sorted by character,
+        action and frame. Memory mapped, and read-only"""
+        self.summary = summarize_framedata(self.store)
+        """(np.ndarray): SUMMARY_DTYPE row of each character's action in the store"""
+        # Most queries are answered straight out of the summaries, so keep them handy
+        self._summaries = dict(
+            zip(
+                _keys(self.summary).tolist(),
+                map(
+                    ActionSummary._make,
+                    self.summary[list(ActionSummary._fields)].tolist(),
+                ),
+            )
+        )
+        self._framedata = None
+        self._attack_tables = {}
 
         # read the character data csv
         self.characterdata = dict()
@@ -111,6 +445,36 @@ class FrameData:
                     line[key] = float(value)
                 self.characterdata[Character(line["CharacterIndex"])] = line
 
+    @property
+    def framedata(self):
+        """(dict): The frame data as nested dicts, keyed by character, action and then frame
+
+        Each frame is a dict of the framedata.csv columns. Kept for compatibility: it's built
+        from the store (slowly) the first time it's used. Prefer the FrameData methods, or
+        the store itself."""
+        if self._framedata is None:
+            self._framedata = defaultdict(
+                lambda: defaultdict(lambda: defaultdict(dict))
+            )
+            names = FRAMEDATA_DTYPE.names[3:]
+            for row in self.store.tolist():
+                character, action, action_frame = row[:3]
+                self._framedata[Character(character)][Action(action)][action_frame] = (
+                    dict(zip(names, row[3:]))
+                )
+        return self._framedata
+
+    def _summarize(self, character, action):
+        """The ActionSummary of the given action. All empty if there's no frame data for it"""
+        return self._summaries.get(
+            (int(character.value) << 16) | int(action.value), _NO_SUMMARY
+        )
+
+    def _frames(self, character, action):
+        """The store's rows for the given action, sorted by frame. Empty if there are none"""
+        summary = self._summarize(character, action)
+        return self.store[summary.start : summary.stop]
+
     def is_grab(self, character, action):
         """For the given character, is the supplied action a grab?
 
@@ -119,35 +483,7 @@ class FrameData:
             action (enums.Action): The action we're interested in
 
         This includes command grabs, such as Bowser's claw. Not just Z-grabs."""
-        if action in [Action.GRAB, Action.GRAB_RUNNING]:
-            return True
-
-        # Yea, I know. The sword dance isn't the right name
-        if character in [Character.CPTFALCON, Character.GANONDORF] and action in [
-            Action.SWORD_DANCE_3_MID,
-            Action.SWORD_DANCE_3_LOW,
-        ]:
-            return True
-
-        if character == Character.BOWSER and action in [
-            Action.NEUTRAL_B_ATTACKING_AIR,
-            Action.SWORD_DANCE_3_MID,
-        ]:
-            return True
-
-        if character == Character.YOSHI and action in [
-            Action.NEUTRAL_B_CHARGING_AIR,
-            Action.SWORD_DANCE_2_MID,
-        ]:
-            return True
-
-        if character == Character.MEWTWO and action in [
-            Action.SWORD_DANCE_2_MID,
-            Action.SWORD_DANCE_3_HIGH,
-        ]:
-            return True
-
-        return False
+        return action in _GRABS or action in _CHARACTER_GRABS.get(character, ())
 
     def is_roll(self, character, action):
         """For a given character, is the supplied action a roll?
@@ -162,43 +498,7 @@ class FrameData:
             character (enums.Character): The character we're interested in
             action (enums.Action): The action we're interested in
         """
-        # Marth counter
-        if character == Character.MARTH and action == Action.MARTH_COUNTER:
-            return True
-        if character == Character.MARTH and action == Action.MARTH_COUNTER_FALLING:
-            return True
-
-        # Turns out that the actions we'd call a "roll" are fairly few. Let's just
-        # hardcode them since it's just more cumbersome to do otherwise
-        rolls = [
-            Action.SPOTDODGE,
-            Action.ROLL_FORWARD,
-            Action.ROLL_BACKWARD,
-            Action.NEUTRAL_TECH,
-            Action.FORWARD_TECH,
-            Action.BACKWARD_TECH,
-            Action.GROUND_GETUP,
-            Action.TECH_MISS_UP,
-            Action.TECH_MISS_DOWN,
-            Action.EDGE_GETUP_SLOW,
-            Action.EDGE_GETUP_QUICK,
-            Action.EDGE_ROLL_SLOW,
-            Action.EDGE_ROLL_QUICK,
-            Action.GROUND_ROLL_FORWARD_UP,
-            Action.GROUND_ROLL_BACKWARD_UP,
-            Action.GROUND_ROLL_FORWARD_DOWN,
-            Action.GROUND_ROLL_BACKWARD_DOWN,
-            Action.SHIELD_BREAK_FLY,
-            Action.SHIELD_BREAK_FALL,
-            Action.SHIELD_BREAK_DOWN_U,
-            Action.SHIELD_BREAK_DOWN_D,
-            Action.SHIELD_BREAK_STAND_U,
-            Action.SHIELD_BREAK_STAND_D,
-            Action.TAUNT_RIGHT,
-            Action.TAUNT_LEFT,
-            Action.SHIELD_BREAK_TEETER,
-        ]
-        return action in rolls
+        return action in _ROLLS or action in _CHARACTER_ROLLS.get(character, ())
 
     def is_bmove(self, character, action):
         """For a given character, is the supplied action a 'B-Move'
@@ -212,27 +512,9 @@ class FrameData:
         # If we're missing it, don't call it a B move
         if action == Action.UNKNOWN_ANIMATION:
             return False
-
-        # Don't consider peach float to be a B move
-        #   But the rest of her float aerials ARE
-        if character == Character.PEACH and action in [
-            Action.LASER_GUN_PULL,
-            Action.NEUTRAL_B_CHARGING,
-            Action.NEUTRAL_B_ATTACKING,
-        ]:
-            return False
-        # Peach smashes also shouldn't be B moves
-        if character == Character.PEACH and action in [
-            Action.SWORD_DANCE_2_MID,
-            Action.SWORD_DANCE_1,
-            Action.SWORD_DANCE_2_HIGH,
-        ]:
+        if character == Character.PEACH and action in _PEACH_NOT_BMOVES:
             return False
-
-        if Action.LASER_GUN_PULL.value <= action.value:
-            return True
-
-        return False
+        return Action.LASER_GUN_PULL.value <= action.value
 
     # Returns boolean on if the given action is an attack (contains a hitbox)
     def is_attack(self, character, action):
@@ -244,18 +526,7 @@ class FrameData:
             character (enums.Character): The character we're interested in
             action (enums.Action): The action we're interested in
         """
-        # For each frame...
-        for _, frame in self.framedata[character][action].items():
-            if frame:
-                if (
-                    frame["hitbox_1_status"]
-                    or frame["hitbox_2_status"]
-                    or frame["hitbox_3_status"]
-                    or frame["hitbox_4_status"]
-                    or frame["projectile"]
-                ):
-                    return True
-        return False
+        return self._summarize(character, action).is_attack
 
     def is_shield(self, action):
         """Is the given action a Shielding action?
@@ -263,13 +534,7 @@ class FrameData:
         Args:
             action (enums.Action): The action we're interested in
         """
-        return action in [
-            Action.SHIELD,
-            Action.SHIELD_START,
-            Action.SHIELD_REFLECT,
-            Action.SHIELD_STUN,
-            Action.SHIELD_RELEASE,
-        ]
+        return action in _SHIELDS
 
     def max_jumps(self, character):
         """Returns the number of double-jumps the given character has.
@@ -299,13 +564,14 @@ class FrameData:
             action (enums.Action): The action we're interested in
             action_frame (int): The frame of the action we're interested in
         """
-        if not self.is_attack(character, action):
+        summary = self._summarize(character, action)
+        if not summary.is_attack:
             return AttackState.NOT_ATTACKING
 
-        if action_frame < self.first_hitbox_frame(character, action):
+        if action_frame < summary.first_hitbox_frame:
             return AttackState.WINDUP
 
-        if action_frame > self.last_hitbox_frame(character, action):
+        if action_frame > summary.last_hitbox_frame:
             return AttackState.COOLDOWN
 
         return AttackState.ATTACKING
@@ -530,6 +796,181 @@ class FrameData:
                     return i
         return 0
 
+    def _attack_table(self, character):
+        """The _AttackTable of all of the character's attacks. Made the first time it's needed"""
+        table = self._attack_tables.get(character)
+        if table is not None:
+            return table
+        summaries = self.summary[
+            (self.summary["character"] == character.value) & self.summary["is_attack"]
+        ]
+        actions = [Action(action) for action in summaries["action"].tolist()]
+        rows = np.concatenate(
+            [self.store[start:stop] for start, stop in summaries[["start", "stop"]]]
+            or [self.store[:0]]
+        )
+        # Which action of the table each row belongs to
+        index = np.repeat(
+            np.arange(len(summaries)), summaries["stop"] - summaries["start"]
+        )
+        frame = rows["frame"]
+        shape = (len(actions), int(summaries["frame_count"].max(initial=0)) + 1)
+
+        present = np.zeros(shape, dtype=bool)
+        present[index, frame] = True
+        locomotion_x = np.zeros(shape)
+        locomotion_x[index, frame] = rows["locomotion_x"]
+        locomotion_y = np.zeros(shape)
+        locomotion_y[index, frame] = rows["locomotion_y"]
+        hashitbox = np.zeros(shape, dtype=bool)
+        hitbox_x = np.zeros(shape + (4,))
+        hitbox_y = np.zeros(shape + (4,))
+        hitbox_size = np.zeros(shape + (4,))
+        for hitbox in range(4):
+            name = "hitbox_%d_" % (hitbox + 1)
+            hashitbox[index, frame] |= rows[name + "status"]
+            hitbox_x[index, frame, hitbox] = rows[name + "x"]
+            hitbox_y[index, frame, hitbox] = rows[name + "y"]
+            hitbox_size[index, frame, hitbox] = rows[name + "size"]
+
+        table = _AttackTable(
+            actions,
+            present,
+            locomotion_x,
+            locomotion_y,
+            hashitbox,
+            hitbox_x,
+            hitbox_y,
+            hitbox_size,
+            summaries["last_hitbox_frame"].astype(np.int64),
+        )
+        self._attack_tables[character] = table
+        return table
+
+    def in_range_batch(self, attacker, defender, stage, actions=None, action_frame=0):
+        """Calculates which of the attacker's attacks would hit the defender, all at once
+
+        Does the same as in_range(), as if the attacker were in each of the given actions,
+        but simulates all of them side by side, in one pass over the frames.
+
+        Args:
+            attacker (gamestate.PlayerState): The attacking player
+            defender (gamestate.PlayerState): The defending player
+            stage (enums.Stage): The stage being played on
+            actions (list of enums.Action): The attacks to check. Defaults to all of the
+                attacking character's attacks
+            action_frame (int): The frame of the attacks the attacker is on. 0 to start
+                them fresh
+
+        Returns:
+            dict of enums.Action to int: The frame that each attack will hit the defender on.
+                0 if it won't hit (or isn't an attack)
+
+        Note:
+            `in_range_batch(attacker, defender, stage, [attacker.action],
+            attacker.action_frame)` is the same as `in_range(attacker, defender, stage)`
+        """
+        table = self._attack_table(attacker.character)
+        if actions is None:
+            actions = table.actions
+            rows = np.arange(len(actions))
+        else:
+            lookup = {action: row for row, action in enumerate(table.actions)}
+            rows = np.array([lookup.get(action, -1) for action in actions], dtype=int)
+        hitframes = np.zeros(len(rows), dtype=int)
+        # Non-attacks never hit
+        known = rows >= 0
+        rows = rows[known]
+        if not len(rows):
+            return dict(zip(actions, hitframes.tolist()))
+
+        # Adjust the defender's hurtbox up a little, to be more centered.
+        #   the game keeps y coordinates based on the bottom of a character, not
+        #   their center. So we need to move up by one radius of the character's size
+        defender_size = float(self.characterdata[defender.character]["size"])
+        defender_x = defender.position.x
+        defender_y = defender.position.y + defender_size
+
+        # Each attack's running totals of how far the attacker will travel
+        count = len(rows)
+        onground = np.full(count, bool(attacker.on_ground))
+        attacker_x = np.full(count, float(attacker.position.x))
+        attacker_y = np.full(count, float(attacker.position.y))
+        if attacker.on_ground:
+            attacker_speed_x = np.full(count, float(attacker.speed_ground_x_self))
+        else:
+            attacker_speed_x = np.full(count, float(attacker.speed_air_x_self))
+        attacker_speed_y = np.full(count, float(attacker.speed_y_self))
+        facing = 1.0 if attacker.facing else -1.0
+
+        friction = self.characterdata[attacker.character]["Friction"]
+        gravity = self.characterdata[attacker.character]["Gravity"]
+        termvelocity = self.characterdata[attacker.character]["TerminalVelocity"]
+
+        lastframes = table.last_hitbox_frame[rows]
+        hit = np.zeros(count, dtype=int)
+        for i in range(action_frame + 1, int(lastframes.max()) + 1):
+            # Attacks still going (and not yet known to hit) that have this frame
+            active = (lastframes >= i) & (hit == 0) & table.present[rows, i]
+            if not active.any():
+                continue
+
+            # Figure out how much the attaker will be moving this frame
+            #   Is there any locomotion in the animation? If so, use that
+            locomotion_x = table.locomotion_x[rows, i]
+            locomotion_y = table.locomotion_y[rows, i]
+            animated = active & ((locomotion_x != 0) | (locomotion_y != 0))
+            attacker_x[animated] += locomotion_x[animated]
+            attacker_y[animated] += locomotion_y[animated]
+
+            # Otherwise, it depends on whether they're on the ground or in the air
+            grounded = active & ~animated & onground
+            airborne = active & ~animated & ~onground
+            attacker_speed_y[grounded] = 0
+            # Slow down the speed by the character's friction, then apply it
+            attacker_speed_x[grounded] = np.where(
+                attacker_speed_x[grounded] > 0,
+                np.maximum(0, attacker_speed_x[grounded] - friction),
+                np.minimum(0, attacker_speed_x[grounded] + friction),
+            )
+            attacker_x[grounded] += attacker_speed_x[grounded]
+
+            # In the air, they decelerate towards the stage
+            attacker_speed_y[airborne] = np.maximum(
+                -termvelocity, attacker_speed_y[airborne] - gravity
+            )
+            attacker_y[airborne] += attacker_speed_y[airborne]
+            # Did they hit the ground this frame? If so, let's make some changes
+            landing = airborne & (attacker_y <= 0)
+            if landing.any():
+                landing &= np.abs(attacker_x) < stages.EDGE_GROUND_POSITION[stage]
+                attacker_y[landing] = 0
+                attacker_speed_y[landing] = 0
+                onground[landing] = True
+            attacker_x[airborne] += attacker_speed_x[airborne]
+
+            # Calculate the x and y positions of all 4 hitboxes for this frame
+            striking = active & table.hashitbox[rows, i]
+            if not striking.any():
+                continue
+            strike_rows = rows[striking]
+            hitbox_x = (
+                facing * table.hitbox_x[strike_rows, i]
+                + attacker_x[striking, np.newaxis]
+            )
+            hitbox_y = table.hitbox_y[strike_rows, i] + attacker_y[striking, np.newaxis]
+            # Now see if any of the hitboxes are in range
+            distance = np.sqrt(
+                (hitbox_x - defender_x) ** 2 + (hitbox_y - defender_y) ** 2
+            )
+            inrange = (
+                distance < defender_size + table.hitbox_size[strike_rows, i]
+            ).any(axis=1)
+            hit[np.flatnonzero(striking)[inrange]] = i
+
+        hitframes[known] = hit
+        return dict(zip(actions, hitframes.tolist()))
+
     def dj_height(self, character_state):
         """Returns the height the character's double jump will take them.
         If character is in jump already, returns how heigh that one goes
@@ -608,9 +1049,11 @@ class FrameData:
         return frames
 
     def _getframe(self, character, action, action_frame):
-        """Returns a raw frame dict for the specified frame"""
-        if self.framedata[character][action][action_frame]:
-            return self.framedata[character][action][action_frame]
+        """Returns the raw FRAMEDATA_DTYPE row for the specified frame. None if there isn't one"""
+        frames = self._frames(character, action)
+        index = np.searchsorted(frames["frame"], action_frame)
+        if index < len(frames) and frames["frame"][index] == action_frame:
+            return frames[index]
         return None
 
     def last_roll_frame(self, character, action):
@@ -623,12 +1066,7 @@ class FrameData:
         """
         if not self.is_roll(character, action):
             return -1
-        frames = []
-        for action_frame in self.framedata[character][action]:
-            frames.append(action_frame)
-        if not frames:
-            return -1
-        return max(frames)
+        return self.frame_count(character, action)
 
     def roll_end_position(self, character_state, gamestate):
         """Returns the x coordinate that the current roll will end in
@@ -637,26 +1075,30 @@ class FrameData:
             character_state (gamestate.PlayerState): The player we're calculating for
             gamestate (gamestate.Gamestate): The current gamestate
         """
-        distance = 0
-        try:
-            # TODO: Take current momentum into account
-            # Loop through each frame in the attack
-            for action_frame in self.framedata[character_state.character][
-                character_state.action
-            ]:
-                # Only care about frames that haven't happened yet
-                if action_frame > character_state.action_frame:
-                    distance += self.framedata[character_state.character][
-                        character_state.action
-                    ][action_frame]["locomotion_x"]
+        # TODO: Take current momentum into account
+        # Add up the movement of each frame that hasn't happened yet
+        frames = self._frames(character_state.character, character_state.action)
+        distance = sum(
+            frames["locomotion_x"][
+                frames["frame"] > character_state.action_frame
+            ].tolist()
+        )
 
+        current = self._getframe(
+            character_state.character,
+            character_state.action,
+            character_state.action_frame,
+        )
+        # If we don't know the current frame, just assume this animation doesn't go anywhere
+        if current is None:
+            return character_state.position.x
+
+        try:
             # We can derive the direction we're supposed to be moving by xor'ing a few things together...
             #   1) Current facing
             #   2) Facing changed in the frame data
             #   3) Is backwards roll
-            facingchanged = self.framedata[character_state.character][
-                character_state.action
-            ][character_state.action_frame]["facing_changed"]
+            facingchanged = bool(current["facing_changed"])
             backroll = character_state.action in [
                 Action.ROLL_BACKWARD,
                 Action.GROUND_ROLL_BACKWARD_UP,
@@ -711,22 +1153,7 @@ class FrameData:
             character (enums.Character): The character we're interested in
             action (enums.Action): The action we're interested in
         """
-        # Grab only the subset that have a hitbox
-        hitboxes = []
-        for action_frame, frame in self.framedata[character][action].items():
-            if frame:
-                # Does this frame have a hitbox?
-                if (
-                    frame["hitbox_1_status"]
-                    or frame["hitbox_2_status"]
-                    or frame["hitbox_3_status"]
-                    or frame["hitbox_4_status"]
-                    or frame["projectile"]
-                ):
-                    hitboxes.append(action_frame)
-        if not hitboxes:
-            return -1
-        return min(hitboxes)
+        return self._summarize(character, action).first_hitbox_frame
 
     def hitbox_count(self, character, action):
         """Returns the number of hitboxes an attack has
@@ -751,29 +1178,8 @@ class FrameData:
         if character == Character.YLINK and action == Action.SWORD_DANCE_4_MID:
             return 10
 
-        hitboxes = []
-        for action_frame, frame in self.framedata[character][action].items():
-            if frame:
-                # Does this frame have a hitbox?
-                if (
-                    frame["hitbox_1_status"]
-                    or frame["hitbox_2_status"]
-                    or frame["hitbox_3_status"]
-                    or frame["hitbox_4_status"]
-                    or frame["projectile"]
-                ):
-                    hitboxes.append(action_frame)
-        if not hitboxes:
-            return 0
-        hashitbox = False
-        count = 0
         # Every time we go from NOT having a hit box to having one, up the count
-        for i in range(1, max(hitboxes) + 1):
-            hashitbox_new = i in hitboxes
-            if hashitbox_new and not hashitbox:
-                count += 1
-            hashitbox = hashitbox_new
-        return count
+        return self._summarize(character, action).hitbox_count
 
     def iasa(self, character, action):
         """Returns the first frame of an attack that the character is interruptible (actionable)
@@ -784,19 +1190,7 @@ class FrameData:
             character (enums.Character): The character we're interested in
             action (enums.Action): The action we're interested in
         """
-        if not self.is_attack(character, action):
-            return -1
-        iasaframes = []
-        allframes = []
-        for action_frame, frame in self.framedata[character][action].items():
-            if frame:
-                # Does this frame have a hitbox?
-                allframes.append(action_frame)
-                if frame["iasa"]:
-                    iasaframes.append(action_frame)
-        if not iasaframes:
-            return max(allframes)
-        return min(iasaframes)
+        return self._summarize(character, action).iasa
 
     def last_hitbox_frame(self, character, action):
         """Returns the last frame that a hitbox appears for a given action
@@ -808,22 +1202,7 @@ class FrameData:
             action (enums.Action): The action we're interested in
 
         """
-        # Grab only the subset that have a hitbox
-        hitboxes = []
-        for action_frame, frame in self.framedata[character][action].items():
-            if frame:
-                # Does this frame have a hitbox?
-                if (
-                    frame["hitbox_1_status"]
-                    or frame["hitbox_2_status"]
-                    or frame["hitbox_3_status"]
-                    or frame["hitbox_4_status"]
-                    or frame["projectile"]
-                ):
-                    hitboxes.append(action_frame)
-        if not hitboxes:
-            return -1
-        return max(hitboxes)
+        return self._summarize(character, action).last_hitbox_frame
 
     def frame_count(self, character, action):
         """Returns the count of total frames in the given action.
@@ -832,12 +1211,7 @@ class FrameData:
             character (enums.Character): The character we're interested in
             action (enums.Action): The action we're interested in
         """
-        frames = []
-        for action_frame, _ in self.framedata[character][action].items():
-            frames.append(action_frame)
-        if not frames:
-            return -1
-        return max(frames)
+        return self._summarize(character, action).frame_count
 
     def _cleanupcsv(self):
         """Helper function to remove all the non-attacking, non-rolling, non-B move actions"""
@@ -1092,6 +1466,49 @@ class FrameData:
         self.csvfile.close()
         self.actionfile.close()
 
+    def _slide_phases(self, character_state, absspeed, frames):
+        """Split a slide into phases of constant slowdown
+
+        Returns:
+            list of (float, int): The slowdown per frame, and number of frames, of each phase
+        """
+        friction = self.characterdata[character_state.character]["Friction"]
+        # Special case for these two damn animations, for some reason. Thanks melee
+        if character_state.action in [Action.TECH_MISS_UP]:
+            special = min(max(18 - character_state.action_frame, 0), frames)
+            return [(0.051, special), (friction, frames - special)]
+        # If we're sliding faster than the character's walk speed, then
+        #   the slowdown is doubled
+        walkspeed = self.characterdata[character_state.character]["MaxWalkSpeed"]
+        fast = 0
+        if absspeed > walkspeed:
+            fast = min(math.ceil((absspeed - walkspeed) / (2 * friction)), frames)
+        return [(2 * friction, fast), (friction, frames - fast)]
+
+    def slide_path(self, character_state, initspeed, frames):
+        """How far a character will have slid after each frame, up to the given number of frames
+
+        Args:
+            character_state (gamestate.PlayerState): The player we're interested in
+            initspeed (float): The character's starting speed
+            frames (int): Maximum number of frames to calculate for
+
+        Returns:
+            np.ndarray: Distance slid (in the direction of initspeed) after each frame. Ends
+                early if the character stops
+        """
+        speed = abs(initspeed)
+        speeds = []
+        for slowdown, count in self._slide_phases(character_state, speed, frames):
+            # Frames until the character stops, at which point the slide is over
+            moving = min(count, math.floor(speed / slowdown)) if slowdown > 0 else count
+            speeds.append(speed - slowdown * np.arange(1, moving + 1))
+            if moving < count:
+                break
+            speed -= slowdown * count
+        path = np.cumsum(np.concatenate(speeds))
+        return -path if initspeed < 0 else path
+
     def slide_distance(self, character_state, initspeed, frames):
         """How far a character will slide in the given number of frames
 
@@ -1100,32 +1517,17 @@ class FrameData:
             initspeed (float): The character's starting speed
             frames (int): Maximum number of frames to calculate for
         """
-        normalfriction = self.characterdata[character_state.character]["Friction"]
-        friction = normalfriction
-        totaldistance = 0
-        walkspeed = self.characterdata[character_state.character]["MaxWalkSpeed"]
         # Just the speed, not direction
-        absspeed = abs(initspeed)
-        multiplier = 1
-        for i in range(frames):
-            # Special case for these two damn animations, for some reason. Thanks melee
-            if character_state.action in [Action.TECH_MISS_UP]:
-                if character_state.action_frame + i < 18:
-                    friction = 0.051
-                    multiplier = 1
-                else:
-                    friction = normalfriction
-            # If we're sliding faster than the character's walk speed, then
-            #   the slowdown is doubled
-            elif absspeed > walkspeed:
-                multiplier = 2
-            else:
-                multiplier = 1
-
-            absspeed -= friction * multiplier
-            if absspeed < 0:
+        speed = abs(initspeed)
+        totaldistance = 0
+        # The speed drops by the same amount each frame of a phase, so just add up the series
+        for slowdown, count in self._slide_phases(character_state, speed, frames):
+            # Frames until the character stops, at which point the slide is over
+            moving = min(count, math.floor(speed / slowdown)) if slowdown > 0 else count
+            totaldistance += moving * speed - slowdown * moving * (moving + 1) / 2
+            if moving < count:
                 break
-            totaldistance += absspeed
+            speed -= slowdown * count
         if initspeed < 0:
             totaldistance = -totaldistance
 
@@ -1140,96 +1542,220 @@ class FrameData:
             A, B, C
         ) != FrameData._ccw(A, B, D)
 
-    def project_hit_location(self, character_state, gamestate, frames=-1):
-        """How far does the given character fly, assuming they've been hit?
-            Only considers air-movement, not ground sliding.
-            Projection ends if hitstun ends, or if a platform is encountered
-
-        Note:
-            Platform collision doesn't take ECB changes into account.
-                This means that the timing of collision can be off by a couple frames. Since it's possible
-                for someone's Y position to travel below the platform by quite a bit before registering as "collided"
+    def _project(self, character_state, gamestate, speeds_x, speeds_y_attack, steps):
+        """Fly the character along each of a batch of knockback trajectories
 
         Args:
             character_state (GameState.PlayerState): The character state to calculate for
             gamestate (gamestate.Gamestate): The current gamestate
-            frames (int): The number of frames to calculate for. -1 means "until end of hitstun"
+            speeds_x (np.ndarray): Horizontal knockback speed of each trajectory
+            speeds_y_attack (np.ndarray): Vertical knockback speed of each trajectory
+            steps (int): Number of frames to fly for
 
         Returns:
-            (float, float, int): x, y coordinates of the place the character will end up at the end of hitstun, plus frames until that position
+            (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray): x and y positions
+                before each frame (and after the last), shaped (trajectories, steps + 1), the
+                horizontal speed during each frame, the first frame that each trajectory
+                hits a platform on (-1 if none), and the height of that platform
         """
-        speed_x, speed_y_attack, speed_y_self = (
-            character_state.speed_x_attack,
-            character_state.speed_y_attack,
-            character_state.speed_y_self,
-        )
-        position_x, position_y = character_state.position.x, character_state.position.y
+        count = len(speeds_x)
         termvelocity = self.characterdata[character_state.character]["TerminalVelocity"]
         gravity = self.characterdata[character_state.character]["Gravity"]
 
+        # Knockback decays along the angle it was sent at
+        horizontal_decay = np.empty(count)
+        vertical_decay = np.empty(count)
+        for index, (speed_x, speed_y_attack) in enumerate(
+            zip(speeds_x.tolist(), speeds_y_attack.tolist())
+        ):
+            angle = math.atan2(speed_x, speed_y_attack)
+            horizontal_decay[index] = abs(0.051 * math.cos(-angle + (math.pi / 2)))
+            vertical_decay[index] = abs(0.051 * math.sin(-angle + (math.pi / 2)))
+
+        # Each frame's speed is the last one's minus the decay (or gravity), so the speeds
+        #   are running sums. Clamped, since the decay stops at 0 and gravity at terminal
+        #   velocity. Running sums (rather than closed forms) keep the rounding the same as
+        #   stepping frame by frame
+        def decay(initial, change):
+            speeds = np.empty((count, steps))
+            speeds[:, 0] = initial
+            speeds[:, 1:] = change[:, np.newaxis]
+            return np.add.accumulate(speeds, axis=1)
+
+        positive = (speeds_x > 0)[:, np.newaxis]
+        speed_x = decay(
+            speeds_x, np.where(speeds_x > 0, -horizontal_decay, horizontal_decay)
+        )
+        speed_x = np.where(positive, np.maximum(0, speed_x), np.minimum(0, speed_x))
+        positive = (speeds_y_attack > 0)[:, np.newaxis]
+        speed_y_attack = decay(
+            speeds_y_attack,
+            np.where(speeds_y_attack > 0, -vertical_decay, vertical_decay),
+        )
+        speed_y_attack = np.where(
+            positive, np.maximum(0, speed_y_attack), np.minimum(0, speed_y_attack)
+        )
+        speed_y_self = decay(
+            np.full(count, float(character_state.speed_y_self)),
+            np.full(count, -gravity),
+        )
+        speed_y_self[:, 1:] = np.maximum(-termvelocity, speed_y_self[:, 1:])
+
+        # Positions are running sums of the speeds. Vertical speed is added in two parts
+        position_x = np.empty((count, steps + 1))
+        position_x[:, 0] = character_state.position.x
+        position_x[:, 1:] = speed_x
+        position_x = np.add.accumulate(position_x, axis=1)
+        position_y = np.empty((count, 2 * steps + 1))
+        position_y[:, 0] = character_state.position.y
+        position_y[:, 1::2] = speed_y_attack
+        position_y[:, 2::2] = speed_y_self
+        position_y = np.add.accumulate(position_y, axis=1)[:, ::2]
+
         # Get list of all platforms, tuples of (height, left, right)
-        platforms = []
-        platforms.append(
+        platforms = [
             (
                 0,
                 -stages.EDGE_GROUND_POSITION[gamestate.stage],
                 stages.EDGE_GROUND_POSITION[gamestate.stage],
             )
-        )
+        ]
         left_plat = stages.left_platform_position(gamestate)
         if left_plat[0] is not None:
             platforms.append(left_plat)
         right_plat = stages.right_platform_position(gamestate)
         if right_plat[0] is not None:
             platforms.append(right_plat)
+        height, left, right = (
+            np.array(column, dtype=float) for column in zip(*platforms)
+        )
 
-        angle = math.atan2(speed_x, speed_y_attack)
-        horizontal_decay = abs(0.051 * math.cos(-angle + (math.pi / 2)))
-        vertical_decay = abs(0.051 * math.sin(-angle + (math.pi / 2)))
+        # Check if the character will hit a platform each frame
+        #   AB is platform, CD is character. Shaped (trajectory, frame, platform)
+        bottom = float(character_state.ecb.bottom.y)
+        c_x = position_x[:, :-1, np.newaxis]
+        c_y = (position_y[:, :-1] + bottom)[..., np.newaxis]
+        d_x = (position_x[:, :-1] + speed_x)[..., np.newaxis]
+        d_y = (position_y[:, :-1] + bottom + speed_y_attack + speed_y_self)[
+            ..., np.newaxis
+        ]
 
-        frames_left = frames
-        if frames_left == -1:
-            frames_left = character_state.hitstun_frames_left
+        def ccw(a_x, a_y, b_x, b_y, c_x, c_y):
+            return (c_y - a_y) * (b_x - a_x) > (b_y - a_y) * (c_x - a_x)
 
-        # Always quit out after 180 iterations just in case. So we don't accidentally infinite loop here
-        failsafe = 180
-
-        while frames_left > 0 and failsafe > 0:
-            # Check if the character will hit a platform
-            for platform in platforms:
-                # We have two line segments. Check if they intersect
-                #   AB is platform, CD is character
-                A = (platform[1], platform[0])
-                B = (platform[2], platform[0])
-                C = (position_x, position_y + character_state.ecb.bottom.y)
-                D = (
-                    position_x + speed_x,
-                    position_y
-                    + character_state.ecb.bottom.y
-                    + speed_y_attack
-                    + speed_y_self,
-                )
-                if FrameData._intersect(A, B, C, D):
-                    # speed_x/2 to just assume we intersect half way through. This will be wrong, but close enough
-                    return (position_x + (speed_x / 2), platform[0], 181 - failsafe)
+        intersect = (
+            ccw(left, height, c_x, c_y, d_x, d_y)
+            != ccw(right, height, c_x, c_y, d_x, d_y)
+        ) & (
+            ccw(left, height, right, height, c_x, c_y)
+            != ccw(left, height, right, height, d_x, d_y)
+        )
+        # The first platform hit, on the first frame that one is hit
+        collided = intersect.reshape(count, -1)
+        first = np.argmax(collided, axis=1)
+        landing = np.where(collided.any(axis=1), first // len(platforms), -1)
+        landing_height = height[first % len(platforms)]
+        return position_x, position_y, speed_x, landing, landing_height
 
-            position_x += speed_x
-            position_y += speed_y_attack
-            position_y += speed_y_self
+    def project_hit_trajectories(
+        self, character_state, gamestate, speeds_x=None, speeds_y=None, frames=-1
+    ):
+        """Where does the given character fly, for each of a batch of knockbacks?
 
-            # Update the speeds
-            speed_y_self = max(-termvelocity, speed_y_self - gravity)
+        Same as project_hit_location(), but for many candidate knockbacks at once, and giving
+        the whole path of each.
 
-            if speed_y_attack > 0:
-                speed_y_attack = max(0, speed_y_attack - vertical_decay)
-            else:
-                speed_y_attack = min(0, speed_y_attack + vertical_decay)
+        Args:
+            character_state (GameState.PlayerState): The character state to calculate for
+            gamestate (gamestate.Gamestate): The current gamestate
+            speeds_x (list of float): Horizontal knockback speed of each candidate. Defaults
+                to just the character's current speed_x_attack
+            speeds_y (list of float): Vertical knockback speed of each candidate. Defaults
+                to just the character's current speed_y_attack
+            frames (int): The number of frames to calculate for. -1 means "until end of hitstun"
 
-            if speed_x > 0:
-                speed_x = max(0, speed_x - horizontal_decay)
-            else:
-                speed_x = min(0, speed_x + horizontal_decay)
-            failsafe -= 1
-            frames_left -= 1
+        Returns:
+            (np.ndarray, np.ndarray): The x, y coordinates of each candidate at the start of
+                each frame (and after the last), shaped (candidates, frames + 1, 2). A
+                candidate that lands on a platform stays where it landed. And the number of
+                frames until each candidate lands, or until the end if it doesn't
+        """
+        if speeds_x is None:
+            speeds_x = [character_state.speed_x_attack]
+        if speeds_y is None:
+            speeds_y = [character_state.speed_y_attack]
+        speeds_x = np.asarray(speeds_x, dtype=float)
+        speeds_y = np.asarray(speeds_y, dtype=float)
+        if frames == -1:
+            frames = character_state.hitstun_frames_left
+        # Always quit out after 180 frames just in case
+        steps = min(max(math.ceil(frames), 0), 180)
+
+        positions = np.empty((len(speeds_x), steps + 1, 2))
+        if not steps:
+            positions[:] = (character_state.position.x, character_state.position.y)
+            return positions, np.zeros(len(speeds_x), dtype=int)
+        position_x, position_y, speed_x, landing, landing_height = self._project(
+            character_state, gamestate, speeds_x, speeds_y, steps
+        )
+        positions[..., 0] = position_x
+        positions[..., 1] = position_y
+        for index in np.flatnonzero(landing >= 0):
+            # Assume we intersect half way through the frame
+            frame = landing[index]
+            positions[index, frame + 1 :] = (
+                position_x[index, frame] + (speed_x[index, frame] / 2),
+                landing_height[index],
+            )
+        return positions, np.where(landing >= 0, landing + 1, steps)
+
+    def project_hit_location(self, character_state, gamestate, frames=-1):
+        """How far does the given character fly, assuming they've been hit?
+            Only considers air-movement, not ground sliding.
+            Projection ends if hitstun ends, or if a platform is encountered
+
+        Note:
+            Platform collision doesn't take ECB changes into account.
+                This means that the timing of collision can be off by a couple frames. Since it's possible
+                for someone's Y position to travel below the platform by quite a bit before registering as "collided"
+
+        Args:
+            character_state (GameState.PlayerState): The character state to calculate for
+            gamestate (gamestate.Gamestate): The current gamestate
+            frames (int): The number of frames to calculate for. -1 means "until end of hitstun"
+
+        Returns:
+            (float, float, int): x, y coordinates of the place the character will end up at the end of hitstun, plus frames until that position
+        """
+        frames_left = frames
+        if frames_left == -1:
+            frames_left = character_state.hitstun_frames_left
+        # Always quit out after 180 frames just in case
+        steps = min(max(math.ceil(frames_left), 0), 180)
+        if not steps:
+            return (
+                character_state.position.x,
+                character_state.position.y,
+                character_state.hitstun_frames_left,
+            )
 
-        return position_x, position_y, character_state.hitstun_frames_left
+        position_x, position_y, speed_x, landing, landing_height = self._project(
+            character_state,
+            gamestate,
+            np.array([character_state.speed_x_attack], dtype=float),
+            np.array([character_state.speed_y_attack], dtype=float),
+            steps,
+        )
+        frame = int(landing[0])
+        if frame >= 0:
+            # speed_x/2 to just assume we intersect half way through. This will be wrong, but close enough
+            return (
+                float(position_x[0, frame] + (speed_x[0, frame] / 2)),
+                float(landing_height[0]),
+                frame + 1,
+            )
+        return (
+            float(position_x[0, -1]),
+            float(position_y[0, -1]),
+            character_state.hitstun_frames_left,
+        )
@@ -0,0 +1,230 @@
+"""Precompiled binary layouts for decoding Slippi game events
+
+Each event type is described once as a list of fields (name, struct format, byte offset,
+default). The layout compiles that description into `struct.Struct` objects so that a whole
+event is read with a single `unpack_from` call, rather than one read per field.
+
+Older SLP versions have shorter event payloads. Any field that lies past the end of the
+payload is not read at all, and its default value is returned instead.
+"""
+
+import struct
+from bisect import bisect_right
+
+import numpy as np
+
+from melee import enums
+
+
+class EventLayout:
+    """The binary layout of a single Slippi event type"""
+
+    def __init__(self, fields):
+        """Create a layout from a list of fields
+
+        Args:
+            fields (list of (str, str, int, any)): Tuples of (name, struct format, offset, default)
+                Offsets are relative to the start of the event, including the command byte.
+                Fields must not overlap.
+        """
+        self.fields = sorted(fields, key=lambda field: field[2])
+        """(list of tuples): The fields of this event, sorted by offset"""
+        self.names = tuple(field[0] for field in self.fields)
+        """(tuple of str): Field names, in the order that unpack_from() returns them"""
+        self._ends = [
+            offset + struct.calcsize(">" + fmt) for _, fmt, offset, _ in self.fields
+        ]
+        self._defaults = tuple(field[3] for field in self.fields)
+        # Compiled structs, indexed by how many of the fields they contain
+        self._structs = [None] * (len(self.fields) + 1)
+
+    def _compile(self, count):
+        """Build (and cache) a struct that reads the first `count` fields"""
+        layout = ">"
+        cursor = 0
+        for _, fmt, offset, _ in self.fields[:count]:
+            if offset > cursor:
+                layout += str(offset - cursor) + "x"
+            layout += fmt
+            cursor = offset + struct.calcsize(">" + fmt)
+        compiled = struct.Struct(layout)
+        self._structs[count] = compiled
+        return compiled
+
+    def unpack_from(self, buffer, offset=0, size=None):
+        """Decode one event out of the buffer
+
+        Args:
+            buffer (bytes-like): Buffer containing the event
+            offset (int): Where in the buffer the event begins (at its command byte)
+            size (int): Size of the event payload, including the command byte.
+                If None, the event is assumed to run until the end of the buffer.
+
+        Returns:
+            tuple: One value per field, in the order of `names`. Fields that lie past
+                the end of the payload are given their default value.
+        """
+        if size is None:
+            size = len(buffer) - offset
+        count = bisect_right(self._ends, size)
+        compiled = self._structs[count] or self._compile(count)
+        values = compiled.unpack_from(buffer, offset)
+        if count < len(self._defaults):
+            return values + self._defaults[count:]
+        return values
+
+    def dtype(self, size):
+        """A NumPy structured dtype for events of the given payload size
+
+        Lets a whole array of events be decoded at once. Fields past the end of the
+        payload are left out of the dtype.
+
+        Args:
+            size (int): Size of the event payload, including the command byte.
+        """
+        names, formats, offsets = [], [], []
+        for (name, fmt, offset, _), end in zip(self.fields, self._ends):
+            if end <= size:
+                names.append(name)
+                formats.append(">" + fmt)
+                offsets.append(offset)
+        return np.dtype(
+            {"names": names, "formats": formats, "offsets": offsets, "itemsize": size}
+        )
+
+    def default(self, name):
+        """Returns the default value of the named field"""
+        return self._defaults[self.names.index(name)]
+
+
+GAME_START = EventLayout(
+    [
+        ("major", "B", 0x1, 0),
+        ("minor", "B", 0x2, 0),
+        ("build", "B", 0x3, 0),
+        ("is_teams", "H", 0xD, 0),
+        ("stage", "H", 0x13, 0),
+    ]
+    + [
+        field
+        for i in range(4)
+        for field in [
+            ("character_" + str(i), "B", 0x65 + (0x24 * i), 0xFF),
+            ("player_type_" + str(i), "B", 0x66 + (0x24 * i), 3),
+            ("costume_" + str(i), "B", 0x68 + (0x24 * i), 0),
+            ("team_id_" + str(i), "B", 0x6E + (0x24 * i), 0),
+            ("cpu_level_" + str(i), "B", 0x74 + (0x24 * i), 0),
+        ]
+    ]
+)
+"""(EventLayout): Layout of the GAME_START event"""
+
+PRE_FRAME = EventLayout(
+    [
+        ("frame", "i", 0x1, 0),
+        ("port", "B", 0x5, 0),
+        ("is_follower", "B", 0x6, 0),
+        ("main_x", "f", 0x19, 0.0),
+        ("main_y", "f", 0x1D, 0.0),
+        ("c_x", "f", 0x21, 0.0),
+        ("c_y", "f", 0x25, 0.0),
+        ("trigger", "f", 0x29, 0.0),
+        ("buttons", "H", 0x31, 0),
+        ("raw_main_x", "b", 0x3B, 0),
+        ("raw_main_y", "b", 0x40, 0),
+    ]
+)
+"""(EventLayout): Layout of the PRE_FRAME event"""
+
+POST_FRAME = EventLayout(
+    [
+        ("frame", "i", 0x1, 0),
+        ("port", "B", 0x5, 0),
+        ("is_follower", "B", 0x6, 0),
+        ("character", "B", 0x7, 0xFF),
+        ("action", "H", 0x8, 0xFFFF),
+        ("x", "f", 0xA, 0.0),
+        ("y", "f", 0xE, 0.0),
+        ("facing", "f", 0x12, 0.0),
+        ("percent", "f", 0x16, 0.0),
+        ("shield_strength", "f", 0x1A, 0.0),
+        ("stock", "B", 0x21, 0),
+        ("action_frame", "f", 0x22, 0.0),
+        ("state_flags_4", "B", 0x29, 0),
+        ("hitstun", "f", 0x2B, 0.0),
+        ("airborne", "B", 0x2F, 0),
+        ("jumps_left", "B", 0x32, 1),
+        ("invulnerable", "B", 0x34, 0),
+        ("speed_air_x_self", "f", 0x35, 0.0),
+        ("speed_y_self", "f", 0x39, 0.0),
+        ("speed_x_attack", "f", 0x3D, 0.0),
+        ("speed_y_attack", "f", 0x41, 0.0),
+        ("speed_ground_x_self", "f", 0x45, 0.0),
+        ("hitlag_left", "f", 0x49, 0.0),
+        ("ecb_top_x", "f", 0x51, 0.0),
+        ("ecb_top_y", "f", 0x55, 0.0),
+        ("ecb_bottom_x", "f", 0x59, 0.0),
+        ("ecb_bottom_y", "f", 0x5D, 0.0),
+        ("ecb_left_x", "f", 0x61, 0.0),
+        ("ecb_left_y", "f", 0x65, 0.0),
+        ("ecb_right_x", "f", 0x69, 0.0),
+        ("ecb_right_y", "f", 0x6D, 0.0),
+        ("fod_platform_left", "f", 0x71, 0.0),
+        ("fod_platform_right", "f", 0x75, 0.0),
+    ]
+)
+"""(EventLayout): Layout of the POST_FRAME event"""
+
+ITEM_UPDATE = EventLayout(
+    [
+        ("type", "H", 0x5, 0xFF),
+        ("subtype", "B", 0x7, 0),
+        ("speed_x", "f", 0xC, 0.0),
+        ("speed_y", "f", 0x10, 0.0),
+        ("x", "f", 0x14, 0.0),
+        ("y", "f", 0x18, 0.0),
+        ("frame", "f", 0x1E, 0.0),
+        ("owner", "B", 0x2A, 0xFF),
+    ]
+)
+"""(EventLayout): Layout of the ITEM_UPDATE event"""
+
+# Bit masks of each digital button in the PRE_FRAME event's processed button field
+BUTTON_MASKS = (
+    (enums.Button.BUTTON_A, 0x0100),
+    (enums.Button.BUTTON_B, 0x0200),
+    (enums.Button.BUTTON_X, 0x0400),
+    (enums.Button.BUTTON_Y, 0x0800),
+    (enums.Button.BUTTON_START, 0x1000),
+    (enums.Button.BUTTON_Z, 0x0010),
+    (enums.Button.BUTTON_R, 0x0020),
+    (enums.Button.BUTTON_L, 0x0040),
+    (enums.Button.BUTTON_D_LEFT, 0x0001),
+    (enums.Button.BUTTON_D_RIGHT, 0x0002),
+    (enums.Button.BUTTON_D_DOWN, 0x0004),
+    (enums.Button.BUTTON_D_UP, 0x0008),
+)
+"""(tuple of (enums.Button, int)): Mask of each button in the PRE_FRAME processed buttons"""
+
+ALL_BUTTONS = sum(mask for _, mask in BUTTON_MASKS)
+"""(int): Every mask of BUTTON_MASKS together"""
+
+# Enum construction is slow enough to show up in profiles. Look members up directly instead
+_ACTIONS = {action.value: action for action in enums.Action}
+_CHARACTERS = {character.value: character for character in enums.Character}
+_PROJECTILES = {projectile.value: projectile for projectile in enums.ProjectileType}
+
+
+def to_action(value):
+    """Convert a raw action state ID into an enums.Action. UNKNOWN_ANIMATION if not known"""
+    return _ACTIONS.get(value, enums.Action.UNKNOWN_ANIMATION)
+
+
+def to_character(value):
+    """Convert a raw internal character ID into an enums.Character. UNKNOWN_CHARACTER if not known"""
+    return _CHARACTERS.get(value, enums.Character.UNKNOWN_CHARACTER)
+
+
+def to_projectile(value):
+    """Convert a raw item type ID into an enums.ProjectileType. UNKNOWN_PROJECTILE if not known"""
+    return _PROJECTILES.get(value, enums.ProjectileType.UNKNOWN_PROJECTILE)
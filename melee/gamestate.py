@@ -29,7 +29,8 @@ class GameState(object):
     """Represents the state of a running game of Melee at a given moment in time"""
     __slots__ = ('frame', 'stage', 'menu_state', 'submenu', 'player', 'players', 'projectiles', 'stage_select_cursor_x',
                  'stage_select_cursor_y', 'ready_to_start', 'distance', 'menu_selection', '_newframe', 'playedOn', 'startAt',
-                 'consoleNick', 'is_teams', '_fod_platform_left', '_fod_platform_right', 'custom')
+                 'consoleNick', 'is_teams', '_fod_platform_left', '_fod_platform_right', 'custom', '_spare_players',
+                 '_spare_projectiles')
     def __init__(self):
         self.frame = -10000
         """int: The current frame number. Monotonically increases. Can be negative."""
@@ -69,6 +70,45 @@ class GameState(object):
         """(float): The current height of FoD platforms"""        
         self.custom = dict()
         """(dict): Custom fields to be added by the user"""
+        # PlayerStates and Projectiles left over from before the last reset(), to be reused
+        self._spare_players = []
+        self._spare_projectiles = []
+
+    def reset(self):
+        """Put this GameState back the way it was when first created, in place
+
+        The PlayerState and Projectile objects it held are kept aside to be reused, rather
+        than thrown away. So don't hold on to them past a reset() either."""
+        for name, value in _defaults(GameState, _GAMESTATE_CONTAINERS):
+            setattr(self, name, value)
+        for player in self.players.values():
+            if player.nana is not None:
+                self._spare_players.append(player.nana)
+            self._spare_players.append(player)
+        self.players.clear()
+        self._spare_projectiles.extend(self.projectiles)
+        self.projectiles.clear()
+        self.custom.clear()
+
+    def _take_player(self):
+        """A fresh PlayerState. Recycled from before the last reset() if there's one spare"""
+        if self._spare_players:
+            player = self._spare_players.pop()
+            player.reset()
+            return player
+        return PlayerState()
+
+    def _take_projectile(self):
+        """A fresh Projectile. Recycled from before the last reset() if there's one spare"""
+        if self._spare_projectiles:
+            projectile = self._spare_projectiles.pop()
+            projectile.reset()
+            return projectile
+        return Projectile()
+
+    def _return_projectile(self, projectile):
+        """Give back a Projectile from _take_projectile() that wasn't used after all"""
+        self._spare_projectiles.append(projectile)
 
 class PlayerState(object):
     """ Represents the state of a single player """
@@ -175,6 +215,18 @@ class PlayerState(object):
         self.team_id = 0
         """(int): The team ID of the player. This is different than costume, and only relevant during teams."""
 
+    def reset(self):
+        """Put this PlayerState back the way it was when first created, in place"""
+        for name, value in _defaults(PlayerState, _PLAYERSTATE_CONTAINERS):
+            setattr(self, name, value)
+        _reset_position(self.position)
+        _reset_position(self.cursor)
+        _reset_position(self.ecb.top)
+        _reset_position(self.ecb.bottom)
+        _reset_position(self.ecb.left)
+        _reset_position(self.ecb.right)
+        self.controller_state.reset()
+
 class Projectile:
     """ Represents the state of a projectile (items, lasers, etc...) """
     def __init__(self):
@@ -199,6 +251,35 @@ class Projectile:
         self.subtype = 0
         """(int): The subtype of the item. Many projectiles have 'subtypes' that make them different. They're all different, so it's not an enum"""
 
+    def reset(self):
+        """Put this Projectile back the way it was when first created, in place"""
+        for name, value in _defaults(Projectile, _PROJECTILE_CONTAINERS):
+            setattr(self, name, value)
+        _reset_position(self.position)
+        _reset_position(self.speed)
+
+# Attributes that hold mutable objects, which get reset in place rather than replaced
+_GAMESTATE_CONTAINERS = ('player', 'players', 'projectiles', 'custom', '_spare_players', '_spare_projectiles')
+_PLAYERSTATE_CONTAINERS = ('position', 'cursor', 'ecb', 'controller_state')
+_PROJECTILE_CONTAINERS = ('position', 'speed')
+
+_default_values = {}
+
+def _defaults(cls, containers):
+    """(name, value) pairs of every attribute that a new `cls` starts out with, besides containers
+
+    Taken from a fresh instance the first time it's needed, so it can't drift from __init__"""
+    if cls not in _default_values:
+        fresh = cls()
+        names = getattr(cls, '__slots__', None) or vars(fresh).keys()
+        _default_values[cls] = tuple((name, getattr(fresh, name)) for name in names
+                                     if name not in containers and hasattr(fresh, name))
+    return _default_values[cls]
+
+def _reset_position(position):
+    position.x = np.float32(0)
+    position.y = np.float32(0)
+
 def port_detector(gamestate, character, costume):
     """Autodiscover what port the given character is on
 
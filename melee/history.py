@@ -0,0 +1,141 @@
+"""A fixed-size history of the most recent frames, stored as NumPy arrays
+
+Lots of bot logic needs to look back a few frames: estimating velocities, spotting action
+transitions, and so on. Rather than keeping copies of old GameState objects around, Console
+can record every frame into a FrameHistory (see Console's history_size). Each player's numeric
+state is encoded as an encoding.PLAYER_DTYPE row into a preallocated ring buffer, so recording
+a frame is O(1) and looking back over a window is a vectorized array operation.
+"""
+
+import numpy as np
+
+from melee.encoding import ABSENT, PLAYER_DTYPE, player_record
+
+
+class FrameHistory:
+    """The last `capacity` frames of the game, per player"""
+
+    def __init__(self, capacity=60):
+        """Create an empty history
+
+        Args:
+            capacity (int): How many frames to remember
+        """
+        if capacity < 1:
+            raise ValueError("FrameHistory capacity must be at least 1")
+        self.capacity = capacity
+        """(int): How many frames are remembered"""
+        self._frames = np.zeros(capacity, dtype=np.int32)
+        self._players = dict()
+        self._count = 0
+
+    def __len__(self):
+        """Number of frames currently remembered"""
+        return min(self._count, self.capacity)
+
+    def clear(self):
+        """Forget all the frames"""
+        self._count = 0
+        self._players.clear()
+
+    def append(self, gamestate):
+        """Record a frame. Overwrites the oldest one once full
+
+        Args:
+            gamestate (gamestate.GameState): The frame to record
+        """
+        slot = self._count % self.capacity
+        frame = gamestate.frame
+        self._frames[slot] = frame
+        for port, player in gamestate.players.items():
+            table = self._players.get(port)
+            if table is None:
+                table = np.empty(self.capacity, dtype=PLAYER_DTYPE)
+                table[:] = ABSENT
+                self._players[port] = table
+            table[slot] = player_record(player, frame)
+        if len(self._players) > len(gamestate.players):
+            for port, table in self._players.items():
+                if port not in gamestate.players:
+                    table[slot] = ABSENT
+        self._count += 1
+
+    def _slots(self, last):
+        """Ring buffer indexes of the last `last` frames, oldest first"""
+        available = len(self)
+        if last is None or last > available:
+            last = available
+        return np.arange(self._count - last, self._count) % self.capacity
+
+    def ports(self):
+        """(list of int): Controller ports that have been seen"""
+        return list(self._players)
+
+    def frames(self, last=None):
+        """Frame numbers of the remembered frames
+
+        Args:
+            last (int): Only the most recent this many frames. None for all of them
+
+        Returns:
+            np.ndarray: The frame numbers, oldest first
+        """
+        return self._frames[self._slots(last)]
+
+    def window(self, port, last=None):
+        """A player's state over the remembered frames
+
+        Frames that the player wasn't in have a `frame` of -10000 and are otherwise zeroed.
+
+        Args:
+            port (int): Controller port of the player
+            last (int): Only the most recent this many frames. None for all of them
+
+        Returns:
+            np.ndarray: PLAYER_DTYPE rows, oldest first. A copy, so safe to keep
+
+        Raises:
+            KeyError: If the port has never been seen
+        """
+        return self._players[port][self._slots(last)]
+
+    def field(self, port, name, last=None):
+        """One field of a player's state over the remembered frames
+
+        Args:
+            port (int): Controller port of the player
+            name (str): A PLAYER_DTYPE field, such as "percent" or "action"
+            last (int): Only the most recent this many frames. None for all of them
+
+        Returns:
+            np.ndarray: The field's values, oldest first
+        """
+        return self._players[port][name][self._slots(last)]
+
+    def positions(self, port, last=None):
+        """A player's positions over the remembered frames
+
+        Args:
+            port (int): Controller port of the player
+            last (int): Only the most recent this many frames. None for all of them
+
+        Returns:
+            np.ndarray: Array of shape (frames, 2) of (x, y) positions, oldest first
+        """
+        table = self._players[port]
+        slots = self._slots(last)
+        return np.stack((table["x"][slots], table["y"][slots]), axis=-1)
+
+    def velocities(self, port, last=None):
+        """A player's change in position from frame to frame
+
+        Args:
+            port (int): Controller port of the player
+            last (int): Only the most recent this many velocities. None for all of them
+
+        Returns:
+            np.ndarray: Array of shape (frames, 2) of (x, y) velocities, oldest first.
+                One shorter than the frames they're taken from
+        """
+        positions = self.positions(port, None if last is None else last + 1)
+        return np.diff(positions, axis=0)
@@ -0,0 +1,190 @@
+"""Persistent, on-disk cache of SLP frame indexes
+
+Indexing an SLP file (see SLPFileStreamer.frame_index()) means a pass over the whole file.
+This cache saves each index, along with the file's metadata, so that opening the same
+replay again later (from any process) doesn't have to redo it.
+
+Entries are keyed on the file's path, size and modification time, so a changed file is
+never given a stale index. The cache is bounded in size, evicting the least recently used
+entries first. It's safe to share between processes: entries are written to a temporary
+file and then atomically renamed into place, so readers only ever see whole entries.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from melee.slpfilestreamer import FrameIndex
+
+
+def default_cache_directory():
+    """The default place to keep the cache. Under the user's cache directory"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(str(Path.home()), ".cache")
+    return os.path.join(base, "libmelee", "frameindex")
+
+
+class FrameIndexCache:
+    """A directory of saved frame indexes, bounded in size"""
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        """Create (or open) a cache
+
+        Args:
+            directory (str): Where to keep the cache. Defaults to default_cache_directory()
+            max_bytes (int): Largest the cache may grow to, on disk
+        """
+        self.directory = directory or default_cache_directory()
+        """(str): Directory the cache is kept in"""
+        self.max_bytes = max_bytes
+        """(int): Largest the cache may grow to, on disk"""
+        self.hits = 0
+        """(int): Number of indexes that were found in the cache"""
+        self.misses = 0
+        """(int): Number of indexes that had to be built"""
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, path, allow_old_version):
+        """Where the entry for the given SLP file lives. None if the file can't be read"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = "%s\0%d\0%d\0%d" % (
+            os.path.abspath(path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            allow_old_version,
+        )
+        digest = hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, digest + ".npz")
+
+    def load(self, path, allow_old_version=False):
+        """Look up the index of an SLP file
+
+        Args:
+            path (str): Path to the SLP file
+            allow_old_version (bool): The allow_old_version setting of the index
+
+        Returns:
+            (slpfilestreamer.FrameIndex, dict): Tuple of the index and the file's metadata.
+                None if the file isn't in the cache (or has changed since)
+        """
+        entry = self._entry_path(path, allow_old_version)
+        if entry is None:
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as arrays:
+                frames = arrays["frames"]
+                offsets = arrays["offsets"]
+                eventsize = arrays["eventsize"]
+                info = json.loads(str(arrays["info"]))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:  # pylint: disable=broad-except
+            # A damaged entry. Throw it away and start over
+            self._remove(entry)
+            self.misses += 1
+            return None
+
+        index = FrameIndex()
+        index.frames = frames.tolist()
+        index.offsets = offsets.tolist()
+        index.positions = {}
+        for position, frame in enumerate(index.frames):
+            index.positions.setdefault(frame, position)
+        index.eventsize = eventsize.tolist()
+        index.game_start_offset = info["game_start_offset"]
+        index.game_start_end = info["game_start_end"]
+        index.manual_bookends = info["manual_bookends"]
+        index.allow_old_version = info["allow_old_version"]
+        index.slp_version = info["slp_version"]
+        index.stage = info["stage"]
+        index.characters = {
+            int(port): character for port, character in info["characters"].items()
+        }
+
+        # Mark the entry as recently used, for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        self.hits += 1
+        return index, info["metadata"]
+
+    def store(self, path, index, metadata):
+        """Save the index of an SLP file
+
+        Args:
+            path (str): Path to the SLP file
+            index (slpfilestreamer.FrameIndex): The file's frame index
+            metadata (dict): The file's metadata
+        """
+        entry = self._entry_path(path, index.allow_old_version)
+        if entry is None:
+            return
+        info = {
+            "game_start_offset": index.game_start_offset,
+            "game_start_end": index.game_start_end,
+            "manual_bookends": index.manual_bookends,
+            "allow_old_version": index.allow_old_version,
+            "slp_version": index.slp_version,
+            "stage": index.stage,
+            "characters": index.characters,
+            "metadata": metadata,
+        }
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as entryfile:
+                np.savez(
+                    entryfile,
+                    frames=np.array(index.frames, dtype=np.int32),
+                    offsets=np.array(index.offsets, dtype=np.int64),
+                    eventsize=np.array(index.eventsize, dtype=np.uint32),
+                    info=np.array(json.dumps(info, default=str)),
+                )
+            os.replace(temp_path, entry)
+        except OSError:
+            self._remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if not item.name.endswith(".npz"):
+                    continue
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(entry)
+            total -= size
+
+    def clear(self):
+        """Delete every entry in the cache"""
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(".npz"):
+                    self._remove(item.path)
+
+    @staticmethod
+    def _remove(path):
+        # Another process may have gotten to it first. That's fine
+        try:
+            os.remove(path)
+        except OSError:
+            pass
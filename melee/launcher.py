@@ -0,0 +1,306 @@
+"""Start lots of Dolphin instances quickly
+
+Each Console made with tmp_home_directory and copy_home_directory copies the whole Dolphin
+User directory, including its (often large) caches. That makes starting many instances slow,
+and hard on the disk. A HomeTemplate copies the User directory once, and each instance's home
+is then made from the template. Directories that Dolphin only ever reads (texture packs,
+themes and the like) are hard linked, which costs next to nothing. Caches that Dolphin
+rebuilds by itself start out empty. Everything else (configs, memory cards, the NAND, save
+states) is a real copy, since Dolphin writes to it in place. Give the template to each
+Console as its home_template.
+
+launch() then runs and connects many consoles at once, rather than one after another. And a
+Supervisor keeps them running: it notices when one has crashed or stopped producing frames,
+restarts it, and keeps track of how many frames each is getting through.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from melee.console import _ignore_fifos
+
+SHARED_DIRECTORIES = ("Load", "ResourcePacks", "Sys", "Themes")
+"""(tuple of str): Directories of a Dolphin home that Dolphin only reads from, so instances
+can share them through hard links. Anything that isn't listed here gets copied"""
+
+CACHE_DIRECTORIES = ("Cache", "ShaderCache")
+"""(tuple of str): Directories of a Dolphin home that Dolphin rebuilds when they're missing.
+Each instance starts with an empty one of its own"""
+
+
+class HomeTemplate:
+    """A copy of a Dolphin User directory, to make instance home directories from"""
+
+    def __init__(
+        self,
+        source,
+        directory=None,
+        shared=SHARED_DIRECTORIES,
+        cache=CACHE_DIRECTORIES,
+    ):
+        """Copy the User directory into the template
+
+        Args:
+            source (str): The Dolphin User directory to copy
+            directory (str): Where to put the template. Defaults to a new temporary
+                directory. Must be on the same filesystem as the instance homes for them to
+                be hard linked, otherwise they're copied
+            shared (tuple of str): Top level directories that are hard linked into every
+                instance. Dolphin must never write to these. All other directories are
+                copied for each instance
+            cache (tuple of str): Top level directories that each instance gets an empty
+                one of, instead of a copy. Their contents aren't kept in the template
+        """
+        self._temporary = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="libmelee_template_")
+        """(str): Directory the template is kept in"""
+        self.path = os.path.join(self.directory, "User")
+        """(str): The template's User directory"""
+        self.shared = tuple(shared)
+        """(tuple of str): Top level directories that are hard linked into every instance"""
+        self.cache = tuple(cache)
+        """(tuple of str): Top level directories that each instance gets an empty one of"""
+        shutil.copytree(source, self.path, ignore=self._ignore)
+
+    def _ignore(self, src, names):
+        """Leave pipes, and the contents of cache directories, out of the template"""
+        if os.path.dirname(os.path.normpath(src)) == os.path.normpath(self.path):
+            if os.path.basename(os.path.normpath(src)) in self.cache:
+                return names
+        return _ignore_fifos(src, names)
+
+    def make_home(self, destination):
+        """Make an instance home directory from the template
+
+        Args:
+            destination (str): The home directory to make. Must not already exist
+        """
+        os.makedirs(destination)
+        for entry in os.scandir(self.path):
+            target = os.path.join(destination, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in self.cache:
+                    os.makedirs(target)
+                elif entry.name in self.shared:
+                    shutil.copytree(
+                        entry.path,
+                        target,
+                        ignore=_ignore_fifos,
+                        copy_function=_link_or_copy,
+                    )
+                else:
+                    shutil.copytree(entry.path, target, ignore=_ignore_fifos)
+            else:
+                # Loose files at the top level are small. Copy them to be safe
+                shutil.copy2(entry.path, target)
+
+    def cleanup(self):
+        """Delete the template, if it was made in a temporary directory"""
+        if self._temporary and self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+def _link_or_copy(source, destination):
+    """Hard link a file, or copy it if it can't be linked (such as across filesystems)"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def launch(consoles, run_kwargs=None, connect=True, workers=None):
+    """Run (and connect to) many Dolphin consoles at once
+
+    Args:
+        consoles (list of console.Console): The consoles to start
+        run_kwargs (dict): Arguments to pass to each console's run(), such as iso_path
+        connect (bool): Also connect to each console once it's running
+        workers (int): Most consoles to start at the same time. Defaults to all of them
+
+    Returns:
+        list of bool: Whether each console connected. All True if not connecting
+    """
+    run_kwargs = run_kwargs or {}
+
+    def start(console):
+        console.run(**run_kwargs)
+        return console.connect() if connect else True
+
+    with ThreadPoolExecutor(max_workers=workers or max(1, len(consoles))) as executor:
+        return list(executor.map(start, consoles))
+
+
+class InstanceStats:
+    """Health and throughput of one supervised console"""
+
+    def __init__(self):
+        self.frames = 0
+        """(int): Frames received from the console, over all its restarts"""
+        self.frames_per_second = 0.0
+        """(float): Recent rate of frames, averaged over about the last second. Only updated
+        as frames arrive, so use as_dict() to get a rate that drops to 0 when they stop"""
+        self.restarts = 0
+        """(int): Number of times the console was restarted"""
+        self.stalls = 0
+        """(int): Number of times the console stopped sending frames, while still running"""
+        self.crashes = 0
+        """(int): Number of times Dolphin exited on its own"""
+        self.last_frame_time = time.monotonic()
+        """(float): time.monotonic() of the last frame (or of the last (re)start)"""
+        self._window_start = self.last_frame_time
+        self._window_frames = 0
+
+    def _restarted(self, now):
+        # Give it a full stall_timeout to get going again, and measure its rate afresh
+        self.last_frame_time = now
+        self.frames_per_second = 0.0
+        self._window_start = now
+        self._window_frames = 0
+
+    def _frame(self, now):
+        self.frames += 1
+        self.last_frame_time = now
+        self._window_frames += 1
+        if now - self._window_start >= 1.0:
+            self.frames_per_second = self._window_frames / (now - self._window_start)
+            self._window_start = now
+            self._window_frames = 0
+
+    def as_dict(self):
+        """(dict): The stats, as a plain dict. frames_per_second is 0 once the console has
+        gone a second without a frame"""
+        since_frame = time.monotonic() - self.last_frame_time
+        return {
+            "frames": self.frames,
+            "frames_per_second": self.frames_per_second if since_frame < 1.0 else 0.0,
+            "restarts": self.restarts,
+            "stalls": self.stalls,
+            "crashes": self.crashes,
+            "seconds_since_frame": since_frame,
+        }
+
+
+class Supervisor:
+    """Keeps a fleet of Dolphin consoles running, restarting any that crash or stall
+
+    Step consoles through the supervisor, with step(index) in place of console.step(). It
+    times each console's frames, and if one hasn't produced a frame in `stall_timeout`
+    seconds (or its Dolphin has exited), it's restarted with Console.restart(). That
+    reruns Dolphin, reconnects, and sets up and reconnects its controllers.
+
+    Note:
+        Use polling_mode consoles. Otherwise a hung Dolphin blocks inside step() forever,
+        and the supervisor never gets a chance to notice.
+    """
+
+    def __init__(self, consoles=(), stall_timeout=10.0, max_restarts=None):
+        """Create a supervisor
+
+        Args:
+            consoles (list of console.Console): Consoles to supervise. More can be added later
+            stall_timeout (float): Seconds without a frame before a console counts as stalled
+            max_restarts (int): Give up on a console after restarting it this many times.
+                None to never give up
+        """
+        self.consoles = []
+        """(list of console.Console): The supervised consoles"""
+        self.stats = []
+        """(list of InstanceStats): The stats of each console, in the same order"""
+        self.stall_timeout = stall_timeout
+        self.max_restarts = max_restarts
+        self._started = time.monotonic()
+        for console in consoles:
+            self.add(console)
+
+    def add(self, console):
+        """Start supervising a console
+
+        Returns:
+            int: Index of the console, for step()
+        """
+        self.consoles.append(console)
+        self.stats.append(InstanceStats())
+        return len(self.consoles) - 1
+
+    def step(self, index):
+        """Step a console to its next frame, restarting it if it's crashed or stalled
+
+        Args:
+            index (int): Which console
+
+        Returns:
+            gamestate.GameState: The next frame. None if there isn't one yet (in polling
+                mode), if the console was just restarted, or if it's been given up on
+        """
+        console = self.consoles[index]
+        gamestate = console.step()
+        if gamestate is not None:
+            self.stats[index]._frame(time.monotonic())
+            return gamestate
+        self.check(index)
+        return None
+
+    def check(self, index=None):
+        """Restart any consoles that have crashed or stalled
+
+        step() already does this for the console it's stepping. Call this to check on
+        consoles that aren't being stepped.
+
+        Args:
+            index (int): Just check this console. None to check them all
+
+        Returns:
+            list of int: Indexes of the consoles that were restarted
+        """
+        indexes = range(len(self.consoles)) if index is None else [index]
+        restarted = []
+        now = time.monotonic()
+        for i in indexes:
+            stats = self.stats[i]
+            if self.max_restarts is not None and stats.restarts >= self.max_restarts:
+                continue
+            if not self.consoles[i].is_running():
+                stats.crashes += 1
+            elif now - stats.last_frame_time > self.stall_timeout:
+                stats.stalls += 1
+            else:
+                continue
+            self.restart(i)
+            restarted.append(i)
+        return restarted
+
+    def restart(self, index):
+        """Restart a console now
+
+        Args:
+            index (int): Which console
+
+        Returns:
+            bool: Whether it reconnected successfully
+        """
+        stats = self.stats[index]
+        stats.restarts += 1
+        connected = self.consoles[index].restart()
+        stats._restarted(time.monotonic())
+        return connected
+
+    def metrics(self):
+        """Throughput and health of the whole fleet
+
+        Returns:
+            dict: Totals across all consoles ("frames", "frames_per_second", "restarts",
+                "stalls", "crashes", and "uptime" in seconds), plus "instances", a list of
+                each console's InstanceStats.as_dict()
+        """
+        instances = [stats.as_dict() for stats in self.stats]
+        totals = {
+            name: sum(instance[name] for instance in instances)
+            for name in ["frames", "frames_per_second", "restarts", "stalls", "crashes"]
+        }
+        totals["uptime"] = time.monotonic() - self._started
+        totals["instances"] = instances
+        return totals
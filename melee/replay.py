@@ -0,0 +1,540 @@
+"""Bulk readers for SLP replay files
+
+Console.step() builds a full GameState object for every frame, which is what you want for a
+bot, but is wasteful when you just want the numbers out of thousands of replays (say, for
+training a model). The functions here read a replay in one go and return NumPy arrays instead.
+
+The values match what Console produces for the same file, including libmelee's fixups
+such as re-indexing action frames to start at 1.
+"""
+
+import csv
+import multiprocessing
+import os
+from struct import Struct
+
+import numpy as np
+from packaging import version
+
+from melee import enums, framedecoder, stages
+from melee.encoding import PLAYER_DTYPE
+from melee.console import SlippiVersionTooLow
+from melee.enums import Action
+from melee.slpfilestreamer import (
+    SLPFileStreamer,
+    EventType,
+    decode_metadata,
+    parse_header,
+)
+
+
+class InvalidReplay(Exception):
+    """Raised when a replay file can't be read"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+# Post-frame fields that are copied straight across into the columns
+_COPIED_FIELDS = (
+    "x",
+    "y",
+    "shield_strength",
+    "stock",
+    "jumps_left",
+    "speed_air_x_self",
+    "speed_y_self",
+    "speed_x_attack",
+    "speed_y_attack",
+    "speed_ground_x_self",
+    "ecb_top_x",
+    "ecb_top_y",
+    "ecb_bottom_x",
+    "ecb_bottom_y",
+    "ecb_left_x",
+    "ecb_left_y",
+    "ecb_right_x",
+    "ecb_right_y",
+)
+
+_FRAME_NUMBER = Struct(">i")
+_PAYLOAD_SIZE = Struct(">H")
+
+_zero_index_keys = None
+
+
+def _zero_index_keys_array():
+    """Sorted array of (character << 16 | action) keys whose action frames are indexed at 0"""
+    global _zero_index_keys
+    if _zero_index_keys is None:
+        path = os.path.dirname(os.path.realpath(__file__))
+        keys = set()
+        with open(path + "/actiondata.csv") as csvfile:
+            for line in csv.DictReader(csvfile):
+                if line["zeroindex"] == "True":
+                    keys.add((int(line["character"]) << 16) | int(line["action"]))
+        _zero_index_keys = np.array(sorted(keys), dtype=np.int64)
+    return _zero_index_keys
+
+
+class ReplayColumns:
+    """The frames of a whole game, as NumPy structured arrays"""
+
+    def __init__(self):
+        self.frames = np.zeros(0, dtype=np.int32)
+        """(np.ndarray): The frame numbers that Console.step() would return, in order"""
+        self.players = dict()
+        """(dict of int - np.ndarray): Per-frame PLAYER_DTYPE rows. Key is controller port"""
+        self.nana = dict()
+        """(dict of int - np.ndarray): Per-frame PLAYER_DTYPE rows for Nana. Key is controller port"""
+        self.slp_version = "unknown"
+        """(str): The SLP version of the file"""
+        self.stage = enums.Stage.NO_STAGE
+        """(enums.Stage): The stage being played on"""
+        self.is_teams = False
+        """(bool): Is this a teams game?"""
+        self.costume = dict()
+        """(dict of int - int): Costume index for each controller port"""
+        self.cpu_level = dict()
+        """(dict of int - int): CPU level for each controller port. 0 for human players"""
+        self.team_id = dict()
+        """(dict of int - int): Team ID for each controller port"""
+        self.startAt = ""
+        """(string): Timestamp string of when the game started. Might be blank."""
+        self.playedOn = ""
+        """(string): Platform the game was played on. Might be blank."""
+        self.consoleNick = ""
+        """(string): The name of the console the replay was created on. Might be blank."""
+
+
+def _gather(data, offsets, size, layout):
+    """Decode every event at the given offsets in one vectorized pass
+
+    Raises:
+        InvalidReplay: If any of the events runs past the end of the data
+    """
+    if len(offsets) and (offsets.min() < 0 or offsets.max() + size > len(data)):
+        raise InvalidReplay("Event runs past the end of the file")
+    # A view of every `size` bytes window of the data, to pick the events' rows out of
+    windows = np.lib.stride_tricks.as_strided(
+        data,
+        shape=(max(len(data) - size + 1, 0), size),
+        strides=(data.strides[0], data.strides[0]),
+        writeable=False,
+    )
+    return windows[offsets].view(layout.dtype(size)).reshape(len(offsets))
+
+
+def _field(records, layout, name):
+    """Pull one field out of the decoded events, or its default if the payload is too short"""
+    if name in records.dtype.names:
+        return records[name]
+    return np.full(len(records), layout.default(name))
+
+
+def _last_per_segment(segments):
+    """Mask keeping only the last event of each run of equal segment numbers"""
+    keep = np.ones(len(segments), dtype=np.bool_)
+    keep[:-1] = segments[1:] != segments[:-1]
+    return keep
+
+
+def read_columns(path, allow_old_version=False):
+    """Read a whole SLP file into per-port structured arrays
+
+    Args:
+        path (str): Path to the SLP file
+        allow_old_version (bool): Allow SLP versions older than 3.0.0, same as for Console
+
+    Returns:
+        ReplayColumns: The game's frames
+
+    Raises:
+        InvalidReplay: If the file is corrupt or not an SLP file
+        console.SlippiVersionTooLow: If the SLP version is too old and allow_old_version is unset
+    """
+    streamer = SLPFileStreamer(path)
+    if not streamer.connect():
+        raise InvalidReplay("Could not parse " + str(path))
+    raw = streamer.raw
+
+    columns = ReplayColumns()
+    columns.playedOn = streamer.playedOn
+    columns.startAt = streamer.timestamp
+    columns.consoleNick = streamer.consoleNick
+
+    # First, a single cheap pass over the event stream. This only looks at command bytes
+    #   and frame numbers, to work out which frame (if any) Console would report each
+    #   event as part of. Console reports a frame when its bookend arrives (or for old
+    #   files, when the frame number goes up), and drops rollback frames it has already seen.
+    pre_offsets, pre_segments = [], []
+    post_offsets, post_segments = [], []
+    pre_size, post_size = 0, 0
+    frames = []
+    start = None
+    manual_bookends = False
+    segment = 0
+    gamestate_frame = -10000
+    console_frame = 0
+    stream_frame = -9999
+    pre_frame = EventType.PRE_FRAME.value
+    post_frame = EventType.POST_FRAME.value
+    for command, offset, size in streamer.events():
+        if command == pre_frame or command == post_frame:
+            if manual_bookends:
+                frame = _FRAME_NUMBER.unpack_from(raw, offset + 1)[0]
+                if frame > stream_frame and console_frame != -10000:
+                    frames.append(gamestate_frame)
+                    segment += 1
+                    gamestate_frame = -10000
+                stream_frame = frame
+            if command == pre_frame:
+                pre_offsets.append(offset)
+                pre_segments.append(segment)
+                pre_size = size
+            else:
+                gamestate_frame = _FRAME_NUMBER.unpack_from(raw, offset + 1)[0]
+                post_offsets.append(offset)
+                post_segments.append(segment)
+                post_size = size
+            if manual_bookends:
+                console_frame = gamestate_frame
+        elif command == EventType.FRAME_BOOKEND.value:
+            if gamestate_frame > console_frame:
+                console_frame = gamestate_frame
+                frames.append(gamestate_frame)
+                segment += 1
+                gamestate_frame = -10000
+        elif command == EventType.GAME_START.value:
+            start = dict(
+                zip(
+                    framedecoder.GAME_START.names,
+                    framedecoder.GAME_START.unpack_from(raw, offset, size),
+                )
+            )
+            columns.slp_version = "%d.%d.%d" % (
+                start["major"],
+                start["minor"],
+                start["build"],
+            )
+            if start["major"] < 3 and not allow_old_version:
+                raise SlippiVersionTooLow(columns.slp_version)
+            manual_bookends = allow_old_version and (
+                version.parse(columns.slp_version) < version.parse("3.0.0")
+            )
+            console_frame = -10000
+        elif command == EventType.GAME_END.value:
+            if manual_bookends:
+                frames.append(gamestate_frame)
+                segment += 1
+                gamestate_frame = -10000
+
+    if start is None:
+        raise InvalidReplay("No game start event in " + str(path))
+
+    try:
+        columns.stage = enums.to_internal_stage(start["stage"])
+    except ValueError:
+        columns.stage = enums.Stage.NO_STAGE
+    columns.is_teams = start["is_teams"] != 0
+    for i in range(4):
+        columns.costume[i + 1] = start["costume_" + str(i)]
+        columns.team_id[i + 1] = start["team_id_" + str(i)]
+        columns.cpu_level[i + 1] = start["cpu_level_" + str(i)]
+        if start["player_type_" + str(i)] != 1:
+            columns.cpu_level[i + 1] = 0
+    columns.frames = np.array(frames, dtype=np.int32)
+    if not post_offsets:
+        return columns
+
+    # Then decode all of the frame events at once
+    data = np.frombuffer(raw, dtype=np.uint8)
+    post_layout, pre_layout = framedecoder.POST_FRAME, framedecoder.PRE_FRAME
+    post = _gather(
+        data,
+        np.array(post_offsets, dtype=np.int64),
+        post_size,
+        post_layout,
+    )
+    post_segments = np.array(post_segments, dtype=np.int64)
+    pre = None
+    if pre_offsets:
+        pre = _gather(
+            data,
+            np.array(pre_offsets, dtype=np.int64),
+            pre_size,
+            pre_layout,
+        )
+    pre_segments = np.array(pre_segments, dtype=np.int64)
+
+    # Events in a frame that never got reported (the tail end of the file) are dropped
+    reported = post_segments < len(frames)
+    post_port = post["port"].astype(np.int64) + 1
+    post_follower = post["is_follower"] == 1
+    post_action = post["action"].astype(np.int64)
+    post_frames = post["frame"].astype(np.int64)
+    raw_action_frame = post["action_frame"]
+
+    # Invulnerability from respawning or grabbing the ledge. Console tracks one
+    #   (start frame, duration) per port, set by whichever event most recently triggered it
+    trigger = np.full(len(post), -1, dtype=np.int64)
+    trigger[post_action == Action.ON_HALO_WAIT.value] = 120
+    trigger[(post_action == Action.ON_HALO_DESCENT.value) & (post_frames > 150)] = 120
+    with np.errstate(invalid="ignore"):
+        edge_frame_1 = np.trunc(raw_action_frame) == 1
+    trigger[(post_action == Action.EDGE_CATCHING.value) & edge_frame_1] = 36
+    trigger[post_frames == -123] = 0
+
+    zero_index_keys = _zero_index_keys_array()
+    for port in np.unique(post_port):
+        in_port = post_port == port
+        port_events = np.flatnonzero(in_port)
+        triggered = trigger[port_events] >= 0
+        last = np.where(triggered, np.arange(len(port_events)), -1)
+        last = np.maximum.accumulate(last)
+        start_frame = np.where(last >= 0, post_frames[port_events[last]], 0)
+        duration = np.where(last >= 0, trigger[port_events[last]], 0)
+        invulnerability_left = np.maximum(
+            0, duration - (post_frames[port_events] - start_frame)
+        )
+
+        # The leader's reported rows, used to look back at the previous frame
+        leader = port_events[~post_follower[port_events] & reported[port_events]]
+        leader = leader[_last_per_segment(post_segments[leader])]
+        previous_action = np.full(len(frames) + 1, -1, dtype=np.int64)
+        previous_action[post_segments[leader] + 1] = post_action[leader]
+
+        for follower, output in ((False, columns.players), (True, columns.nana)):
+            selected = in_port & (post_follower == follower) & reported
+            rows = np.flatnonzero(selected)
+            if len(rows) == 0:
+                continue
+            rows = rows[_last_per_segment(post_segments[rows])]
+            segments = post_segments[rows]
+            table = np.zeros(len(rows), dtype=PLAYER_DTYPE)
+
+            table["frame"] = post["frame"][rows]
+            character = post["character"][rows].astype(np.int64)
+            action = post_action[rows]
+            table["character"] = character
+            table["action"] = action
+            action_frame = raw_action_frame[rows].astype(np.int32)
+            keys = (character << 16) | action
+            position = np.searchsorted(zero_index_keys, keys)
+            position = np.minimum(position, len(zero_index_keys) - 1)
+            if len(zero_index_keys):
+                action_frame += zero_index_keys[position] == keys
+            table["action_frame"] = action_frame
+            for name in _COPIED_FIELDS:
+                table[name] = _field(post, post_layout, name)[rows]
+            table["facing"] = post["facing"][rows] > 0
+            table["percent"] = post["percent"][rows].astype(np.int32)
+            flags = _field(post, post_layout, "state_flags_4")[rows]
+            table["is_powershield"] = (flags & 0x20) == 0x20
+            hitstun = _field(post, post_layout, "hitstun")[rows]
+            with np.errstate(invalid="ignore"):
+                table["hitstun_frames_left"] = np.where(
+                    np.isfinite(hitstun), hitstun, 0
+                ).astype(np.int32)
+            table["hitlag_left"] = _field(post, post_layout, "hitlag_left")[
+                rows
+            ].astype(np.int32)
+            table["on_ground"] = _field(post, post_layout, "airborne")[rows] == 0
+
+            # Derived helpers. Old files never have a previous gamestate to look at
+            if manual_bookends:
+                has_previous = np.zeros(len(rows), dtype=np.bool_)
+            else:
+                has_previous = previous_action[segments] >= 0
+            event_index = np.searchsorted(port_events, rows)
+            invulnerable_left = np.where(
+                trigger[rows] >= 0,
+                trigger[rows],
+                np.where(has_previous, invulnerability_left[event_index], 0),
+            )
+            table["invulnerability_left"] = invulnerable_left
+            table["invulnerable"] = (
+                _field(post, post_layout, "invulnerable")[rows] != 0
+            ) | (invulnerable_left > 0)
+            table["moonwalkwarning"] = (
+                (action == Action.DASHING.value)
+                & has_previous
+                & (previous_action[segments] != Action.DASHING.value)
+                & (previous_action[segments] != Action.TURNING.value)
+            )
+            if columns.stage in stages.EDGE_GROUND_POSITION:
+                edge = stages.EDGE_GROUND_POSITION[columns.stage]
+                table["off_stage"] = (
+                    (np.abs(table["x"].astype(np.float64)) > edge) | (table["y"] < -6)
+                ) & ~table["on_ground"]
+            # libmelee doesn't read IASA out of replays, so Console always reports it as False
+            table["iasa"] = False
+
+            # Controller inputs come from the pre-frame event of the same frame
+            table["main_stick_x"] = 0.5
+            table["main_stick_y"] = 0.5
+            table["c_stick_x"] = 0.5
+            table["c_stick_y"] = 0.5
+            if pre is not None:
+                pre_rows = np.flatnonzero(
+                    (pre["port"].astype(np.int64) + 1 == port)
+                    & ((pre["is_follower"] == 1) == follower)
+                )
+                pre_rows = pre_rows[_last_per_segment(pre_segments[pre_rows])]
+                match = np.searchsorted(pre_segments[pre_rows], segments)
+                match = np.minimum(match, max(len(pre_rows) - 1, 0))
+                found = np.zeros(len(rows), dtype=np.bool_)
+                if len(pre_rows):
+                    found = pre_segments[pre_rows][match] == segments
+                source = pre_rows[match[found]]
+                table["main_stick_x"][found] = (pre["main_x"][source] / 2) + 0.5
+                table["main_stick_y"][found] = (pre["main_y"][source] / 2) + 0.5
+                table["c_stick_x"][found] = (pre["c_x"][source] / 2) + 0.5
+                table["c_stick_y"][found] = (pre["c_y"][source] / 2) + 0.5
+                table["shoulder"][found] = pre["trigger"][source]
+                table["buttons"][found] = pre["buttons"][source]
+                table["raw_main_stick_x"][found] = _field(
+                    pre, pre_layout, "raw_main_x"
+                )[source]
+                table["raw_main_stick_y"][found] = _field(
+                    pre, pre_layout, "raw_main_y"
+                )[source]
+
+            output[int(port)] = table
+
+    return columns
+
+
+class ReplayMetadata:
+    """A summary of one replay, for filtering a corpus. See scan_metadata()"""
+
+    def __init__(self, path):
+        self.path = path
+        """(str): Path to the SLP file"""
+        self.error = ""
+        """(str): Why the file couldn't be read. Blank if it was read fine"""
+        self.slp_version = "unknown"
+        """(str): The SLP version of the file"""
+        self.stage = enums.Stage.NO_STAGE
+        """(enums.Stage): The stage being played on"""
+        self.is_teams = False
+        """(bool): Is this a teams game?"""
+        self.characters = dict()
+        """(dict of int - enums.Character): Starting character of each controller port in the game"""
+        self.cpu_level = dict()
+        """(dict of int - int): CPU level of each controller port in the game. 0 for human players"""
+        self.connect_codes = dict()
+        """(dict of int - str): Slippi connect code of each port, for online games"""
+        self.nicknames = dict()
+        """(dict of int - str): Slippi display name of each port, for online games"""
+        self.startAt = ""
+        """(string): Timestamp string of when the game started. Might be blank."""
+        self.playedOn = ""
+        """(string): Platform the game was played on. Might be blank."""
+        self.consoleNick = ""
+        """(string): The name of the console the replay was created on. Might be blank."""
+        self.lastFrame = None
+        """(int): The last frame of the game, according to the metadata. None if not known"""
+
+def _scan_one(path):
+    """Read the GAME_START event and metadata of one file, and nothing else"""
+    record = ReplayMetadata(str(path))
+    try:
+        with open(path, mode="rb") as replayfile:
+            # The PAYLOADS and GAME_START events are always the first two, and small
+            head = replayfile.read(0x1000)
+            location = parse_header(head)
+            if location is None:
+                record.error = "Not an SLP file"
+                return record
+            start, length = location
+            if length == 0:
+                record.error = "File is still being written"
+                return record
+            if start + 2 > len(head) or head[start] != EventType.PAYLOADS.value:
+                record.error = "Missing PAYLOADS event"
+                return record
+            payload_size = head[start + 1]
+            game_start_size = 0
+            num_commands = (payload_size - 1) // 3
+            for cursor in range(start + 2, start + 2 + (num_commands * 3), 3):
+                if head[cursor] == EventType.GAME_START.value:
+                    game_start_size = _PAYLOAD_SIZE.unpack_from(head, cursor + 1)[0] + 1
+            offset = start + payload_size + 1
+            if len(head) < offset + game_start_size:
+                head += replayfile.read(offset + game_start_size - len(head))
+            if (
+                game_start_size == 0
+                or len(head) < offset + game_start_size
+                or head[offset] != EventType.GAME_START.value
+            ):
+                record.error = "Missing GAME_START event"
+                return record
+
+            replayfile.seek(start + length)
+            metadata = decode_metadata(replayfile.read())
+    except OSError as error:
+        record.error = str(error)
+        return record
+
+    game_start = dict(
+        zip(
+            framedecoder.GAME_START.names,
+            framedecoder.GAME_START.unpack_from(head, offset, game_start_size),
+        )
+    )
+    record.slp_version = "%d.%d.%d" % (
+        game_start["major"],
+        game_start["minor"],
+        game_start["build"],
+    )
+    try:
+        record.stage = enums.to_internal_stage(game_start["stage"])
+    except ValueError:
+        record.stage = enums.Stage.NO_STAGE
+    record.is_teams = game_start["is_teams"] != 0
+    for i in range(4):
+        # 3 is an empty port
+        if game_start["player_type_" + str(i)] == 3:
+            continue
+        record.characters[i + 1] = enums.to_internal(game_start["character_" + str(i)])
+        record.cpu_level[i + 1] = 0
+        if game_start["player_type_" + str(i)] == 1:
+            record.cpu_level[i + 1] = game_start["cpu_level_" + str(i)]
+
+    record.startAt = metadata.get("startAt", "")
+    record.playedOn = metadata.get("playedOn", "")
+    record.consoleNick = metadata.get("consoleNick", "")
+    record.lastFrame = metadata.get("lastFrame")
+    for port, player in metadata.get("players", {}).items():
+        names = player.get("names", {}) if isinstance(player, dict) else {}
+        if names.get("code"):
+            record.connect_codes[int(port) + 1] = names["code"]
+        if names.get("netplay"):
+            record.nicknames[int(port) + 1] = names["netplay"]
+    return record
+
+
+def scan_metadata(paths, workers=1):
+    """Quickly summarize a lot of replays, without reading their frames
+
+    Only the GAME_START event at the start of each file and the metadata at the end of it
+    are read. Useful for filtering a corpus by character, stage, player, date or version.
+    (See corpus.find_replays() for getting all the replays in a directory)
+
+    Files that can't be read are not skipped, but have their `error` set instead.
+
+    Args:
+        paths (list of str): SLP files to scan
+        workers (int): Number of processes to scan with. None for one per CPU
+
+    Returns:
+        list of ReplayMetadata: One record per path, in the same order
+    """
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < 2:
+        return [_scan_one(path) for path in paths]
+    with multiprocessing.Pool(workers) as pool:
+        chunksize = max(1, min(256, len(paths) // (workers * 4)))
+        return pool.map(_scan_one, paths, chunksize=chunksize)
@@ -0,0 +1,191 @@
+"""Hand frames from a Console in one process to readers in others, through shared memory
+
+Sending GameStates between processes means pickling them, with all their nested objects and
+enums, every frame. A SharedFrame is instead a fixed-layout record (SHARED_FRAME_DTYPE) in a
+block of shared memory. The Console writes each new frame straight into it (see Console's
+shared_frame), and readers in any process attach to it by name and copy it out.
+
+There's no lock. Writes are guarded by a sequence number, seqlock style: it's made odd before
+the record is written, and even again after. A reader takes the sequence number, copies the
+record, and checks the sequence number again. If it changed (or was odd), the copy may be torn
+so it just tries again. The writer never waits on readers.
+
+Needs Python 3.8 or newer, for shared memory. So it isn't imported along with the rest of
+libmelee: use `import melee.sharedframe`.
+"""
+
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from melee.encoding import ABSENT, PLAYER_DTYPE, player_record
+
+SHARED_FRAME_DTYPE = np.dtype(
+    [
+        ("frame", np.int32),
+        ("menu_state", np.uint8),
+        ("stage", np.uint8),
+        ("players", PLAYER_DTYPE, (4,)),
+        ("nana", PLAYER_DTYPE, (4,)),
+    ]
+)
+"""(np.dtype): One frame of the game
+
+`players[port - 1]` is the player on that controller port, and `nana` likewise for Nana. Ports
+with nobody on them have a frame of -10000. `menu_state` and `stage` are enum values."""
+
+# The sequence number comes first, then the record
+_RECORD_OFFSET = 8
+
+# How long readers sleep between checks for a new frame, in seconds. Starts short, and backs
+#   off so that waiting out a whole frame doesn't keep a core busy
+_FIRST_SLEEP = 0.00005
+_LONGEST_SLEEP = 0.001
+
+# Names of the shared memory this process created, and so is tracking
+_created = set()
+
+
+def _attach(name):
+    """Attach to existing shared memory, without this process ever removing it
+
+    Only the creator gets to remove the block. Otherwise this process's resource tracker
+    would remove it as soon as this process exits"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python older than 3.13 always tracks
+        pass
+    memory = shared_memory.SharedMemory(name=name)
+    # Child processes share their parent's resource tracker, which has to keep tracking it.
+    #   So does the creator itself, if it attaches to its own memory
+    if multiprocessing.parent_process() is None and name not in _created:
+        resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+
+class SharedFrame:
+    """The most recent frame of a game, in shared memory"""
+
+    def __init__(self, name=None):
+        """Create a new SharedFrame, or attach to an existing one
+
+        Args:
+            name (str): Name of an existing SharedFrame to attach to (see `name`). None to
+                create a new one
+        """
+        self._owner = name is None
+        if self._owner:
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=_RECORD_OFFSET + SHARED_FRAME_DTYPE.itemsize
+            )
+            _created.add(self._memory.name)
+        else:
+            self._memory = _attach(name)
+        self._sequence = np.ndarray((), dtype=np.uint64, buffer=self._memory.buf)
+        self.record = np.ndarray(
+            (), dtype=SHARED_FRAME_DTYPE, buffer=self._memory.buf, offset=_RECORD_OFFSET
+        )
+        """(np.ndarray): The record itself, in shared memory. Use read() to get a
+        consistent copy, since it can change at any time"""
+        if self._owner:
+            self._sequence[()] = 0
+            self.record["frame"] = -10000
+            self.record["players"] = ABSENT
+            self.record["nana"] = ABSENT
+
+    @property
+    def name(self):
+        """(str): Name of the shared memory, to attach to from other processes"""
+        return self._memory.name
+
+    @property
+    def frames_written(self):
+        """(int): Number of frames that have been written so far"""
+        return int(self._sequence) // 2
+
+    def write(self, gamestate):
+        """Write a frame into the record
+
+        Args:
+            gamestate (gamestate.GameState): The frame to write
+        """
+        record = self.record
+        frame = gamestate.frame
+        sequence = int(self._sequence)
+        self._sequence[()] = sequence + 1
+        record["frame"] = frame
+        record["menu_state"] = gamestate.menu_state.value
+        record["stage"] = gamestate.stage.value
+        players, nana = record["players"], record["nana"]
+        for index in range(4):
+            player = gamestate.players.get(index + 1)
+            if player is None:
+                players[index] = ABSENT
+                nana[index] = ABSENT
+                continue
+            players[index] = player_record(player, frame)
+            if player.nana is not None:
+                nana[index] = player_record(player.nana, frame)
+            else:
+                nana[index] = ABSENT
+        self._sequence[()] = sequence + 2
+
+    def read(self, out=None):
+        """Copy out the most recent frame
+
+        Never returns a half-written frame. If the writer is in the middle of one, waits for
+        it to finish.
+
+        Args:
+            out (np.ndarray): A SHARED_FRAME_DTYPE record to copy into. None to make a new one
+
+        Returns:
+            (int, np.ndarray): frames_written as of the copy, and the copy itself
+        """
+        if out is None:
+            out = np.empty((), dtype=SHARED_FRAME_DTYPE)
+        pause = _FIRST_SLEEP
+        while True:
+            before = int(self._sequence)
+            if before % 2 == 0:
+                np.copyto(out, self.record)
+                if int(self._sequence) == before:
+                    return before // 2, out
+            # Give the writer a chance to finish
+            time.sleep(pause)
+            pause = min(pause * 2, _LONGEST_SLEEP)
+
+    def wait(self, after, timeout=None, out=None):
+        """Wait for a new frame, then copy it out
+
+        Args:
+            after (int): Wait until more than this many frames have been written. Usually
+                the frames_written returned from the last read()
+            timeout (float): Longest to wait, in seconds. None to wait forever
+            out (np.ndarray): A SHARED_FRAME_DTYPE record to copy into. None to make a new one
+
+        Returns:
+            (int, np.ndarray): Same as read(). None if the timeout ran out first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pause = _FIRST_SLEEP
+        while int(self._sequence) // 2 <= after:
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(pause)
+            pause = min(pause * 2, _LONGEST_SLEEP)
+        return self.read(out)
+
+    def close(self):
+        """Detach from the shared memory. The creator also removes it"""
+        if self._memory is None:
+            return
+        del self.record, self._sequence
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+            _created.discard(self._memory.name)
+        self._memory = None
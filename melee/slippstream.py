@@ -5,6 +5,7 @@ This can be used to talk to some server implementing the Slippstream protocol
 (i.e. the Project Slippi fork of Nintendont or Slippi Ishiiruka).
 """
 
+import asyncio
 import socket
 from enum import Enum
 import enet
@@ -17,6 +18,9 @@ import time
 # The null token used for initial SlippiComm handshakes
 NULL_TOKEN = b'\x00\x00\x00\x00'
 
+# Returned when an enet event doesn't result in a message, and the next one should be read
+_NO_MESSAGE = object()
+
 # pylint: disable=too-few-public-methods
 class EventType(Enum):
     """ Replay event types """
@@ -75,58 +79,108 @@ class SlippstreamClient():
 
     def dispatch(self, polling_mode):
         """Dispatch messages with the peer (read and write packets)"""
-        event = None
-        event_type = 1000
-        while event_type not in [enet.EVENT_TYPE_RECEIVE]:
-            if self.gamecube:
-                wait_time = 1000
-                if polling_mode:
-                    wait_time = 0
+        if self.gamecube:
+            wait_time = 1000
+            if polling_mode:
+                wait_time = 0
+            while True:
                 event = self._host.service(wait_time)
-                event_type = event.type
+                if event.type == enet.EVENT_TYPE_NONE and polling_mode:
+                    return None
+                message = self.__handle_enet_event(event)
+                if message is not _NO_MESSAGE:
+                    return message
+        else:
+            self.buf += self.server.recv(1000)
+            return self.__handle_udp_buffer()
 
+    async def dispatch_async(self, polling_mode=False):
+        """Same as dispatch(), but waits on the peer without blocking the asyncio event loop"""
+        if self.gamecube:
+            while True:
+                event = self._host.service(0)
                 if event.type == enet.EVENT_TYPE_NONE:
                     if polling_mode:
                         return None
-                if event.type == enet.EVENT_TYPE_RECEIVE:
-                    try:
-                        return json.loads(event.packet.data)
-                    except json.JSONDecodeError:
-                        # This happens at the end of a game for some reason?
-                        if len(event.packet.data) == 0:
-                            event_type = 0
-                            continue
-                        return None
-                elif event.type == enet.EVENT_TYPE_CONNECT:
-                    handshake = json.dumps({
-                        "type" : "connect_request",
-                        "cursor" : 0,
-                    })
-                    self._peer.send(0, enet.Packet(handshake.encode()))
-                elif event.type == enet.EVENT_TYPE_DISCONNECT:
+                    await self.__wait_readable(0.1)
+                    continue
+                message = self.__handle_enet_event(event)
+                if message is not _NO_MESSAGE:
+                    return message
+        else:
+            self.server.setblocking(False)
+            if polling_mode:
+                try:
+                    self.buf += self.server.recv(1000)
+                except BlockingIOError:
                     return None
             else:
-                self.buf += self.server.recv(1000)
-                # Exclude the the message length in the header
-                # msg = ubjson.loadb(self.buf[4:])
-                payload = self.buf[:]
-                # Clear out the old buffer
-                del self.buf
-                self.buf = bytearray()
-                # event = {}
-                # if msg["type"] == 1:
-                #     event = {"type": "connect_reply",
-                #             "nick": msg["payload"]["nick"],
-                #             "version": msg["payload"]["nintendontVersion"],
-                #             "cursor": msg["payload"]["pos"]}
-                event = {"payload": payload}
-                if payload[0] == 0x3E:
-                    event["type"] = "menu_event"
-                else:
-                    event["type"] = "game_event"
-                return event
-
-        return None
+                self.buf += await asyncio.get_running_loop().sock_recv(self.server, 1000)
+            return self.__handle_udp_buffer()
+
+    def __handle_enet_event(self, event):
+        """Turn an enet event into a message. _NO_MESSAGE if there isn't one (yet)"""
+        if event.type == enet.EVENT_TYPE_RECEIVE:
+            try:
+                return json.loads(event.packet.data)
+            except json.JSONDecodeError:
+                # This happens at the end of a game for some reason?
+                if len(event.packet.data) == 0:
+                    return _NO_MESSAGE
+                return None
+        elif event.type == enet.EVENT_TYPE_CONNECT:
+            self.__send_connect_request()
+        elif event.type == enet.EVENT_TYPE_DISCONNECT:
+            return None
+        return _NO_MESSAGE
+
+    def __handle_udp_buffer(self):
+        """Turn what's been received from the GameCube into a message"""
+        # Exclude the the message length in the header
+        # msg = ubjson.loadb(self.buf[4:])
+        # Hand over the buffer itself rather than a copy, and start a new one
+        payload = self.buf
+        self.buf = bytearray()
+        # event = {}
+        # if msg["type"] == 1:
+        #     event = {"type": "connect_reply",
+        #             "nick": msg["payload"]["nick"],
+        #             "version": msg["payload"]["nintendontVersion"],
+        #             "cursor": msg["payload"]["pos"]}
+        event = {"payload": payload}
+        if payload[0] == 0x3E:
+            event["type"] = "menu_event"
+        else:
+            event["type"] = "game_event"
+        return event
+
+    async def __wait_readable(self, timeout):
+        """Wait (up to timeout seconds) for a packet to arrive on the enet socket
+
+        The timeout makes sure enet still gets serviced regularly, for its keepalives
+        and resends, when nothing is arriving."""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fileno = self._host.socket.fileno()
+        try:
+            loop.add_reader(fileno, lambda: ready.done() or ready.set_result(None))
+        except NotImplementedError:
+            # Windows' default event loop can't watch sockets. Fall back to polling
+            await asyncio.sleep(0.001)
+            return
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(fileno)
+
+    def __send_connect_request(self):
+        handshake = json.dumps({
+            "type" : "connect_request",
+            "cursor" : 0,
+        })
+        self._peer.send(0, enet.Packet(handshake.encode()))
 
     def __new_handshake(self, cursor=0, token=NULL_TOKEN):
         """ Returns a new binary handshake message """
@@ -158,11 +212,7 @@ class SlippstreamClient():
                 for _ in range(4):
                     event = self._host.service(1000)
                     if event.type == enet.EVENT_TYPE_CONNECT:
-                        handshake = json.dumps({
-                                    "type" : "connect_request",
-                                    "cursor" : 0,
-                                })
-                        self._peer.send(0, enet.Packet(handshake.encode()))
+                        self.__send_connect_request()
                         return True
                 return False
             except OSError:
@@ -173,3 +223,28 @@ class SlippstreamClient():
                                 socket.SOCK_DGRAM)
             self.server.bind(("0.0.0.0", 55559))
             return True
+
+    async def connect_async(self):
+        """ Same as connect(), but waits on the server without blocking the asyncio event loop
+
+        Returns True on success, False on failure
+        """
+        if not self.gamecube:
+            # Just binds a socket. Never waits
+            return self.connect()
+        try:
+            self._peer = self._host.connect(enet.Address(bytes(self.address, 'utf-8'), int(self.port)), 1)
+        except OSError:
+            return False
+        deadline = time.time() + 4
+        try:
+            while time.time() < deadline:
+                event = self._host.service(0)
+                if event.type == enet.EVENT_TYPE_CONNECT:
+                    self.__send_connect_request()
+                    return True
+                if event.type == enet.EVENT_TYPE_NONE:
+                    await self.__wait_readable(min(0.1, max(0, deadline - time.time())))
+            return False
+        except OSError:
+            return False
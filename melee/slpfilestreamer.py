@@ -1,11 +1,19 @@
 """SLP File backend for libmelee
 
 Reads Slippi game events from SLP file rather than over network
+
+The file is never decoded as a whole. Only the UBJSON header is parsed, to find where the
+`raw` event stream lives, and events are then read straight out of a memory map of the
+file. The `metadata` element at the end of the file is only decoded if it's asked for.
+
+Files that Dolphin is still writing can be followed as they grow (see `follow`).
 """
 
+import mmap
+import time
 import ubjson
 from enum import Enum
-import numpy as np
+from struct import calcsize, unpack_from
 
 
 # pylint: disable=too-few-public-methods
@@ -23,106 +31,510 @@ class EventType(Enum):
     FRAME_BOOKEND = 0x3C
 
 
+# Every SLP file starts with this, followed by the length of the raw event stream
+_RAW_HEADER = b"{U\x03raw[$U#"
+# UBJSON integer type markers that the raw length can be written with
+_LENGTH_FORMATS = {b"i": ">b", b"U": ">B", b"I": ">h", b"l": ">i", b"L": ">q"}
+
+
+def parse_header(header):
+    """Find the raw event stream in the first bytes of an SLP file
+
+    Args:
+        header (bytes): The start of the file. 16 bytes is always enough
+
+    Returns:
+        (int, int): Tuple of (offset of the raw event stream, its length in bytes).
+            The length is 0 if the file is still being written. None if this is not an
+            SLP file.
+    """
+    if not header.startswith(_RAW_HEADER):
+        return None
+    cursor = len(_RAW_HEADER)
+    length_format = _LENGTH_FORMATS.get(header[cursor : cursor + 1])
+    if length_format is None:
+        return None
+    cursor += 1
+    if len(header) < cursor + calcsize(length_format):
+        return None
+    length = unpack_from(length_format, header, cursor)[0]
+    if length < 0:
+        return None
+    return cursor + calcsize(length_format), length
+
+
+def decode_metadata(tail):
+    """Decode the metadata element from the tail end of an SLP file
+
+    Args:
+        tail (bytes): Everything in the file after the raw event stream
+
+    Returns:
+        dict: The metadata. Empty if it's missing or can't be decoded
+    """
+    # The tail is the rest of the top-level object. Reopen it to make it parseable
+    try:
+        full = ubjson.loadb(b"{" + tail)
+    except ubjson.decoder.DecoderException:
+        return {}
+    if not isinstance(full, dict) or not isinstance(full.get("metadata"), dict):
+        return {}
+    return full["metadata"]
+
+
+class FrameIndex:
+    """Where each frame of a replay starts in its raw event stream
+
+    Built by SLPFileStreamer.frame_index(), in a single pass that only reads command
+    bytes and frame numbers"""
+
+    def __init__(self):
+        self.frames = []
+        """(list of int): Frame numbers, in the order that Console reports them"""
+        self.offsets = []
+        """(list of int): For each frame, the offset in the raw stream of the first event
+        that goes into it. (Just after the previous reported frame ended)"""
+        self.positions = {}
+        """(dict of int to int): Where each frame number is in `frames`"""
+        self.game_start_offset = None
+        """(int): Offset of the GAME_START event. None if there isn't one"""
+        self.game_start_end = None
+        """(int): Offset just past the end of the GAME_START event"""
+        self.eventsize = [0] * 0x100
+        """(list of int): Payload size of every event type, from the PAYLOADS event"""
+        self.manual_bookends = False
+        """(bool): Whether frames end when the frame number goes up (pre-3.0.0 files)"""
+        self.allow_old_version = False
+        """(bool): The allow_old_version setting the index was built with"""
+        self.slp_version = "unknown"
+        """(str): SLP version of the file, from the GAME_START event"""
+        self.stage = 0
+        """(int): Internal stage ID, from the GAME_START event"""
+        self.characters = {}
+        """(dict of int to int): Internal character ID of each port (1-4) that's playing"""
+
+    @property
+    def last_frame(self):
+        """(int): The last frame of the game. None if there are no frames"""
+        if not self.frames:
+            return None
+        return self.frames[-1]
+
+
 class SLPFileStreamer:
-    def __init__(self, path):
+    def __init__(self, path, follow=False, follow_timeout=30.0, index_cache=None):
+        """Create a streamer for an SLP file
+
+        Args:
+            path (str): Path to the SLP file
+            follow (bool): If the file is still being written (by Dolphin), keep reading
+                events from it as they're written, until the game ends. Without this,
+                unfinished files fail to connect.
+            follow_timeout (float): When following, give up if the file hasn't grown in
+                this many seconds. None to wait forever.
+            index_cache (indexcache.FrameIndexCache): Where to save frame indexes (and
+                metadata) of this file, so they only ever need to be built once. Optional
+        """
         self._path = path
+        self._follow = follow
+        self._follow_timeout = follow_timeout
+        self._file = None
+        self._mmap = None
         self._contents = None
+        self._metadata_offset = None
+        self._metadata = None
+        self._frame_index = None
+        self._index_cache = index_cache
+        self._following = False
+        self._finished = False
+        self._buffer_offset = 0
         self.eventsize = [0] * 0x100
         self._index = 0
         self._frame = -9999
-        self.playedOn = ""
-        self.timestamp = ""
-        self.consoleNick = ""
-        self.players = {}
-        self.lastFrame = -9999
 
     def shutdown(self):
-        pass
+        self._contents = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Someone is still holding on to a view of the file. It'll be closed
+                #   when they let go of it
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def raw(self):
+        """(bytes-like): The raw Slippi event stream of the file. None until connected
+
+        Also None while following a file that's still being written, since the stream
+        isn't complete yet"""
+        if self._following:
+            return None
+        return self._contents
+
+    @property
+    def metadata(self):
+        """(dict): The file's metadata element. Only read from the file when first used
+
+        Empty if the file has no (readable) metadata, or is still being written"""
+        if self._metadata is None:
+            # A file that's still being written doesn't have its metadata yet
+            if self._metadata_offset is None:
+                return {}
+            self._metadata = self._read_metadata()
+        return self._metadata
+
+    @property
+    def playedOn(self):
+        """(str): Platform the game was played on. Read from the metadata"""
+        return self.metadata.get("playedOn", "")
+
+    @property
+    def timestamp(self):
+        """(str): Time the game started at. Read from the metadata"""
+        return self.metadata.get("startAt", "")
+
+    @property
+    def consoleNick(self):
+        """(str): Nickname of the console that played the game. Read from the metadata"""
+        return self.metadata.get("consoleNick", "")
+
+    @property
+    def players(self):
+        """(dict): Per-player metadata (such as netplay names), keyed by port index"""
+        return self.metadata.get("players", {})
+
+    @property
+    def lastFrame(self):
+        """(int): Last frame of the game. Read from the metadata"""
+        return self.metadata.get("lastFrame", -9999)
+
+    def _read_metadata(self):
+        if self._mmap is not None:
+            tail = self._mmap[self._metadata_offset :]
+        else:
+            with open(self._path, mode="rb") as file:
+                file.seek(self._metadata_offset)
+                tail = file.read()
+        return decode_metadata(tail)
+
+    def events(self):
+        """Walk the raw event stream without decoding any of the events
+
+        Stops early at the first unknown or truncated event.
+
+        Yields:
+            (int, int, int): Tuples of (command byte, offset of the event in `raw`,
+                size of the event including its command byte)
+        """
+        contents = self.raw
+        if contents is None:
+            return
+        eventsize = [0] * 0x100
+        index = 0
+        length = len(contents)
+        while index < length:
+            command = contents[index]
+            if command == EventType.PAYLOADS.value:
+                payload_size = contents[index + 1]
+                num_commands = (payload_size - 1) // 3
+                for cursor in range(index + 2, index + 2 + (num_commands * 3), 3):
+                    eventsize[contents[cursor]] = (
+                        unpack_from(">H", contents, cursor + 1)[0] + 1
+                    )
+                size = payload_size + 1
+            else:
+                size = eventsize[command]
+            if size == 0 or index + size > length:
+                return
+            yield command, index, size
+            index += size
+
+    def frame_index(self, allow_old_version=False):
+        """Index the frames of the (complete) file. Only built once, then cached
+
+        Works out which frames Console would report, the same way Console does: when a
+        frame's bookend arrives (or for old files, when the frame number goes up), and
+        skipping rollback frames that have already been reported.
+
+        Args:
+            allow_old_version (bool): Treat pre-3.0.0 files as Console does with
+                allow_old_version set. (Frames end when the frame number goes up)
+
+        Returns:
+            FrameIndex: The index. None if the file isn't connected or is still being written
+        """
+        if (
+            self._frame_index is not None
+            and self._frame_index.allow_old_version == allow_old_version
+        ):
+            return self._frame_index
+        contents = self.raw
+        if contents is None:
+            return None
+        if self._index_cache is not None:
+            cached = self._index_cache.load(self._path, allow_old_version)
+            if cached is not None:
+                self._frame_index, metadata = cached
+                if self._metadata is None:
+                    self._metadata = metadata
+                return self._frame_index
+
+        index = FrameIndex()
+        segment_start = 0
+        gamestate_frame = -10000
+        console_frame = 0
+        stream_frame = -9999
+
+        def report():
+            if gamestate_frame not in index.positions:
+                index.positions[gamestate_frame] = len(index.frames)
+                index.frames.append(gamestate_frame)
+                index.offsets.append(segment_start)
+
+        for command, offset, size in self.events():
+            if command in (EventType.PRE_FRAME.value, EventType.POST_FRAME.value):
+                if index.manual_bookends:
+                    frame = unpack_from(">i", contents, offset + 0x1)[0]
+                    if frame > stream_frame and console_frame != -10000:
+                        report()
+                        segment_start = offset
+                        gamestate_frame = -10000
+                    stream_frame = frame
+                if command == EventType.POST_FRAME.value:
+                    gamestate_frame = unpack_from(">i", contents, offset + 0x1)[0]
+                    port = contents[offset + 0x5] + 1
+                    if port not in index.characters and contents[offset + 0x6] == 0:
+                        index.characters[port] = contents[offset + 0x7]
+                if index.manual_bookends:
+                    console_frame = gamestate_frame
+            elif command == EventType.FRAME_BOOKEND.value:
+                if gamestate_frame > console_frame:
+                    console_frame = gamestate_frame
+                    report()
+                    segment_start = offset + size
+                    gamestate_frame = -10000
+            elif command == EventType.PAYLOADS.value:
+                num_commands = (size - 2) // 3
+                for cursor in range(offset + 0x2, offset + 0x2 + (num_commands * 3), 3):
+                    index.eventsize[contents[cursor]] = (
+                        unpack_from(">H", contents, cursor + 0x1)[0] + 1
+                    )
+            elif command == EventType.GAME_START.value:
+                index.slp_version = "%d.%d.%d" % tuple(
+                    contents[offset + 1 : offset + 4]
+                )
+                index.stage = unpack_from(">H", contents, offset + 0x13)[0]
+                index.game_start_offset = offset
+                index.game_start_end = offset + size
+                index.manual_bookends = allow_old_version and contents[offset + 1] < 3
+                console_frame = -10000
+                segment_start = offset + size
+            elif command == EventType.GAME_END.value:
+                if index.manual_bookends:
+                    report()
+                    segment_start = offset + size
+                    gamestate_frame = -10000
+
+        index.allow_old_version = allow_old_version
+        self._frame_index = index
+        if self._index_cache is not None:
+            self._index_cache.store(self._path, index, self.metadata)
+        return index
 
-    def _is_new_frame(self, event_bytes):
+    def seek(self, offset):
+        """Continue dispatching events from the given offset in the raw stream
+
+        Args:
+            offset (int): Offset of an event, such as one from frame_index()
+        """
+        self._index = offset
+        self._finished = False
+        # The event sizes might not have been read yet, if jumping ahead
+        if self._frame_index is not None:
+            self.eventsize = list(self._frame_index.eventsize)
+        # For old files, carry on from this frame without reporting a new one
+        self._frame = -9999
+        if self._contents[offset] in (
+            EventType.POST_FRAME.value,
+            EventType.PRE_FRAME.value,
+        ):
+            self._frame = unpack_from(">i", self._contents, offset + 0x1)[0]
+
+    def _is_new_frame(self, index):
         """Introspect the bytes of the event to see if it represents a new frame
 
         This is for supporting older SLP files that don't have frame bookends
         """
-        if EventType(event_bytes[0]) in [EventType.POST_FRAME, EventType.PRE_FRAME]:
-            frame = np.ndarray((1,), ">i", event_bytes, 0x1)[0]
+        if self._contents[index] in (
+            EventType.POST_FRAME.value,
+            EventType.PRE_FRAME.value,
+        ):
+            frame = unpack_from(">i", self._contents, index + 0x1)[0]
             if frame > self._frame:
                 self._frame = frame
                 return True
             self._frame = frame
         return False
 
-    def dispatch(self, dummy):
+    def _available(self, count, polling_mode):
+        """Make sure that `count` bytes past the current index can be read
+
+        Only ever waits when following a file that's still being written.
+        """
+        if self._index + count <= len(self._contents):
+            return True
+        if not self._following or self._finished:
+            return False
+
+        waited_since = time.time()
+        while True:
+            chunk = self._file.read(0x10000)
+            if chunk:
+                self._append(chunk)
+                if self._index + count <= len(self._contents):
+                    return True
+                waited_since = time.time()
+                continue
+            if self._check_finalized():
+                return self._index + count <= len(self._contents)
+            if polling_mode:
+                return False
+            if (
+                self._follow_timeout is not None
+                and time.time() - waited_since > self._follow_timeout
+            ):
+                self._finished = True
+                return False
+            time.sleep(0.002)
+
+    def _append(self, chunk):
+        """Add newly written bytes onto the end of the buffer of a followed file
+
+        The buffer is rebuilt as new immutable bytes, rather than grown in place, so that
+        views of earlier events handed out by dispatch() stay valid. Events that have
+        already been dispatched are dropped from it.
+        """
+        self._buffer_offset += self._index
+        self._contents = memoryview(bytes(self._contents[self._index :]) + chunk)
+        self._index = 0
+
+    def _check_finalized(self):
+        """See if Dolphin has finished writing the file we're following
+
+        When the game is over, Dolphin writes the metadata and fills in the length of the
+        raw event stream. After that, the stream has a known end.
+        """
+        position = self._file.tell()
+        self._file.seek(0)
+        location = parse_header(self._file.read(0x10))
+        self._file.seek(position)
+        if location is None or location[1] == 0:
+            return False
+        start, length = location
+        self._metadata_offset = start + length
+        # The last events may have been written since we last looked. Then anything read
+        #   past the end of the event stream is metadata
+        self._append(
+            self._file.read(
+                max(
+                    0, self._metadata_offset - self._buffer_offset - len(self._contents)
+                )
+            )
+        )
+        self._contents = self._contents[: self._metadata_offset - self._buffer_offset]
+        self._finished = True
+        return True
+
+    def dispatch(self, polling_mode):
         """Read a single game event off the buffer"""
-        if self._index >= len(self._contents):
+        if not self._available(1, polling_mode):
             return None
+        command = self._contents[self._index]
 
-        if EventType(self._contents[self._index]) == EventType.PAYLOADS:
-            cursor = 0x2
+        if command == EventType.PAYLOADS.value:
+            if not self._available(2, polling_mode):
+                return None
             payload_size = self._contents[self._index + 1]
+            if not self._available(payload_size + 1, polling_mode):
+                return None
+            cursor = self._index + 0x2
             num_commands = (payload_size - 1) // 3
-            for i in range(0, num_commands):
-                command = np.ndarray((1,), ">B", self._contents, cursor)[0]
-                command_len = np.ndarray((1,), ">H", self._contents, cursor + 0x1)[0]
-                self.eventsize[command] = command_len + 1
+            for _ in range(num_commands):
+                self.eventsize[self._contents[cursor]] = (
+                    unpack_from(">H", self._contents, cursor + 0x1)[0] + 1
+                )
                 cursor += 3
+            event_size = payload_size + 1
+        else:
+            event_size = self.eventsize[command]
+            # An event we were never told the size of. The rest of the file is garbage
+            if event_size == 0:
+                self._finished = True
+                return None
+            if not self._available(event_size, polling_mode):
+                return None
 
-            wrapper = dict()
-            wrapper["type"] = "game_event"
-            wrapper["payload"] = self._contents[
-                self._index : self._index + payload_size + 1
-            ]
-            self._index += payload_size + 1
-            return wrapper
-
-        event_size = self.eventsize[self._contents[self._index]]
-
-        # Check to see if a new frame has happened for an old file type
-        if self._is_new_frame(self._contents[self._index : self._index + event_size]):
-            wrapper = dict()
-            wrapper["type"] = "frame_end"
-            wrapper["payload"] = b""
-            return wrapper
+            # Check to see if a new frame has happened for an old file type
+            if self._is_new_frame(self._index):
+                wrapper = dict()
+                wrapper["type"] = "frame_end"
+                wrapper["payload"] = b""
+                return wrapper
 
         wrapper = dict()
         wrapper["type"] = "game_event"
+        # A view into the buffer, rather than a copy of the event
         wrapper["payload"] = self._contents[self._index : self._index + event_size]
         self._index += event_size
 
         return wrapper
 
     def connect(self):
-        with open(self._path, mode="rb") as file:
-            full = None
-            try:
-                full = ubjson.loadb(file.read())
-            except ubjson.decoder.DecoderException:
-                return False
-            # This is annoying and sometimes happens when there's an error parsing
-            if not isinstance(full, dict):
-                return False
-            if "raw" not in full:
+        try:
+            self._file = open(self._path, mode="rb")
+        except OSError:
+            return False
+
+        header = self._file.read(0x10)
+        if self._follow:
+            # Dolphin may not have gotten around to writing the header yet
+            waited_since = time.time()
+            while len(header) < 0x10 and (
+                self._follow_timeout is None
+                or time.time() - waited_since < self._follow_timeout
+            ):
+                time.sleep(0.002)
+                header += self._file.read(0x10 - len(header))
+
+        location = parse_header(header)
+        if location is None:
+            self.shutdown()
+            return False
+        start, length = location
+
+        if length == 0:
+            # Dolphin only fills in the length of the event stream once the game is over
+            if not self._follow:
+                self.shutdown()
                 return False
-            raw = full["raw"]
-            self._contents = raw
-            try:
-                self.playedOn = full["metadata"]["playedOn"]
-            except KeyError:
-                pass
-            try:
-                self.timestamp = full["metadata"]["startAt"]
-            except KeyError:
-                pass
-            try:
-                self.consoleNick = full["metadata"]["consoleNick"]
-            except KeyError:
-                pass
-            try:
-                self.players = full["metadata"]["players"]
-            except KeyError:
-                pass
-            try:
-                self.lastFrame = full["metadata"]["lastFrame"]
-            except KeyError:
-                pass
+            self._following = True
+            self._contents = memoryview(header[start:])
+            self._buffer_offset = start
             return True
+
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.shutdown()
+            return False
+        if start + length > len(self._mmap):
+            self.shutdown()
+            return False
+        self._contents = memoryview(self._mmap)[start : start + length]
+        self._metadata_offset = start + length
+        return True
@@ -21,4 +21,7 @@ setup(
     classifiers=[],
     license="LGPLv3",
     include_package_data=True,
+    entry_points={
+        "console_scripts": ["melee-corpus=melee.corpus:main"],
+    },
 )
@@ -1,7 +1,21 @@
 #!/usr/bin/python3
+import asyncio
+import base64
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
+import enet
+import numpy as np
+
 import melee
+import melee.env
+import melee.sharedframe
 
 
 class SLPFile(unittest.TestCase):
@@ -62,6 +76,615 @@ class SLPFile(unittest.TestCase):
                 self.assertEqual(gamestate.players[2].percent, 25)
                 self.assertEqual(gamestate.players[3].percent, 0)
 
+    def test_read_columns(self):
+        """
+        Bulk-read an SLP file and check it matches Console frame by frame
+        """
+        columns = melee.replay.read_columns("test_artifacts/test_game_1.slp")
+        self.assertEqual(columns.slp_version, "3.6.1")
+        self.assertEqual(len(columns.frames), 1038)
+
+        console = melee.Console(
+            system="file",
+            allow_old_version=False,
+            path="test_artifacts/test_game_1.slp",
+        )
+        self.assertTrue(console.connect())
+        row = 0
+        while True:
+            gamestate = console.step()
+            if gamestate is None:
+                break
+            self.assertEqual(columns.frames[row], gamestate.frame)
+            for port, player in gamestate.players.items():
+                column = columns.players[port][row]
+                self.assertEqual(column["frame"], gamestate.frame)
+                self.assertEqual(column["action"], player.action.value)
+                self.assertEqual(column["action_frame"], player.action_frame)
+                self.assertEqual(column["percent"], player.percent)
+                self.assertEqual(column["x"], player.position.x)
+                self.assertEqual(
+                    column["invulnerability_left"], player.invulnerability_left
+                )
+                self.assertEqual(column["moonwalkwarning"], player.moonwalkwarning)
+                self.assertEqual(column["off_stage"], player.off_stage)
+            row += 1
+
+    def test_corpus(self):
+        """
+        Ingest the test artifacts into shards, skipping over the corrupt files
+        """
+        paths = melee.corpus.find_replays("test_artifacts")
+        with tempfile.TemporaryDirectory() as output:
+            manifest = melee.corpus.ingest(
+                paths,
+                output,
+                workers=2,
+                shard_size=3000,
+                allow_old_version=True,
+                verbose=False,
+            )
+            self.assertEqual(len(manifest["failures"]), 3)
+            self.assertEqual(len(manifest["games"]), 2)
+            self.assertEqual(
+                [shard["rows"] for shard in manifest["shards"]][:-1], [3000] * 3
+            )
+
+            with open(os.path.join(output, "manifest.json")) as manifestfile:
+                self.assertEqual(json.load(manifestfile)["rows"], manifest["rows"])
+
+            rows = np.concatenate(
+                [
+                    np.load(os.path.join(output, shard["file"]), mmap_mode="r")
+                    for shard in manifest["shards"]
+                ]
+            )
+            for game in manifest["games"]:
+                start = game["first_row"]
+                chunk = rows[start : start + game["rows"]]
+                self.assertTrue(np.all(chunk["game"] == game["game"]))
+                self.assertEqual(len(chunk), game["frames"] * 2)
+
+    def test_gamestate_pool(self):
+        """
+        Recycle GameState objects, and make sure it gives the same results
+        """
+        fresh = melee.Console(system="file", path="test_artifacts/test_game_1.slp")
+        pooled = melee.Console(
+            system="file", path="test_artifacts/test_game_1.slp", gamestate_pool_size=2
+        )
+        self.assertTrue(fresh.connect())
+        self.assertTrue(pooled.connect())
+        gamestates = []
+        while True:
+            expected, gamestate = fresh.step(), pooled.step()
+            if expected is None:
+                self.assertIsNone(gamestate)
+                break
+            gamestates.append(gamestate)
+            self.assertEqual(gamestate.frame, expected.frame)
+            self.assertEqual(len(gamestate.projectiles), len(expected.projectiles))
+            for port, player in gamestate.players.items():
+                self.assertEqual(player.action, expected.players[port].action)
+                self.assertEqual(player.position, expected.players[port].position)
+                self.assertEqual(
+                    player.controller_state.button,
+                    expected.players[port].controller_state.button,
+                )
+                self.assertEqual(
+                    player.invulnerability_left,
+                    expected.players[port].invulnerability_left,
+                )
+                self.assertEqual(
+                    player.moonwalkwarning, expected.players[port].moonwalkwarning
+                )
+        # Only two GameStates ever got made
+        self.assertEqual(len(set(map(id, gamestates))), 2)
+
+        with self.assertRaises(ValueError):
+            melee.Console(system="file", gamestate_pool_size=1)
+
+    def test_history(self):
+        """
+        Keep a rolling history of frames, and look back over it
+        """
+        console = melee.Console(
+            system="file", path="test_artifacts/test_game_1.slp", history_size=30
+        )
+        self.assertTrue(console.connect())
+        positions = []
+        while True:
+            gamestate = console.step()
+            if gamestate is None:
+                break
+            positions.append(
+                [gamestate.players[1].position.x, gamestate.players[1].position.y]
+            )
+            if gamestate.frame == 0:
+                self.assertEqual(list(console.history.frames(3)), [-2, -1, 0])
+
+        history = console.history
+        self.assertEqual(len(history), 30)
+        self.assertEqual(list(history.frames()), list(range(885, 915)))
+        self.assertEqual(history.positions(1, last=10).tolist(), positions[-10:])
+        self.assertEqual(history.window(1)["frame"].tolist(), list(range(885, 915)))
+        velocities = history.velocities(1, last=4)
+        self.assertEqual(velocities.shape, (4, 2))
+        self.assertAlmostEqual(
+            velocities[-1][0], positions[-1][0] - positions[-2][0], places=5
+        )
+
+    def test_seek(self):
+        """
+        Jump straight to frames of an SLP file, and compare to stepping through it
+        """
+        console = melee.Console(system="file", path="test_artifacts/test_game_1.slp")
+        self.assertTrue(console.connect())
+        stepped = {}
+        while True:
+            gamestate = console.step()
+            if gamestate is None:
+                break
+            stepped[gamestate.frame] = gamestate
+
+        console = melee.Console(system="file", path="test_artifacts/test_game_1.slp")
+        self.assertTrue(console.connect())
+        for frame in [800, -123, 914, 37]:
+            gamestate = console.state_at(frame)
+            self.assertEqual(gamestate.frame, frame)
+            for port, player in gamestate.players.items():
+                expected = stepped[frame].players[port]
+                self.assertEqual(player.action, expected.action)
+                self.assertEqual(player.position.x, expected.position.x)
+                self.assertEqual(player.percent, expected.percent)
+                self.assertEqual(
+                    player.invulnerability_left, expected.invulnerability_left
+                )
+                self.assertEqual(player.moonwalkwarning, expected.moonwalkwarning)
+        # Stepping carries on from wherever we jumped to
+        self.assertEqual(console.step().frame, 38)
+
+        with self.assertRaises(ValueError):
+            console.seek(100000)
+
+    def test_index_cache(self):
+        """
+        Save frame indexes to disk and reuse them, until the file changes
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.slp")
+            shutil.copy("test_artifacts/test_game_1.slp", path)
+            cache = melee.indexcache.FrameIndexCache(os.path.join(directory, "cache"))
+
+            def open_replay():
+                console = melee.Console(system="file", path=path, index_cache=cache)
+                self.assertTrue(console.connect())
+                gamestate = console.state_at(500)
+                self.assertEqual(gamestate.frame, 500)
+                self.assertEqual(gamestate.playedOn, "dolphin")
+                return console._slippstream.frame_index()
+
+            built = open_replay()
+            self.assertEqual((cache.hits, cache.misses), (0, 1))
+            loaded = open_replay()
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(loaded.frames, built.frames)
+            self.assertEqual(loaded.offsets, built.offsets)
+            self.assertEqual(loaded.characters, built.characters)
+            self.assertEqual(loaded.slp_version, "3.6.1")
+
+            # A modified file gets a new index
+            os.utime(path, ns=(0, 0))
+            open_replay()
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+            cache.max_bytes = 0
+            cache.evict()
+            self.assertEqual(os.listdir(cache.directory), [])
+
+    def test_follow_file(self):
+        """
+        Read an SLP file while it's still being written, like Dolphin does
+        """
+        streamer = melee.slpfilestreamer.SLPFileStreamer(
+            "test_artifacts/test_game_1.slp"
+        )
+        self.assertTrue(streamer.connect())
+        raw = bytes(streamer.raw)
+        streamer.shutdown()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "live.slp")
+            with open(path, "wb") as livefile:
+                # Dolphin leaves the length of the raw element as 0 until the game ends
+                livefile.write(b"{U\x03raw[$U#l\x00\x00\x00\x00")
+
+            def write_game():
+                for start in range(0, len(raw), 0x8000):
+                    time.sleep(0.01)
+                    with open(path, "ab") as livefile:
+                        livefile.write(raw[start : start + 0x8000])
+                # Once the game is over, the metadata goes on the end and the length is filled in
+                with open(path, "r+b") as livefile:
+                    livefile.seek(0, os.SEEK_END)
+                    livefile.write(b"U\x08metadata{U\x08playedOnSU\x07dolphin}}")
+                    livefile.seek(11)
+                    livefile.write(len(raw).to_bytes(4, "big"))
+
+            console = melee.Console(system="file", path=path)
+            self.assertFalse(console.connect())
+
+            writer = threading.Thread(target=write_game)
+            writer.start()
+            console = melee.Console(system="file", path=path, follow_file=True)
+            self.assertTrue(console.connect())
+            frames = 0
+            while console.step() is not None:
+                frames += 1
+            writer.join()
+            console.stop()
+            self.assertEqual(frames, 1038)
+
+    def test_async_console(self):
+        """Run several consoles off of one thread, against a stand-in Slippi server"""
+        streamer = melee.slpfilestreamer.SLPFileStreamer(
+            "test_artifacts/test_game_1.slp"
+        )
+        self.assertTrue(streamer.connect())
+        raw = bytes(streamer.raw)
+        messages, start = [], 0
+        for command, offset, size in streamer.events():
+            if command == melee.slpfilestreamer.EventType.FRAME_BOOKEND.value:
+                message = {
+                    "type": "game_event",
+                    "payload": base64.b64encode(raw[start : offset + size]).decode(),
+                }
+                messages.append(json.dumps(message).encode())
+                start = offset + size
+
+        # Dolphin sends a message per frame to each spectator, once it asks to connect
+        server = enet.Host(enet.Address(b"127.0.0.1", 0), 4, 0, 0)
+        serving = threading.Event()
+        serving.set()
+
+        def serve():
+            while serving.is_set():
+                event = server.service(5)
+                if event.type == enet.EVENT_TYPE_RECEIVE:
+                    for message in messages:
+                        event.peer.send(
+                            0, enet.Packet(message, enet.PACKET_FLAG_RELIABLE)
+                        )
+
+        async def spectate(console):
+            self.assertTrue(await console.connect())
+            frames = []
+            # Rolled back frames are sent again, but only come out of step() once
+            while len(frames) < 1038:
+                gamestate = await console.step()
+                frames.append(gamestate.frame)
+            return frames
+
+        async def spectate_all(consoles):
+            return await asyncio.gather(*(spectate(console) for console in consoles))
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        try:
+            consoles = [
+                melee.AsyncConsole(
+                    system="dolphin",
+                    tmp_home_directory=False,
+                    slippi_port=server.address.port,
+                )
+                for _ in range(3)
+            ]
+            results = asyncio.run(spectate_all(consoles))
+        finally:
+            serving.clear()
+            thread.join()
+
+        self.assertEqual(len(results), 3)
+        for frames in results:
+            self.assertEqual(frames, list(range(-123, 915)))
+
+    def test_console_pool(self):
+        """Step several consoles together, in lock-step and as they're ready"""
+
+        def make_consoles():
+            return [
+                melee.Console(system="file", path="test_artifacts/test_game_1.slp"),
+                melee.Console(
+                    system="file",
+                    allow_old_version=True,
+                    path="test_artifacts/test_game_2.slp",
+                ),
+            ]
+
+        pool = melee.consolepool.ConsolePool(make_consoles())
+        self.assertEqual(pool.connect(), [True, True])
+        frames = [[], []]
+        while True:
+            gamestates = pool.step()
+            if gamestates == [None, None]:
+                break
+            observations = pool.observe(gamestates)
+            self.assertEqual(observations.shape, (2, 4))
+            for index, gamestate in enumerate(gamestates):
+                if gamestate is not None:
+                    frames[index].append(gamestate.frame)
+                    for port in range(1, 5):
+                        if port in gamestate.players:
+                            player = gamestate.players[port]
+                            row = observations[index, port - 1]
+                            self.assertEqual(row["frame"], gamestate.frame)
+                            self.assertEqual(row["stock"], player.stock)
+                            self.assertEqual(row["x"], player.position.x)
+                        else:
+                            self.assertEqual(
+                                observations[index, port - 1]["frame"], -10000
+                            )
+        pool.stop()
+        self.assertEqual(len(frames[0]), 1038)
+        self.assertEqual(len(frames[1]), 3839)
+
+        # A console whose step() raises only raises once
+        class FlakyConsole:
+            def __init__(self):
+                self.steps = 0
+
+            def step(self):
+                self.steps += 1
+                if self.steps == 1:
+                    raise ConnectionError("lost Dolphin")
+                return self.steps
+
+        pool = melee.consolepool.ConsolePool([FlakyConsole()])
+        with self.assertRaises(ConnectionError):
+            pool.step()
+        self.assertEqual(pool.step(), [2])
+        self.assertEqual(pool.step_ready(), {0: 3})
+        pool._executor.shutdown()
+
+        pool = melee.consolepool.ConsolePool(make_consoles())
+        pool.connect()
+        ready_frames = [[], []]
+        finished = set()
+        while len(finished) < 2:
+            for index, gamestate in pool.step_ready().items():
+                if gamestate is None:
+                    finished.add(index)
+                elif index not in finished:
+                    ready_frames[index].append(gamestate.frame)
+        pool.stop()
+        self.assertEqual(ready_frames, frames)
+
+    def test_vec_env(self):
+        """Step environments in subprocesses, through shared memory"""
+        env_kwargs = [
+            {"console_kwargs": {"system": "file", "path": path}}
+            for path in [
+                "test_artifacts/test_game_1.slp",
+                "test_artifacts/test_game_1.slp",
+            ]
+        ]
+        envs = melee.env.VecMeleeEnv(env_kwargs)
+        try:
+            observations = envs.reset()
+            self.assertEqual(observations.shape, (2, melee.env.PORTS))
+            self.assertEqual(list(observations[:, 0]["frame"]), [-123, -123])
+            actions = np.zeros(2, dtype=melee.env.ACTION_DTYPE)
+            actions[:] = melee.env.neutral_action()
+            frames, rewards = [], 0
+            while True:
+                observations, reward, done, infos = envs.step(actions)
+                rewards += reward
+                if done[0]:
+                    break
+                frames.append(observations[0, 0]["frame"])
+        finally:
+            envs.close()
+
+        self.assertEqual(frames, list(range(-122, 915)))
+        self.assertTrue(done[1])
+        self.assertEqual(rewards[0], rewards[1])
+        self.assertEqual(infos[0]["final_observation"][0]["frame"], 914)
+        # Started over, at the beginning of the next game
+        self.assertEqual(observations[0, 0]["frame"], -123)
+
+    def test_shared_frame(self):
+        """Console writes each frame into shared memory, for a reader attached by name"""
+        shared = melee.sharedframe.SharedFrame()
+        reader = melee.sharedframe.SharedFrame(shared.name)
+        try:
+            self.assertEqual(reader.frames_written, 0)
+            self.assertIsNone(reader.wait(0, timeout=0.01))
+            console = melee.Console(
+                system="file",
+                path="test_artifacts/test_game_1.slp",
+                shared_frame=shared,
+            )
+            console.connect()
+            written = 0
+            while True:
+                gamestate = console.step()
+                if gamestate is None:
+                    break
+                written, record = reader.wait(written, timeout=1)
+                self.assertEqual(record["frame"], gamestate.frame)
+                self.assertEqual(record["stage"], gamestate.stage.value)
+                for port in range(1, 5):
+                    row = record["players"][port - 1]
+                    if port in gamestate.players:
+                        player = gamestate.players[port]
+                        self.assertEqual(row["percent"], player.percent)
+                        self.assertEqual(row["action"], player.action.value)
+                    else:
+                        self.assertEqual(row["frame"], -10000)
+            self.assertEqual(written, 1038)
+        finally:
+            reader.close()
+            shared.close()
+
+    def test_home_template(self):
+        """Dolphin homes made from a template share read-only files, but not configs"""
+        with tempfile.TemporaryDirectory() as directory:
+            home = os.path.join(directory, "User")
+            for name in ["Load/texture.png", "Config/Dolphin.ini", "Cache/shader.bin"]:
+                os.makedirs(os.path.dirname(os.path.join(home, name)), exist_ok=True)
+                with open(os.path.join(home, name), "w") as homefile:
+                    homefile.write(name)
+            template = melee.launcher.HomeTemplate(home)
+            try:
+                console = melee.Console(dolphin_home_path=home, home_template=template)
+                instance = console.dolphin_home_path
+                for name, shared in [
+                    ("Load/texture.png", True),
+                    ("Config/Dolphin.ini", False),
+                ]:
+                    with open(os.path.join(instance, name)) as homefile:
+                        self.assertEqual(homefile.read(), name)
+                    self.assertEqual(
+                        os.path.samefile(
+                            os.path.join(instance, name),
+                            os.path.join(template.path, name),
+                        ),
+                        shared,
+                    )
+                # Caches start out empty, for Dolphin to rebuild
+                self.assertEqual(os.listdir(os.path.join(instance, "Cache")), [])
+                console.stop()
+                self.assertFalse(os.path.exists(instance))
+                self.assertTrue(
+                    os.path.exists(os.path.join(template.path, "Load/texture.png"))
+                )
+            finally:
+                template.cleanup()
+            self.assertFalse(os.path.exists(template.path))
+
+    def test_home_template_isolation(self):
+        """Writing into one Dolphin home leaves the template and the other homes alone"""
+        with tempfile.TemporaryDirectory() as directory:
+            home = os.path.join(directory, "User")
+            for name in ["GC/USA/Card A/save.gci", "Wii/shared2/sys.bin"]:
+                os.makedirs(os.path.dirname(os.path.join(home, name)), exist_ok=True)
+                with open(os.path.join(home, name), "w") as homefile:
+                    homefile.write("original")
+            template = melee.launcher.HomeTemplate(home, os.path.join(directory, "T"))
+            first = os.path.join(directory, "first")
+            second = os.path.join(directory, "second")
+            template.make_home(first)
+            template.make_home(second)
+            for name in ["GC/USA/Card A/save.gci", "Wii/shared2/sys.bin"]:
+                with open(os.path.join(first, name), "w") as homefile:
+                    homefile.write("changed")
+                for path in [template.path, second]:
+                    with open(os.path.join(path, name)) as homefile:
+                        self.assertEqual(homefile.read(), "original")
+
+    def test_supervisor(self):
+        """A supervisor restarts consoles that crash or stop sending frames"""
+
+        class FakeConsole:
+            def __init__(self):
+                self.frames = 3
+                self.running = True
+                self.restarts = 0
+
+            def step(self):
+                if self.running and self.frames > 0:
+                    self.frames -= 1
+                    return melee.GameState()
+                return None
+
+            def is_running(self):
+                return self.running
+
+            def restart(self):
+                self.restarts += 1
+                self.frames, self.running = 3, True
+                return True
+
+        healthy, stalled, crashed = FakeConsole(), FakeConsole(), FakeConsole()
+        supervisor = melee.launcher.Supervisor(
+            [healthy, stalled, crashed], stall_timeout=0.05
+        )
+        crashed.running = False
+        for _ in range(3):
+            for index in range(3):
+                supervisor.step(index)
+        self.assertEqual((healthy.restarts, stalled.restarts), (0, 0))
+        self.assertEqual(crashed.restarts, 1)
+
+        # Out of frames, but still running: a stall once the timeout passes
+        healthy.frames = 100
+        self.assertIsNone(supervisor.step(1))
+        time.sleep(0.1)
+        self.assertIsNotNone(supervisor.step(0))
+        self.assertIsNone(supervisor.step(1))
+        self.assertEqual(stalled.restarts, 1)
+        self.assertEqual(supervisor.check(), [2])
+
+        metrics = supervisor.metrics()
+        self.assertEqual(metrics["frames"], 4 + 3 + 2)
+        self.assertEqual(metrics["restarts"], 3)
+        self.assertEqual((metrics["stalls"], metrics["crashes"]), (2, 1))
+        self.assertEqual([i["restarts"] for i in metrics["instances"]], [0, 1, 2])
+
+    def test_supervisor_stalled_rate(self):
+        """A console that stops sending frames stops counting toward the fleet's rate"""
+
+        class FakeConsole:
+            frames = 0
+
+            def step(self):
+                if self.frames > 0:
+                    self.frames -= 1
+                    return melee.GameState()
+                return None
+
+            def is_running(self):
+                return True
+
+            def restart(self):
+                return True
+
+        console = FakeConsole()
+        supervisor = melee.launcher.Supervisor([console], stall_timeout=60)
+        console.frames = 24
+        for _ in range(24):
+            supervisor.step(0)
+            time.sleep(0.05)
+        self.assertGreater(supervisor.metrics()["frames_per_second"], 0)
+
+        time.sleep(1.1)
+        self.assertIsNone(supervisor.step(0))
+        self.assertEqual(supervisor.metrics()["frames_per_second"], 0)
+        self.assertGreater(supervisor.stats[0].frames_per_second, 0)
+
+        # A restart starts measuring the rate over again
+        supervisor.restart(0)
+        self.assertEqual(supervisor.stats[0].frames_per_second, 0)
+
+    def test_scan_metadata(self):
+        """
+        Summarize replays from just their GAME_START and metadata
+        """
+        paths = melee.corpus.find_replays("test_artifacts")
+        records = melee.replay.scan_metadata(paths, workers=2)
+        self.assertEqual([record.path for record in records], paths)
+        self.assertEqual(sum(record.error == "" for record in records), 2)
+
+        record = records[paths.index("test_artifacts/test_game_1.slp")]
+        self.assertEqual(record.slp_version, "3.6.1")
+        self.assertEqual(record.stage, melee.Stage.YOSHIS_STORY)
+        self.assertEqual(
+            record.characters, {1: melee.Character.LUIGI, 2: melee.Character.LUIGI}
+        )
+        self.assertEqual(record.connect_codes, {1: "ALT#597", 2: "RUG#810"})
+        self.assertEqual(record.lastFrame, 914)
+        self.assertEqual(record.playedOn, "dolphin")
+
     def test_framedata(self):
         """
         Test that frame and stage data retreive correctly
@@ -72,6 +695,166 @@ class SLPFile(unittest.TestCase):
             framedata.is_attack(melee.Character.FALCO, melee.Action.STANDING)
         )
 
+    def test_framedata_store(self):
+        """Frame data is compiled from its CSV once, then memory mapped"""
+        columns = list(melee.framedata.FRAMEDATA_DTYPE.names)
+        falco, dair = melee.Character.FALCO.value, melee.Action.DAIR.value
+        hitbox_frames = [4, 5, 8, 9, 10]
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "framedata.csv")
+            with open(csv_path, "w") as csvfile:
+                csvfile.write(",".join(columns) + "\n")
+                for frame in [3, 1, 2] + list(range(4, 13)):
+                    row = dict.fromkeys(columns, "0")
+                    row.update(character=falco, action=dair, frame=frame)
+                    for name in ["iasa", "facing_changed", "projectile"]:
+                        row[name] = str(name == "iasa" and frame >= 11)
+                    for hitbox in range(1, 5):
+                        status = hitbox == 2 and frame in hitbox_frames
+                        row["hitbox_%d_status" % hitbox] = str(status)
+                    row["locomotion_x"] = "1.5"
+                    csvfile.write(",".join(str(row[name]) for name in columns) + "\n")
+
+            store = melee.framedata.load_framedata(csv_path, directory)
+            self.assertIsInstance(store, np.memmap)
+            self.assertEqual(list(store["frame"]), list(range(1, 13)))
+            # Compiled once, then loaded from the cache
+            self.assertEqual(len(os.listdir(directory)), 2)
+            melee.framedata.load_framedata(csv_path, directory)
+            self.assertEqual(len(os.listdir(directory)), 2)
+            # Until the CSV changes
+            stat = os.stat(csv_path)
+            os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            melee.framedata.load_framedata(csv_path, directory)
+            self.assertEqual(len(os.listdir(directory)), 3)
+
+            framedata = melee.FrameData(store=store)
+            falco, dair = melee.Character.FALCO, melee.Action.DAIR
+            self.assertTrue(framedata.is_attack(falco, dair))
+            self.assertFalse(framedata.is_attack(falco, melee.Action.STANDING))
+            self.assertEqual(framedata.first_hitbox_frame(falco, dair), 4)
+            self.assertEqual(framedata.last_hitbox_frame(falco, dair), 10)
+            self.assertEqual(framedata.hitbox_count(falco, dair), 2)
+            self.assertEqual(framedata.iasa(falco, dair), 11)
+            self.assertEqual(framedata.frame_count(falco, dair), 12)
+            self.assertEqual(len(framedata.summary), 1)
+            self.assertEqual(framedata.summary[0]["stop"], 12)
+            self.assertEqual(
+                framedata.attack_state(falco, dair, 6), melee.AttackState.ATTACKING
+            )
+            self.assertIsNone(framedata._getframe(falco, dair, 13))
+            self.assertEqual(framedata._getframe(falco, dair, 5)["frame"], 5)
+            self.assertTrue(framedata.framedata[falco][dair][9]["hitbox_2_status"])
+
+            # Each frame moves the attacker 1.5 forward, so a far away defender is hit later
+            attacker, defender = melee.PlayerState(), melee.PlayerState()
+            attacker.character, defender.character = falco, melee.Character.FOX
+            attacker.action, attacker.on_ground = dair, True
+            stage = melee.Stage.FINAL_DESTINATION
+            # Hurtboxes are centered one size (11) up, so put the defender's level with us
+            defender.position.y = defender.y = -11
+            for defender_x, hitframe in [(0, 4), (20, 8), (100, 0)]:
+                defender.position.x = defender_x
+                self.assertEqual(
+                    framedata.in_range_batch(attacker, defender, stage),
+                    {dair: hitframe},
+                )
+                self.assertEqual(
+                    framedata.in_range(attacker, defender, stage), hitframe
+                )
+
+    def test_classify_actions(self):
+        """Classifying a whole replay's actions at once matches asking about each one"""
+        framedata = melee.FrameData(
+            store=np.zeros(0, dtype=melee.framedata.FRAMEDATA_DTYPE)
+        )
+        columns = melee.replay.read_columns("test_artifacts/test_game_1.slp")
+        player = columns.players[1]
+        for kind in ["grab", "roll", "bmove", "shield"]:
+            classified = melee.framedata.classify_actions(
+                kind, player["character"], player["action"]
+            )
+            expected = []
+            for character, action in zip(player["character"], player["action"]):
+                character, action = melee.Character(character), melee.Action(action)
+                if kind == "shield":
+                    expected.append(framedata.is_shield(action))
+                else:
+                    expected.append(getattr(framedata, "is_" + kind)(character, action))
+            self.assertEqual(classified.tolist(), expected)
+
+        # Command grabs depend on the character. Unknown actions are never anything
+        self.assertEqual(
+            melee.framedata.classify_actions(
+                "grab",
+                [melee.Character.FOX.value, melee.Character.BOWSER.value],
+                melee.Action.NEUTRAL_B_ATTACKING_AIR.value,
+            ).tolist(),
+            [False, True],
+        )
+        self.assertFalse(
+            melee.framedata.classify_actions(
+                "bmove", 0, melee.Action.UNKNOWN_ANIMATION.value
+            )
+        )
+        # 386 is past LASER_GUN_PULL, but isn't an Action
+        self.assertFalse(melee.framedata.classify_actions("bmove", 0, 386))
+
+    def test_trajectories(self):
+        """Knockback and slide paths match the frame by frame projections"""
+        framedata = melee.FrameData(
+            store=np.zeros(0, dtype=melee.framedata.FRAMEDATA_DTYPE)
+        )
+        gamestate = melee.GameState()
+        gamestate.stage = melee.Stage.BATTLEFIELD
+        player = melee.PlayerState()
+        player.character = melee.Character.FOX
+        player.position.y = 20
+        player.hitstun_frames_left = 40
+
+        # Off the side, down onto the stage, and up onto the right platform
+        speeds_x, speeds_y = [4.0, -1.0, 2.0], [1.0, -2.5, 3.0]
+        positions, frames = framedata.project_hit_trajectories(
+            player, gamestate, speeds_x, speeds_y
+        )
+        self.assertEqual(positions.shape, (3, 41, 2))
+        self.assertEqual(list(frames), [40, 7, 29])
+        self.assertEqual(list(positions[1:, -1, 1]), [0, 27.20009994506836])
+        for index, (speed_x, speed_y) in enumerate(zip(speeds_x, speeds_y)):
+            player.speed_x_attack, player.speed_y_attack = speed_x, speed_y
+            x, y, frame = framedata.project_hit_location(player, gamestate)
+            self.assertEqual(tuple(positions[index, -1]), (x, y))
+            if frames[index] < 40:
+                self.assertEqual(frame, frames[index])
+
+        # Slides slow to a stop, ending where slide_distance() says
+        path = framedata.slide_path(player, -2.5, 60)
+        self.assertTrue(np.all(np.diff(path) < 0) and len(path) < 60)
+        self.assertAlmostEqual(framedata.slide_distance(player, 2.5, 60), -path[-1])
+        self.assertAlmostEqual(
+            framedata.slide_distance(player, 2.5, 5), -path[4], places=9
+        )
+
+    def test_short_event_payload(self):
+        """Fields past the end of an older, shorter event payload decode as defaults"""
+        event = bytearray(0x30)
+        event[0] = 0x38
+        event[0x5] = 1
+        event[0x21] = 4
+        decoded = dict(
+            zip(
+                melee.framedecoder.POST_FRAME.names,
+                melee.framedecoder.POST_FRAME.unpack_from(
+                    bytes(event) + b"\xff" * 0x50, 0, 0x30
+                ),
+            )
+        )
+        self.assertEqual(decoded["port"], 1)
+        self.assertEqual(decoded["stock"], 4)
+        # jumps_left is at 0x32, past the end of this payload
+        self.assertEqual(decoded["jumps_left"], 1)
+        self.assertEqual(decoded["ecb_right_y"], 0.0)
+
     def test_corrupt_file(self):
         """Load a corrupt SLP file and make sure we don't crash"""
         console = melee.Console(
@@ -95,6 +878,120 @@ class SLPFile(unittest.TestCase):
         )
         self.assertFalse(console.connect())
 
+        with self.assertRaises(melee.replay.InvalidReplay):
+            melee.replay.read_columns("test_artifacts/corrupt_game_1.slp")
+        # An event running off the end of the data is a corrupt file, not an IndexError
+        data = np.zeros(0x40, dtype=np.uint8)
+        with self.assertRaises(melee.replay.InvalidReplay):
+            melee.replay._gather(
+                data, np.array([0, 0x20]), 0x30, melee.framedecoder.POST_FRAME
+            )
+
+    def test_controller_flush(self):
+        """Controller inputs are held back until flush(), then sent in one go"""
+
+        class PipeConsole:
+            system = "dolphin"
+            logger = None
+            controllers = []
+
+            def get_dolphin_pipes_path(self, port):
+                return pipe_path
+
+            def setup_dolphin_controller(self, port, controllertype):
+                pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            pipe_path = os.path.join(directory, "slippibot1")
+            controller = melee.Controller(PipeConsole(), 1)
+            controller.connect()
+            controller.press_button(melee.Button.BUTTON_A)
+            controller.tilt_analog(melee.Button.BUTTON_MAIN, 0, 0.5)
+            controller.press_shoulder(melee.Button.BUTTON_L, 1)
+            with open(pipe_path) as pipe:
+                self.assertEqual(pipe.read(), "")
+            controller.flush()
+            with open(pipe_path) as pipe:
+                self.assertEqual(
+                    pipe.read(), "PRESS A\nSET MAIN 0 0.5\nSET L 1\nFLUSH\n"
+                )
+
+            # Holding the same inputs sends nothing but the FLUSH
+            controller.press_button(melee.Button.BUTTON_A)
+            controller.tilt_analog(melee.Button.BUTTON_MAIN, 0, 0.5)
+            controller.release_button(melee.Button.BUTTON_B)
+            controller.flush()
+            with open(pipe_path) as pipe:
+                self.assertEqual(pipe.read().split("FLUSH\n")[1:], ["RELEASE B\n", ""])
+            controller.disconnect()
+
+            # Unless it's time for a full resync
+            controller = melee.Controller(PipeConsole(), 1, resync_interval=2)
+            controller.connect()
+            controller.press_button(melee.Button.BUTTON_A)
+            controller.flush()
+            controller.flush()
+            controller.flush()
+            with open(pipe_path) as pipe:
+                self.assertEqual(pipe.read(), "PRESS A\nFLUSH\nFLUSH\nPRESS A\nFLUSH\n")
+            controller.disconnect()
+
+    def test_controller_state(self):
+        """ControllerState buttons are a bitmask, but still read and write like a dict"""
+        state = melee.controller.ControllerState()
+        self.assertEqual(len(state.button), 12)
+        self.assertFalse(any(state.button.values()))
+        state.button[melee.Button.BUTTON_A] = True
+        state.button[melee.Button.BUTTON_D_UP] = True
+        self.assertEqual(state.buttons, 0x0108)
+        self.assertTrue(state.button[melee.Button.BUTTON_A])
+
+        copied = copy.copy(state)
+        state.button[melee.Button.BUTTON_A] = False
+        self.assertTrue(copied.button[melee.Button.BUTTON_A])
+        self.assertEqual(
+            [button for button, pressed in copied.button.items() if pressed],
+            [melee.Button.BUTTON_A, melee.Button.BUTTON_D_UP],
+        )
+        with self.assertRaises(AttributeError):
+            state.extra = 1
+
+        state.reset()
+        self.assertEqual(state.buttons, 0)
+
+    def test_serial_poller(self):
+        """TAStm32 polls go out from a background thread, and their acks are tracked"""
+
+        class FakeTAStm32:
+            def __init__(self):
+                self.written = []
+                self.acks = threading.Semaphore(0)
+
+            def write(self, data):
+                self.written.append(bytes(data))
+                self.acks.release()
+
+            def read(self, size):
+                self.acks.acquire()
+                return b"A" if len(self.written) != 2 else b"E"
+
+        tastm32 = FakeTAStm32()
+        poller = melee.controller.SerialPoller(tastm32)
+        state = melee.controller.ControllerState()
+        for frame in range(3):
+            state.button[melee.Button.BUTTON_A] = frame % 2 == 0
+            poller.send(state)
+            while poller.polls + poller.missed_polls <= frame:
+                time.sleep(0.001)
+        poller.stop()
+
+        self.assertEqual(poller.polls, 3)
+        self.assertEqual(poller.missed_polls, 0)
+        self.assertEqual(poller.bad_acks, 1)
+        self.assertEqual(tastm32.written[-1], b"A" + state.toBytes())
+        self.assertEqual(tastm32.written[0][1:3], b"\x01\x80")
+        self.assertGreaterEqual(poller.max_ack_latency, poller.mean_ack_latency)
+
 
 if __name__ == "__main__":
     unittest.main()